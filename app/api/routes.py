@@ -1,70 +1,397 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Dict, List, Optional
+import hashlib
+import json
 import os
-from app.core.processors.json_processor import JsonProcessor
-from app.core.processors.mp4_processor import Mp4Processor
-from app.core.processors.text_processor import TextProcessor
-from app.core.llm_processor import LLMProcessor
+import uuid
+from app.config import settings
+from app.core.cache import make_key
+from app.core.idempotency import IdempotencyConflictError, idempotency, request_fingerprint
+from app.core.jobs import QueueFullError, job_manager
+from app.core.metrics import start_request_timings
+from app.core.executor import run_blocking
+from app.core.pipeline import batch_file_path, get_processor, generate_report, run_batch, stream_report, write_batch_file
+from app.core.report_store import get_report_store
+from app.core.scheduler import scheduler
+from app.core.upload_sessions import IncompleteUploadError, UploadSessionError, upload_sessions
+from app.core.uploads import create_workspace, read_head, remove_workspace, request_workspace, save_upload
 
 router = APIRouter()
 
-# 臨時存儲上傳文件的目錄
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 @router.post("/process")
 async def process_files(
+    response: Response,
     files: List[UploadFile] = File(...),
-    prompt: Optional[str] = Form(None)
+    prompt: Optional[str] = Form(None),
+    use_cache: bool = Form(True),
+    timings: bool = Form(False),
+    idempotency_key: Optional[str] = Header(None, max_length=255)
 ):
     """
-    接收並處理上傳的檔案，支援JSON、MP4和TXT格式
+    接收並處理上傳的檔案，支援JSON、Excel、MP4和TXT格式
+
+    各檔案的處理器在執行緒池中同時執行，全部完成後再交由LLM生成報告。
+    use_cache 設為 false 時略過LLM回應快取；timings 設為 true 時回應另附各階段耗時。
+
+    帶有 Idempotency-Key 標頭（或未帶標頭時檔案內容與提示詞完全相同）的重複請求不會重新執行：
+    同時進行的相同請求共用一次執行的結果，成功的結果在 IDEMPOTENCY_REPLAY_SECONDS 內直接重播；
+    回應標頭 Idempotency-Status 為 executed、coalesced 或 replayed。同一個鍵用於內容不同的請求時返回422。
     """
     if not files:
         raise HTTPException(status_code=400, detail="沒有上傳檔案")
     
-    # 存儲處理結果
-    processed_texts = []
+    request_timings = start_request_timings() if timings else None
+    key_enabled = settings.IDEMPOTENCY_ENABLED and (idempotency_key or settings.IDEMPOTENCY_DERIVE_KEY)
     
-    # 處理每個檔案
-    for file in files:
-        # 保存上傳的檔案
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
+    # 每個請求使用獨立的臨時目錄，結束時（包含發生錯誤時）自動清除
+    with request_workspace() as workspace:
+        # 待處理的 (處理器, 檔案路徑)
+        tasks = []
+        # 依上傳順序的 (檔名, 內容雜湊)，作為冪等請求的指紋
+        digests = []
+        for file in files:
+            # 根據檔案類型選擇處理器，不支援的檔案直接略過
+            processor = get_processor(file.filename, read_head(file))
+            if processor is None:
+                continue
+            
+            # 分塊保存上傳的檔案，需要冪等鍵時一併計算內容雜湊
+            digest = hashlib.sha256() if key_enabled else None
+            file_path = await save_upload(file, workspace, digest=digest)
+            tasks.append((processor, file_path))
+            if digest is not None:
+                digests.append((os.path.basename(file_path), digest.hexdigest()))
         
-        # 根據檔案類型選擇處理器
-        if file.filename.endswith(".json"):
-            processor = JsonProcessor()
-        elif file.filename.endswith(".mp4"):
-            processor = Mp4Processor()
-        elif file.filename.endswith(".txt"):
-            processor = TextProcessor()
+        # 如果沒有成功處理任何檔案
+        if not tasks:
+            raise HTTPException(status_code=400, detail="沒有有效的檔案可處理")
+        
+        # 同時處理所有檔案，再使用LLM處理器生成最終報告
+        if key_enabled:
+            fingerprint = request_fingerprint(digests, prompt, use_cache)
+            key = make_key("idempotency-key", idempotency_key) if idempotency_key else fingerprint
+            try:
+                # 未帶標頭且略過快取時只合併同時進行的請求，不重播先前的結果
+                result, status = await idempotency.run(
+                    key, fingerprint, lambda: generate_report(tasks, prompt, use_cache=use_cache),
+                    replay=bool(idempotency_key) or use_cache
+                )
+            except IdempotencyConflictError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            response.headers["Idempotency-Status"] = status
         else:
-            # 刪除不支援的檔案
-            os.remove(file_path)
-            continue
+            result = await generate_report(tasks, prompt, use_cache=use_cache)
+    
+    if request_timings is not None:
+        return {"result": result, "timings": request_timings.to_dict()}
+    return {"result": result}
+
+def _sse(event: str, data: dict) -> str:
+    """格式化為 server-sent events 訊息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/process/stream")
+async def process_files_stream(
+    files: List[UploadFile] = File(...),
+    prompt: Optional[str] = Form(None),
+    use_cache: bool = Form(True),
+    patient_id: Optional[str] = Form(None)
+):
+    """
+    串流版本的 /process，以 server-sent events 回傳各階段進度與LLM輸出
+
+    事件依序為 uploaded（含保存報告時使用的 request_id）、MP4轉錄完成時的 transcribed、每個檔案的 extracted、
+    輸入過長而先分塊摘要時的 summarized、LLM的 token（原始輸出）與 report（逐行格式化後的報告），
+    最後為 done（與 /process 相同的結果）。提取文本時出錯會先產生 error 事件，再以失敗結果的 done 結束。
+    patient_id 與 request_id 保存於報告索引，可用 /reports 查詢
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="沒有上傳檔案")
+    
+    # 先保存所有檔案，工作目錄在回應結束後刪除
+    workspace = create_workspace()
+    try:
+        tasks = []
+        for file in files:
+            processor = get_processor(file.filename, read_head(file))
+            if processor is None:
+                continue
+            tasks.append((processor, await save_upload(file, workspace)))
+    except Exception:
+        remove_workspace(workspace)
+        raise
+    
+    if not tasks:
+        remove_workspace(workspace)
+        raise HTTPException(status_code=400, detail="沒有有效的檔案可處理")
+    
+    request_id = uuid.uuid4().hex
+    
+    async def events():
+        yield _sse("uploaded", {"files": [os.path.basename(path) for _, path in tasks], "request_id": request_id})
+        async for event in stream_report(tasks, prompt, use_cache, patient_id=patient_id, request_id=request_id):
+            name = event.pop("event")
+            yield _sse(name, event)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(remove_workspace, workspace)
+    )
+
+@router.post("/jobs", status_code=202)
+async def create_job(
+    files: List[UploadFile] = File(...),
+    prompt: Optional[str] = Form(None),
+    use_cache: bool = Form(True)
+):
+    """
+    建立非同步報告任務，立即返回任務ID
+
+    檔案保存後由背景工作者執行提取 → LLM → 保存報告，以 GET /api/jobs/{job_id} 查詢進度
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="沒有上傳檔案")
+    
+    # 任務的工作目錄在任務結束後才由工作者刪除
+    workspace = create_workspace(prefix="job_")
+    try:
+        file_paths = []
+        for file in files:
+            if get_processor(file.filename, read_head(file)) is None:
+                continue
+            file_paths.append(await save_upload(file, workspace))
         
-        # 處理檔案並獲取文本
-        text = processor.process(file_path)
-        processed_texts.append(text)
+        if not file_paths:
+            raise HTTPException(status_code=400, detail="沒有有效的檔案可處理")
         
-        # 處理完畢後刪除檔案
-        os.remove(file_path)
+        job = await job_manager.submit(file_paths, workspace, prompt, use_cache=use_cache)
+    except QueueFullError:
+        remove_workspace(workspace)
+        raise HTTPException(status_code=503, detail="任務佇列已滿，請稍後再試")
+    except Exception:
+        remove_workspace(workspace)
+        raise
+    
+    return {"job_id": job.job_id, "status": job.status}
+
+@router.post("/batch")
+async def process_batch(
+    files: List[UploadFile] = File(...),
+    patient_ids: List[str] = Form(...),
+    prompt: Optional[str] = Form(None),
+    use_cache: bool = Form(True),
+    model_choice: str = Form("OpenAI-4o-mini"),
+    offline: bool = Form(False)
+):
+    """
+    一次處理多位病患的檔案
+
+    patient_ids 與 files 一一對應，指出每個檔案所屬的病患。各病患以有限的並行數
+    同時提取並生成報告，結果以 NDJSON 逐行回傳（完成一位回傳一行），單一病患失敗
+    不影響其他病患，最後一行為統計摘要。
+
+    offline 設為 true 時不呼叫LLM，而是寫出服務提供者的離線批次請求檔，
+    並返回以 /batches/{batch_id} 下載的路徑。
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="沒有上傳檔案")
+    if len(patient_ids) != len(files):
+        raise HTTPException(status_code=400, detail="patient_ids 的數量必須與檔案數量相同")
     
-    # 如果沒有成功處理任何檔案
-    if not processed_texts:
+    # 每位病患的檔案存放在各自的子目錄，避免不同病患的同名檔案互相覆蓋
+    workspace = create_workspace(prefix="batch_")
+    try:
+        bundles: Dict[str, list] = {}
+        directories: Dict[str, str] = {}
+        for file, patient_id in zip(files, patient_ids):
+            tasks = bundles.setdefault(patient_id, [])
+            processor = get_processor(file.filename, read_head(file))
+            if processor is None:
+                continue
+            if patient_id not in directories:
+                directories[patient_id] = os.path.join(workspace, f"patient_{len(directories)+1}")
+                os.makedirs(directories[patient_id])
+            tasks.append((processor, await save_upload(file, directories[patient_id])))
+    except Exception:
+        remove_workspace(workspace)
+        raise
+    
+    if not directories:
+        remove_workspace(workspace)
         raise HTTPException(status_code=400, detail="沒有有效的檔案可處理")
     
-    # 合併所有處理後的文本
-    combined_text = "\n\n".join(processed_texts)
+    if offline:
+        try:
+            return await write_batch_file(bundles, prompt, model_choice)
+        finally:
+            remove_workspace(workspace)
     
-    # 使用LLM處理器生成最終報告
-    llm_processor = LLMProcessor()
-    result = llm_processor.process(combined_text, prompt)
+    async def lines():
+        succeeded = 0
+        async for patient_id, result in run_batch(bundles, prompt, use_cache, model_choice):
+            succeeded += result.get("status") == "success"
+            yield json.dumps({"patient_id": patient_id, "result": result}, ensure_ascii=False) + "\n"
+        summary = {"total": len(bundles), "succeeded": succeeded, "failed": len(bundles) - succeeded}
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
     
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(remove_workspace, workspace)
+    )
+
+@router.get("/batches/{batch_id}")
+async def get_batch_file(batch_id: str):
+    """下載 /batch 離線模式產生的批次請求檔（JSONL）"""
+    path = batch_file_path(batch_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="找不到批次檔")
+    return FileResponse(path, media_type="application/x-ndjson", filename=f"{batch_id}.jsonl")
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查詢任務狀態、各階段進度及完成後的報告"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="找不到任務")
+    return job.to_dict()
+
+@router.post("/uploads", status_code=201)
+async def create_upload_session(
+    filename: str = Form(...),
+    size: int = Form(...),
+    chunk_size: Optional[int] = Form(None)
+):
+    """
+    建立可續傳的分塊上傳工作階段
+
+    以 PUT /api/uploads/{session_id}/chunks/{index} 依序上傳區塊（除最後一塊外皆為 chunk_size 位元組），
+    連線中斷後以 GET /api/uploads/{session_id} 取得缺少的區塊再補傳，全部上傳後呼叫 finalize 生成報告。
+    faststart 的 MP4 在上傳期間即開始轉錄已收到的部分
+    """
+    try:
+        session = upload_sessions.create(filename, size, chunk_size)
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return session.to_dict()
+
+def _get_upload_session(session_id: str):
+    session = upload_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="找不到上傳工作階段")
+    return session
+
+@router.get("/uploads/{session_id}")
+async def get_upload_session(session_id: str):
+    """查詢已收到與缺少的區塊，以及上傳期間的轉錄進度"""
+    return _get_upload_session(session_id).to_dict()
+
+@router.put("/uploads/{session_id}/chunks/{index}")
+async def put_upload_chunk(session_id: str, index: int, request: Request):
+    """上傳一個區塊（請求內容為區塊的原始位元組），重複上傳同一區塊會覆寫"""
+    session = _get_upload_session(session_id)
+    if int(request.headers.get("content-length") or 0) > session.chunk_size:
+        raise HTTPException(status_code=413, detail="區塊超過工作階段的區塊大小")
+    data = await request.body()
+    try:
+        await upload_sessions.write_chunk(session, index, data)
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"index": index, "received_chunks": len(session.received), "total_chunks": session.total_chunks}
+
+@router.post("/uploads/{session_id}/finalize")
+async def finalize_upload_session(
+    session_id: str,
+    files: Optional[List[UploadFile]] = File(None),
+    prompt: Optional[str] = Form(None),
+    use_cache: bool = Form(True),
+    patient_id: Optional[str] = Form(None),
+    timings: bool = Form(False)
+):
+    """
+    完成分塊上傳並生成報告，回應格式與 /process 相同
+
+    可另外附上一般上傳的檔案（例如同一病患的JSON或TXT）一併處理；
+    仍有區塊未上傳時返回409與缺少的區塊編號。完成後刪除工作階段與已上傳的資料
+    """
+    session = _get_upload_session(session_id)
+    try:
+        processor = upload_sessions.begin_finalize(session)
+    except IncompleteUploadError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "missing": e.missing})
+    except UploadSessionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    request_timings = start_request_timings() if timings else None
+    try:
+        tasks = [(processor, session.file_path)]
+        for file in files or []:
+            extra = get_processor(file.filename, read_head(file))
+            if extra is not None:
+                tasks.append((extra, await save_upload(file, session.workspace)))
+        result = await generate_report(tasks, prompt, use_cache=use_cache, patient_id=patient_id,
+                                       request_id=session_id)
+    finally:
+        upload_sessions.remove(session_id)
+    
+    if request_timings is not None:
+        return {"result": result, "timings": request_timings.to_dict()}
     return {"result": result}
 
+@router.delete("/uploads/{session_id}")
+async def delete_upload_session(session_id: str):
+    """取消上傳並刪除已上傳的資料"""
+    if not upload_sessions.remove(session_id):
+        raise HTTPException(status_code=404, detail="找不到上傳工作階段")
+    return {"session_id": session_id, "deleted": True}
+
+@router.get("/reports")
+async def list_reports(
+    patient_id: Optional[str] = None,
+    request_id: Optional[str] = None,
+    model: Optional[str] = None,
+    input_hash: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None
+):
+    """
+    依建立時間由新到舊列出報告索引（不含內容）
+
+    可依病患、請求、模型、輸入雜湊與建立時間（Unix時間）篩選；
+    next_cursor 不為null時，以 cursor 參數取得下一頁
+    """
+    try:
+        records, next_cursor = await run_blocking(
+            get_report_store().list, patient_id=patient_id, request_id=request_id, model=model,
+            input_hash=input_hash, since=since, until=until, limit=limit, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無效的分頁游標")
+    return {"reports": [record.to_dict() for record in records], "next_cursor": next_cursor}
+
+@router.get("/reports/{report_id}")
+async def get_report(report_id: str, format: str = Query("json", regex="^(json|markdown)$")):
+    """取得報告內容與索引資料；format=markdown 時直接返回 Markdown 文本"""
+    found = await run_blocking(get_report_store().get, report_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="找不到報告")
+    record, report = found
+    if format == "markdown":
+        return PlainTextResponse(report, media_type="text/markdown; charset=utf-8")
+    return {**record.to_dict(), "report": report}
+
+@router.get("/providers/stats")
+async def provider_stats():
+    """各LLM服務提供者的節流、排隊等待、重試與斷路器統計"""
+    return scheduler.stats()
+
 @router.get("/health")
 async def health_check():
     """健康檢查端點"""
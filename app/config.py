@@ -9,9 +9,129 @@ class Settings(BaseSettings):
     """應用程式設定"""
     LANGCHAIN_API_KEY: str = os.getenv("LANGCHAIN_API_KEY", "")
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")  # 留空使用官方端點，可指向本地替身服務
+    GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY", "")
+    GOOGLE_BASE_URL: str = os.getenv("GOOGLE_BASE_URL", "")  # 留空使用官方端點，設定時改以REST呼叫此端點
     
     # 應用程式設定
     APP_NAME: str = "檔案處理API"
+
+    # 監控設定
+    METRICS_ENABLED: bool = True  # 記錄各階段耗時並於 /metrics 輸出，停用時計時為空操作
+
+    # 處理管線設定
+    PROCESSOR_MAX_WORKERS: int = 8  # 檔案處理與LLM呼叫共用的執行緒數
+    PROCESSOR_WARMUP: str = ""  # 啟動時預先載入的處理器與共用客戶端（以逗號分隔，例如 excel,mp4；all 表示全部），留空時第一次使用才載入
+
+    # 程序池設定（CPU密集的解析與繁簡轉換，避免與事件迴圈競爭GIL；LLM等I/O呼叫仍在執行緒與事件迴圈中）
+    PROCESS_POOL_KINDS: str = ""  # 交由程序池的工作（以逗號分隔：excel、text、json、opencc），留空時全部在執行緒池執行
+    PROCESS_POOL_WORKERS: int = 0  # 子程序數，0表示CPU核心數
+    PROCESS_POOL_MAX_TASKS_PER_CHILD: int = 0  # 子程序處理幾個工作後重啟以釋放記憶體，0表示不重啟（需要Python 3.11以上）
+
+    # 外部服務客戶端連線池設定
+    LLM_POOL_MAX_CONNECTIONS: int = 20
+    LLM_POOL_MAX_KEEPALIVE: int = 10
+    LLM_POOL_KEEPALIVE_EXPIRY: float = 60
+    LLM_HTTP_TIMEOUT: float = 600
+    CLIENT_WARMUP_CONNECT: bool = False  # 預熱客戶端時另外發出一次請求完成TLS握手（需設定 PROCESSOR_WARMUP）
+
+    # LLM呼叫排程設定（每分鐘限制為0表示不限制）
+    OPENAI_REQUESTS_PER_MINUTE: float = 500
+    OPENAI_TOKENS_PER_MINUTE: float = 200000
+    GEMINI_REQUESTS_PER_MINUTE: float = 1000
+    GEMINI_TOKENS_PER_MINUTE: float = 1000000
+    LLM_MAX_IN_FLIGHT: int = 8  # 每個服務提供者同時進行中的呼叫上限
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # 連續失敗幾次後開啟斷路器
+    LLM_CIRCUIT_RESET_SECONDS: float = 30
+    LLM_CIRCUIT_PROBE_TIMEOUT_SECONDS: float = 600  # 半開時的試探請求超過此秒數未回報，允許下一個請求試探
+    LLM_BACKOFF_BASE_SECONDS: float = 1
+    LLM_BACKOFF_MAX_SECONDS: float = 30
+
+    # 輸入權杖預算設定（超過時先分塊摘要再生成報告）
+    LLM_MAX_INPUT_TOKENS: int = 60000  # 單次請求的資料權杖上限（另受模型上下文限制）
+    LLM_OUTPUT_TOKEN_RESERVE: int = 4096  # 為模型輸出保留的權杖數
+    LLM_MAP_CHUNK_TOKENS: int = 12000  # 分塊摘要時每塊的權杖上限
+    LLM_MAP_MAX_CONCURRENCY: int = 4
+    LLM_MAX_REDUCE_ROUNDS: int = 3  # 摘要後仍超過預算時最多再摘要的次數
+
+    # 冪等請求設定（/api/process 的重複送出與代理重試）
+    IDEMPOTENCY_ENABLED: bool = True
+    IDEMPOTENCY_DERIVE_KEY: bool = True  # 未提供 Idempotency-Key 時以檔案內容雜湊與提示詞作為鍵
+    IDEMPOTENCY_REPLAY_SECONDS: float = 600  # 成功結果的重播期間，0表示只合併同時進行的相同請求
+    IDEMPOTENCY_MAX_ENTRIES: int = 1000  # 保留的結果數上限，超過時淘汰最舊的結果
+
+    # 上傳設定
+    UPLOAD_DIR: str = "uploads"
+    UPLOAD_TMPFS_DIR: str = ""  # 例如 /dev/shm，設定且存在時優先使用
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 寫入磁碟時的區塊大小
+
+    # 分塊上傳工作階段設定（可續傳，MP4 在上傳期間提前轉錄）
+    UPLOAD_SESSION_CHUNK_SIZE: int = 8 * 1024 * 1024  # 用戶端未指定時的區塊大小
+    UPLOAD_SESSION_MAX_CHUNK_SIZE: int = 64 * 1024 * 1024
+    UPLOAD_SESSION_MAX_SIZE: int = 8 * 1024 * 1024 * 1024  # 單一檔案的大小上限
+    UPLOAD_SESSION_TTL: float = 6 * 3600  # 閒置超過此秒數的工作階段連同已上傳的資料一併刪除
+
+    # 報告儲存設定
+    REPORT_STORE_PATH: str = "reports/reports.db"
+    REPORT_COMPRESSION: str = "gzip"  # zstd（需安裝zstandard）、gzip 或 none
+    REPORT_RETENTION_DAYS: float = 365  # 超過此天數的報告定期清除，0表示永久保存
+
+    # 非同步任務設定
+    JOB_QUEUE_BACKEND: str = "memory"  # memory 或 sqlite
+    JOB_QUEUE_MAX_SIZE: int = 100  # 等待中的任務上限，超過時拒絕新任務
+    JOB_WORKERS: int = 2  # 同時執行的任務數
+    JOB_SQLITE_PATH: str = "jobs.db"
+    JOB_LEASE_SECONDS: float = 60  # 執行中任務的租約，程序停止續約超過此秒數後由其他程序重新執行
+    JOB_RESULT_TTL: float = 24 * 3600  # 已完成任務的保留秒數
+
+    # 批次處理設定
+    BATCH_MAX_CONCURRENCY: int = 4  # 同時處理的病患數
+    BATCH_OUTPUT_DIR: str = "batches"  # 離線批次請求檔的輸出目錄
+
+    # 文本提取設定
+    TEXT_ENCODING_SAMPLE_BYTES: int = 64 * 1024  # 判斷編碼時讀取的樣本大小
+    TEXT_ENCODING_MIN_CONFIDENCE: float = 0.5  # chardet信心低於此值時視為無法判斷
+    TEXT_STREAM_MIN_BYTES: int = 4 * 1024 * 1024  # 超過此大小時逐塊解碼，不將完整內容讀入記憶體
+
+    # JSON提取設定
+    JSON_STREAM_MIN_BYTES: int = 8 * 1024 * 1024  # 超過此大小且已安裝ijson時逐步解析
+    JSON_FIELD_ALLOWLIST: str = ""  # 以逗號分隔的欄位路徑，只將這些欄位交給LLM
+
+    # 音訊提取設定
+    FFMPEG_BINARY: str = "ffmpeg"
+    FFPROBE_BINARY: str = "ffprobe"
+    AUDIO_CONDITIONING: bool = True  # 轉為單聲道、低取樣率、低位元率的語音格式後再送出轉錄，停用時盡量直接複製音訊串流
+    AUDIO_CODEC: str = "opus"  # opus（Ogg）或 mp3，opus 編碼失敗時改用 mp3
+    AUDIO_SAMPLE_RATE: int = 16000
+    AUDIO_BITRATE: str = "24k"
+    AUDIO_OPUS_COMPRESSION_LEVEL: int = 2  # opus 編碼複雜度0-10，ffmpeg預設10的CPU時間約為此設定的兩倍，檔案大小相近
+    AUDIO_TRIM_SILENCE: bool = True  # 去除較長的靜音（例如營養師翻閱紀錄時），減少上傳量與計費的音訊長度
+    AUDIO_TRIM_MIN_SILENCE_SECONDS: float = 1.0  # 長於此秒數的靜音才去除
+    AUDIO_TRIM_PADDING_SECONDS: float = 0.25  # 去除的靜音兩側各保留的秒數
+
+    # 分段轉錄設定
+    TRANSCRIPTION_CHUNK_SECONDS: float = 600  # 目標分段長度，較短的錄音不分段
+    TRANSCRIPTION_OVERLAP_SECONDS: float = 2  # 找不到靜音而硬切時的重疊長度
+    TRANSCRIPTION_MAX_CONCURRENCY: int = 4
+    TRANSCRIPTION_RETRY_COUNT: int = 3
+    TRANSCRIPTION_SILENCE_DB: float = -35
+    TRANSCRIPTION_MIN_SILENCE_SECONDS: float = 0.5
+    TRANSCRIPTION_INCREMENTAL: bool = True  # 分塊上傳的 faststart MP4 在上傳期間轉錄已收到的分段
+    TRANSCRIPTION_INCREMENTAL_MARGIN_SECONDS: float = 15  # 依已收到的位元組估計可解碼的秒數時保留的安全邊界
+    TRANSCRIPTION_OPENCC_CONFIG: str = "s2twp"  # 逐字稿簡轉繁的OpenCC設定，s2twp 轉為台灣用語的繁體中文
+    TRANSCRIPTION_TIMESTAMPS: bool = False  # 向API要求段落時間，逐字稿每段前標示原始影片中的時間（去除靜音後仍對齊），會增加送入LLM的權杖數
+
+    # 轉錄快取設定（以影片內容雜湊為鍵）
+    TRANSCRIPTION_CACHE_ENABLED: bool = True
+    TRANSCRIPTION_CACHE_DIR: str = "cache/transcriptions"
+    TRANSCRIPTION_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # LLM回應快取設定
+    LLM_CACHE_BACKEND: str = "tiered"  # tiered、memory、disk 或 none
+    LLM_CACHE_TTL: float = 3600  # 秒，0表示不過期
+    LLM_CACHE_MEMORY_ENTRIES: int = 256
+    LLM_CACHE_DIR: str = "cache/llm_responses"
+    LLM_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,382 @@
+import logging
+import os
+import re
+import struct
+import subprocess
+import tempfile
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import ffmpeg
+
+from app.config import settings
+from app.core.metrics import count_audio, timed
+
+logger = logging.getLogger(__name__)
+
+# 轉錄API可直接接受的音訊編碼 -> (輸出容器, 上傳檔名, 額外輸出參數)
+# AAC 以分段式 MP4 輸出，才能不經暫存檔直接寫到管線
+STREAM_COPY_FORMATS: Dict[str, tuple] = {
+    "aac": ("mp4", "audio.m4a", {"movflags": "frag_keyframe+empty_moov"}),
+    "mp3": ("mp3", "audio.mp3", {}),
+    "opus": ("ogg", "audio.ogg", {}),
+    "vorbis": ("ogg", "audio.ogg", {}),
+    "flac": ("flac", "audio.flac", {}),
+}
+
+
+_DURATION = re.compile(r"Duration: (\d+):(\d+):([\d.]+)")
+_SILENCE_START = re.compile(r"silence_start: (-?[\d.]+)")
+_SILENCE_END = re.compile(r"silence_end: (-?[\d.]+)")
+
+
+class AudioExtractionError(Exception):
+    """無法從影片提取音訊"""
+
+
+# 語音編碼 -> (輸出容器, 上傳檔名, ffmpeg編碼器)，皆為轉錄API接受的格式
+SPEECH_CODECS: Dict[str, Tuple[str, str, str]] = {
+    "opus": ("ogg", "audio.ogg", "libopus"),
+    "mp3": ("mp3", "audio.mp3", "libmp3lame"),
+}
+
+
+class TimestampMap(NamedTuple):
+    """
+    修剪靜音後的音訊時間與原始影片時間的對應
+
+    保留的原始區間依序串接成送出的音訊；轉錄結果帶有時間時以 to_source 換回原始影片的時間
+    """
+    intervals: Tuple[Tuple[float, float], ...]  # (原始起點, 原始終點)，以整段影片計時
+
+    @property
+    def seconds(self) -> float:
+        """送出的音訊長度"""
+        return sum(end - start for start, end in self.intervals)
+
+    def to_source(self, t: float) -> float:
+        """送出音訊中的秒數 -> 原始影片中的秒數"""
+        elapsed = 0.0
+        for start, end in self.intervals:
+            if t <= elapsed + (end - start):
+                return start + (t - elapsed)
+            elapsed += end - start
+        return self.intervals[-1][1] if self.intervals else t
+
+
+class ExtractedAudio(NamedTuple):
+    """提取出的音訊內容"""
+    data: bytes
+    filename: str  # 上傳時使用的檔名，副檔名決定API判斷的格式
+    codec: str
+    method: str  # speech、copy、transcode 或 moviepy
+    seconds: Optional[float] = None  # 送出的音訊長度，無法判斷時為None
+    source_seconds: Optional[float] = None  # 對應的原始影片長度
+    timeline: Optional[TimestampMap] = None  # 修剪了靜音時的時間對應
+
+
+def _probe(file_path: str) -> Optional[Dict[str, Any]]:
+    """以ffprobe讀取音訊軌與容器資訊，ffprobe無法執行時返回None"""
+    try:
+        return ffmpeg.probe(file_path, cmd=settings.FFPROBE_BINARY, select_streams="a")
+    except (ffmpeg.Error, OSError) as e:
+        logger.warning(f"無法探測音訊資訊: {str(e)}")
+        return None
+
+
+def probe_audio_codec(file_path: str) -> Optional[str]:
+    """取得第一條音訊軌的編碼名稱，無法判斷時返回None"""
+    info = _probe(file_path)
+    if info is None:
+        return None
+    streams = info.get("streams", [])
+    if not streams:
+        raise AudioExtractionError("影片中沒有音訊軌")
+    return streams[0].get("codec_name")
+
+
+def _header_duration(file_path: str) -> Optional[float]:
+    """從ffmpeg輸出的檔案資訊讀取長度（沒有ffprobe時的備援）"""
+    try:
+        result = subprocess.run([settings.FFMPEG_BINARY, "-hide_banner", "-i", file_path],
+                                capture_output=True, text=True, errors="ignore")
+    except OSError:
+        return None
+    match = _DURATION.search(result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def probe_duration(file_path: str) -> Optional[float]:
+    """取得影片長度（秒），無法判斷時返回None"""
+    info = _probe(file_path)
+    if info is None:
+        return _header_duration(file_path)
+    try:
+        return float(info["format"]["duration"])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def detect_silences(file_path: str, noise_db: float, min_silence: float, start: float = 0.0,
+                    length: Optional[float] = None) -> Tuple[List[Tuple[float, float]], Optional[float]]:
+    """
+    使用ffmpeg silencedetect找出靜音區段（只解碼音訊）
+
+    Args:
+        file_path: 影片檔案路徑
+        noise_db: 視為靜音的音量門檻（dB）
+        min_silence: 最短靜音長度（秒）
+        start: 只解碼從此秒數開始的音訊
+        length: 只解碼此長度（秒），預設到檔案結尾
+
+    Returns:
+        (以整段影片計時的靜音區段列表, 影片長度)，長度無法判斷時為None
+    """
+    window = ["-ss", f"{start:.3f}"] if start else []
+    if length is not None:
+        window += ["-t", f"{length:.3f}"]
+    result = subprocess.run(
+        [settings.FFMPEG_BINARY, "-hide_banner", "-nostats", *window, "-i", file_path, "-vn",
+         "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-"],
+        capture_output=True, text=True, errors="ignore"
+    )
+    output = result.stderr
+    # 輸入端 -ss 讓時間戳記從0開始，加回起始秒數
+    starts = [start + max(float(v), 0.0) for v in _SILENCE_START.findall(output)]
+    ends = [start + float(v) for v in _SILENCE_END.findall(output)]
+    duration = None
+    match = _DURATION.search(output)
+    if match:
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    # 結尾的靜音可能沒有 silence_end
+    window_end = start + length if length is not None else duration
+    if window_end is not None and len(ends) < len(starts):
+        ends.append(window_end if duration is None else min(window_end, duration))
+    return list(zip(starts, ends)), duration
+
+
+class Mp4Layout(NamedTuple):
+    """MP4 頂層box的配置，用於判斷上傳中的檔案能否開始解碼"""
+    faststart: bool  # moov（索引）位於媒體資料之前
+    media_start: int  # 第一個 mdat 內容的起始位置，之後到檔案結尾大致依時間順序排列
+
+
+def read_mp4_layout(file_path: str, available: int, total_size: int) -> Optional[Mp4Layout]:
+    """
+    讀取檔案前 available 個位元組中的MP4頂層box
+
+    Args:
+        file_path: 影片檔案路徑（可能尚未完整寫入）
+        available: 檔案開頭已連續寫入的位元組數
+        total_size: 完整檔案的大小
+
+    Returns:
+        moov 已完整收到、或已確定 moov 位於媒體資料之後時返回配置，需要更多資料時返回None
+    """
+    moov_end = None
+    offset = 0
+    with open(file_path, "rb") as f:
+        while offset + 8 <= available:
+            f.seek(offset)
+            header = f.read(16)
+            size, box_type = struct.unpack(">I4s", header[:8])
+            header_size = 8
+            if size == 1:
+                if offset + 16 > available:
+                    return None
+                size = struct.unpack(">Q", header[8:16])[0]
+                header_size = 16
+            elif size == 0:
+                size = total_size - offset
+            if size < header_size:
+                raise AudioExtractionError("不是有效的MP4檔案")
+            if box_type == b"moov":
+                moov_end = offset + size
+            elif box_type == b"mdat":
+                if moov_end is None:
+                    return Mp4Layout(False, offset + header_size)
+                return Mp4Layout(True, offset + header_size) if moov_end <= available else None
+            offset += size
+    return None
+
+
+def _run_ffmpeg(file_path: str, output_format: str, start: Optional[float] = None,
+                duration: Optional[float] = None, **output_args: Any) -> bytes:
+    """執行ffmpeg並從stdout讀取輸出，不寫入中間檔案；可只輸出指定時間區段"""
+    input_args: Dict[str, Any] = {}
+    if start:
+        input_args["ss"] = f"{start:.3f}"
+    if duration:
+        input_args["t"] = f"{duration:.3f}"
+    stream = ffmpeg.input(file_path, **input_args).output("pipe:", format=output_format, vn=None, **output_args)
+    out, _ = stream.run(cmd=settings.FFMPEG_BINARY, capture_stdout=True, capture_stderr=True, quiet=True)
+    if not out:
+        raise AudioExtractionError("ffmpeg沒有輸出任何音訊")
+    return out
+
+
+def speech_intervals(silences: List[Tuple[float, float]], start: float, end: float, min_silence: float,
+                     padding: float) -> List[Tuple[float, float]]:
+    """
+    去除較長的靜音後保留的區間
+
+    Args:
+        silences: 靜音區段
+        start: 區間起點
+        end: 區間終點
+        min_silence: 長於此秒數的靜音才去除
+        padding: 去除的靜音兩側各保留的秒數，避免切掉語句的開頭與結尾
+
+    Returns:
+        依序排列的 (起點, 終點) 列表
+    """
+    kept = []
+    cursor = start
+    for silence_start, silence_end in silences:
+        if silence_end - silence_start < min_silence:
+            continue
+        # 延伸到區間邊界的靜音不需保留語句前後的緩衝
+        cut_start = start if silence_start <= start else silence_start + padding
+        cut_end = end if silence_end >= end else silence_end - padding
+        if cut_end <= cut_start:
+            continue
+        if cut_start > cursor:
+            kept.append((cursor, cut_start))
+        cursor = max(cursor, cut_end)
+    if end > cursor:
+        kept.append((cursor, end))
+    return kept
+
+
+def _extract_speech(file_path: str, start: Optional[float] = None,
+                    duration: Optional[float] = None) -> ExtractedAudio:
+    """
+    轉為語音用的格式：單聲道、AUDIO_SAMPLE_RATE 取樣、低位元率的語音編碼，並可去除較長的靜音
+
+    去除靜音時記錄保留的區間（TimestampMap），全部為靜音時返回空的音訊
+    """
+    offset = start or 0.0
+    end = offset + duration if duration else None
+    timeline = None
+    if settings.AUDIO_TRIM_SILENCE:
+        silences, total = detect_silences(file_path, settings.TRANSCRIPTION_SILENCE_DB,
+                                          settings.AUDIO_TRIM_MIN_SILENCE_SECONDS, start=offset, length=duration)
+        if total is not None:
+            # 最後一段的長度可能超出影片結尾
+            end = min(end, total) if end is not None else total
+        if end is not None:
+            kept = speech_intervals(silences, offset, end, settings.AUDIO_TRIM_MIN_SILENCE_SECONDS,
+                                    settings.AUDIO_TRIM_PADDING_SECONDS)
+            if not kept:
+                _, filename, _ = SPEECH_CODECS.get(settings.AUDIO_CODEC, SPEECH_CODECS["mp3"])
+                return ExtractedAudio(b"", filename, settings.AUDIO_CODEC, "speech", 0.0, end - offset,
+                                      TimestampMap(()))
+            if kept != [(offset, end)]:
+                timeline = TimestampMap(tuple(kept))
+
+    output_args: Dict[str, Any] = {"ac": 1, "ar": settings.AUDIO_SAMPLE_RATE, "audio_bitrate": settings.AUDIO_BITRATE}
+    if timeline is not None:
+        # 輸入端 -ss 讓時間戳記從0開始，區間改以片段起點計時
+        selected = "+".join(f"between(t,{s - offset:.3f},{e - offset:.3f})" for s, e in timeline.intervals)
+        output_args["af"] = f"aselect='{selected}',asetpts=N/SR/TB"
+
+    codecs = [settings.AUDIO_CODEC] + (["mp3"] if settings.AUDIO_CODEC != "mp3" else [])
+    for index, name in enumerate(codecs):
+        output_format, filename, encoder = SPEECH_CODECS[name]
+        codec_args = {"compression_level": settings.AUDIO_OPUS_COMPRESSION_LEVEL} if name == "opus" else {}
+        try:
+            data = _run_ffmpeg(file_path, output_format, start, duration, acodec=encoder, **output_args, **codec_args)
+        except ffmpeg.Error as e:
+            if index == len(codecs) - 1:
+                raise
+            logger.warning(f"以 {encoder} 編碼失敗，改用MP3: {e.stderr.decode('utf-8', 'ignore')[-200:]}")
+            continue
+        if end is None:
+            end = probe_duration(file_path)
+        source_seconds = end - offset if end is not None else None
+        seconds = timeline.seconds if timeline is not None else source_seconds
+        return ExtractedAudio(data, filename, name, "speech", seconds, source_seconds, timeline)
+
+
+def _extract_with_ffmpeg(file_path: str, start: Optional[float] = None,
+                         duration: Optional[float] = None, codec: Optional[str] = None) -> ExtractedAudio:
+    """
+    啟用 AUDIO_CONDITIONING 時轉為語音格式；否則可接受的編碼直接複製音訊串流，其他才轉碼為MP3
+    """
+    if settings.AUDIO_CONDITIONING:
+        return _extract_speech(file_path, start, duration)
+    codec = codec or probe_audio_codec(file_path)
+    if codec in STREAM_COPY_FORMATS:
+        output_format, filename, extra = STREAM_COPY_FORMATS[codec]
+        try:
+            data = _run_ffmpeg(file_path, output_format, start, duration, acodec="copy", **extra)
+            return ExtractedAudio(data, filename, codec, "copy", duration, duration)
+        except ffmpeg.Error as e:
+            logger.warning(f"音訊串流複製失敗，改為轉碼: {e.stderr.decode('utf-8', 'ignore')[-200:]}")
+    data = _run_ffmpeg(file_path, "mp3", start, duration, acodec="libmp3lame", audio_bitrate="128k")
+    return ExtractedAudio(data, "audio.mp3", codec or "unknown", "transcode", duration, duration)
+
+
+def extract_segment(file_path: str, start: float, duration: float,
+                    codec: Optional[str] = None) -> ExtractedAudio:
+    """
+    提取指定時間區段的音訊（供分段轉錄使用，不提供moviepy備援）
+
+    Args:
+        file_path: 影片檔案路徑
+        start: 起始秒數
+        duration: 區段長度（秒）
+        codec: 已知的音訊編碼，避免每個區段重複探測
+
+    Returns:
+        提取出的音訊
+    """
+    with timed("audio_extract", "segment"):
+        audio = _extract_with_ffmpeg(file_path, start, duration, codec)
+    count_audio(len(audio.data), audio.seconds, audio.source_seconds)
+    return audio
+
+
+def _extract_with_moviepy(file_path: str) -> ExtractedAudio:
+    """使用moviepy解碼並轉存MP3（僅作為ffmpeg無法使用時的備援）"""
+    import moviepy.editor as mp
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        mp3_path = os.path.join(temp_dir, "audio.mp3")
+        video = mp.VideoFileClip(file_path)
+        try:
+            if video.audio is None:
+                raise AudioExtractionError("影片中沒有音訊軌")
+            video.audio.write_audiofile(mp3_path, verbose=False, logger=None)
+        finally:
+            video.close()
+        with open(mp3_path, "rb") as f:
+            return ExtractedAudio(f.read(), "audio.mp3", "mp3", "moviepy")
+
+
+def extract_audio(file_path: str) -> ExtractedAudio:
+    """
+    從影片提取可直接上傳給轉錄API的音訊
+
+    優先使用ffmpeg串流複製，只有在編碼不被接受時才轉碼；ffmpeg無法執行時改用moviepy
+
+    Args:
+        file_path: 影片檔案路徑
+
+    Returns:
+        提取出的音訊
+    """
+    with timed("audio_extract", "full"):
+        try:
+            audio = _extract_with_ffmpeg(file_path)
+        except AudioExtractionError:
+            raise
+        except (ffmpeg.Error, OSError) as e:
+            detail = e.stderr.decode("utf-8", "ignore")[-200:] if isinstance(e, ffmpeg.Error) and e.stderr else str(e)
+            logger.warning(f"ffmpeg提取音訊失敗，改用moviepy: {detail}")
+            audio = _extract_with_moviepy(file_path)
+    count_audio(len(audio.data), audio.seconds, audio.source_seconds)
+    return audio
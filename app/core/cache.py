@@ -0,0 +1,281 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """以固定大小的區塊計算檔案的SHA-256，記憶體用量與檔案大小無關"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(*parts: Any) -> str:
+    """將多個組成部分合併為固定長度的快取鍵"""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+class BaseCache(ABC):
+    """快取基礎類別，定義共用介面"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """讀取快取項目，不存在或已過期時返回None"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        """寫入快取項目"""
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """刪除快取項目"""
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """快取統計資料"""
+        pass
+
+
+class MemoryCache(BaseCache):
+    """程序內的LRU快取，依項目數淘汰，可設定存活時間"""
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] and entry[1] < time.time()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+
+class DiskCache(BaseCache):
+    """
+    存放在磁碟上的鍵值快取，依總大小以LRU淘汰，可設定存活時間
+
+    每個項目存成一個檔案，第一行為到期時間（0表示不過期）。存取時更新檔案時間，
+    重新啟動後依時間重建LRU順序；多個程序共用同一目錄時，其他程序寫入的項目也能被讀取。
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: Optional[float] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.cache")
+
+    def _load_index(self) -> None:
+        """掃描目錄，依最後存取時間由舊到新重建索引"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".cache"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len(".cache")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[str]:
+        """讀取快取項目，不存在時返回None"""
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    expires_at = float(f.readline() or 0)
+                    if expires_at and expires_at < time.time():
+                        raise KeyError(key)
+                    value = f.read()
+                os.utime(path)
+            except (OSError, ValueError, KeyError):
+                self._remove(key)
+                self.misses += 1
+                return None
+            if key not in self._entries:
+                # 其他程序寫入的項目
+                size = os.path.getsize(path)
+                self._entries[key] = size
+                self._total_bytes += size
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        """寫入快取項目，超過容量時淘汰最久未使用的項目"""
+        expires_at = time.time() + self.ttl if self.ttl else 0
+        data = f"{expires_at}\n{value}".encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                # 先寫入臨時檔再替換，避免其他程序讀到寫到一半的內容
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self._path(key))
+            except OSError as e:
+                logger.error(f"寫入快取時出錯: {str(e)}")
+                return
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        if key in self._entries:
+            self._total_bytes -= self._entries.pop(key)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class TieredCache(BaseCache):
+    """記憶體層在前、磁碟層在後的兩層快取，磁碟層命中時回填記憶體層"""
+
+    def __init__(self, memory: MemoryCache, disk: DiskCache):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = self.disk.get(key)
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        self.disk.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats()}
+
+
+# 共用快取（延遲建立）
+_transcription_cache: Optional[DiskCache] = None
+_response_cache: Optional[BaseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_transcription_cache() -> Optional[DiskCache]:
+    """取得共用的轉錄快取，停用時返回None"""
+    global _transcription_cache
+    if not settings.TRANSCRIPTION_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _transcription_cache is None:
+            _transcription_cache = DiskCache(
+                settings.TRANSCRIPTION_CACHE_DIR, settings.TRANSCRIPTION_CACHE_MAX_BYTES
+            )
+    return _transcription_cache
+
+
+def get_response_cache() -> Optional[BaseCache]:
+    """依設定取得共用的LLM回應快取（memory、disk 或 tiered），停用時返回None"""
+    global _response_cache
+    backend = settings.LLM_CACHE_BACKEND.lower()
+    if backend in ("", "none"):
+        return None
+    with _cache_lock:
+        if _response_cache is None:
+            ttl = settings.LLM_CACHE_TTL or None
+            memory = MemoryCache(settings.LLM_CACHE_MEMORY_ENTRIES, ttl)
+            if backend == "memory":
+                _response_cache = memory
+            else:
+                disk = DiskCache(settings.LLM_CACHE_DIR, settings.LLM_CACHE_MAX_BYTES, ttl)
+                _response_cache = disk if backend == "disk" else TieredCache(memory, disk)
+    return _response_cache
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """
+    程序共用的外部服務客戶端
+
+    OpenAI（同步與非同步）、Gemini 與 OpenCC 轉換器只建立一次，HTTP連線以keep-alive
+    連線池重複使用，避免每個請求重新握手與重新載入字典
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._openai = None
+        # 非同步客戶端的連線綁定事件迴圈，每個迴圈各自建立
+        self._async_openai: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+        self._gemini: Dict[str, Any] = {}
+        self._converter = None
+        self._converter_loaded = False
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.LLM_POOL_KEEPALIVE_EXPIRY,
+        )
+
+    def openai(self):
+        """取得共用的同步OpenAI客戶端，未設定API金鑰時返回None"""
+        if self._openai is None and settings.OPENAI_API_KEY:
+            with self._lock:
+                if self._openai is None:
+                    from openai import OpenAI, DefaultHttpxClient
+                    self._openai = OpenAI(
+                        api_key=settings.OPENAI_API_KEY,
+                        base_url=settings.OPENAI_BASE_URL or None,
+                        timeout=settings.LLM_HTTP_TIMEOUT,
+                        http_client=DefaultHttpxClient(limits=self._limits(), timeout=settings.LLM_HTTP_TIMEOUT),
+                    )
+        return self._openai
+
+    def async_openai(self):
+        """取得目前事件迴圈共用的非同步OpenAI客戶端，未設定API金鑰時返回None"""
+        if not settings.OPENAI_API_KEY:
+            return None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        client = self._async_openai.get(loop)
+        if client is None:
+            with self._lock:
+                client = self._async_openai.get(loop)
+                if client is None:
+                    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+                    client = AsyncOpenAI(
+                        api_key=settings.OPENAI_API_KEY,
+                        base_url=settings.OPENAI_BASE_URL or None,
+                        timeout=settings.LLM_HTTP_TIMEOUT,
+                        http_client=DefaultAsyncHttpxClient(limits=self._limits(), timeout=settings.LLM_HTTP_TIMEOUT),
+                    )
+                    self._async_openai[loop] = client
+        return client
+
+    def gemini(self, model: str):
+        """取得指定模型的共用Gemini聊天模型，未設定API金鑰時返回None"""
+        if not settings.GOOGLE_API_KEY:
+            return None
+        if model not in self._gemini:
+            with self._lock:
+                if model not in self._gemini:
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+                    options: Dict[str, Any] = {}
+                    if settings.GOOGLE_BASE_URL:
+                        options = {"client_options": {"api_endpoint": settings.GOOGLE_BASE_URL}, "transport": "rest"}
+                    self._gemini[model] = ChatGoogleGenerativeAI(
+                        model=model, google_api_key=settings.GOOGLE_API_KEY, **options
+                    )
+        return self._gemini[model]
+
+    def opencc(self):
+        """取得共用的簡轉繁轉換器，未安裝opencc時返回None"""
+        if not self._converter_loaded:
+            with self._lock:
+                if not self._converter_loaded:
+                    try:
+                        import opencc
+                        self._converter = opencc.OpenCC(settings.TRANSCRIPTION_OPENCC_CONFIG)
+                    except ImportError:
+                        self._converter = None
+                    self._converter_loaded = True
+        return self._converter
+
+    def warmup(self, gemini_models: Optional[list] = None) -> None:
+        """
+        預先建立所有客戶端並載入OpenCC字典
+
+        設定 CLIENT_WARMUP_CONNECT 時另外發出一次輕量請求，預先完成TLS握手
+        """
+        from app.core.llm_processor import GEMINI_MODEL
+        converter = self.opencc()
+        if converter is not None:
+            converter.convert("预热")
+        client = self.openai()
+        for model in gemini_models or [GEMINI_MODEL]:
+            try:
+                self.gemini(model)
+            except ImportError as e:
+                logger.warning(f"無法建立Gemini客戶端: {str(e)}")
+        if settings.CLIENT_WARMUP_CONNECT and client is not None:
+            try:
+                client.models.list()
+            except Exception as e:
+                logger.warning(f"預先連線OpenAI時出錯: {str(e)}")
+        logger.info("共用客戶端已就緒")
+
+    async def aclose(self) -> None:
+        """關閉連線池"""
+        for client in list(self._async_openai.values()):
+            await client.close()
+        self._async_openai.clear()
+        if self._openai is not None:
+            self._openai.close()
+            self._openai = None
+        self._gemini.clear()
+
+
+# 全域客戶端註冊表
+clients = ClientRegistry()
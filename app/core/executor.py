@@ -0,0 +1,36 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.config import settings
+
+# 處理器共用的執行緒池（延遲建立）
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """取得處理器共用的執行緒池，首次呼叫時建立"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PROCESSOR_MAX_WORKERS,
+            thread_name_prefix="processor"
+        )
+    return _executor
+
+
+def shutdown_executor() -> None:
+    """關閉共用執行緒池"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """在共用執行緒池中執行同步函式，避免阻塞事件迴圈（帶入目前的context，讓請求耗時紀錄跨執行緒）"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
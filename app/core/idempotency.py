@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from app.config import settings
+from app.core.cache import make_key
+
+logger = logging.getLogger(__name__)
+
+# 請求的處理方式：executed（實際執行）、coalesced（等待相同的執行中請求）、replayed（重播已完成的結果）
+EXECUTED = "executed"
+COALESCED = "coalesced"
+REPLAYED = "replayed"
+CONFLICT = "conflict"  # 同一個鍵用於內容不同的請求而被拒絕
+
+
+class IdempotencyConflictError(Exception):
+    """同一個 Idempotency-Key 用於內容不同的請求"""
+
+
+class _Flight(NamedTuple):
+    fingerprint: str
+    future: asyncio.Future
+
+
+class _Completed(NamedTuple):
+    fingerprint: str
+    result: Dict[str, Any]
+    expires_at: float
+
+
+def request_fingerprint(file_digests: List[Tuple[str, str]], prompt: Optional[str], use_cache: bool) -> str:
+    """
+    由上傳檔案的內容雜湊與請求參數計算請求指紋
+
+    Args:
+        file_digests: 依上傳順序的 (檔名, SHA-256) 列表（檔名與順序都會影響報告內容）
+        prompt: 自定義提示詞
+        use_cache: 是否使用LLM回應快取
+
+    Returns:
+        固定長度的指紋
+    """
+    return make_key(*(f"{name}:{digest}" for name, digest in file_digests), prompt or "", use_cache)
+
+
+class IdempotencyManager:
+    """
+    程序內的冪等請求處理（多個 uvicorn worker 時各自獨立）
+
+    相同鍵的請求同時到達時只執行一次，其他請求等待同一個結果；
+    成功的結果保留 IDEMPOTENCY_REPLAY_SECONDS 秒，期間相同鍵的請求直接重播
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, _Flight] = {}
+        self._completed: "OrderedDict[str, _Completed]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {EXECUTED: 0, COALESCED: 0, REPLAYED: 0, CONFLICT: 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def _lookup(self, key: str) -> Optional[_Completed]:
+        with self._lock:
+            entry = self._completed.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                del self._completed[key]
+                entry = None
+            return entry
+
+    def _store(self, key: str, fingerprint: str, result: Dict[str, Any]) -> None:
+        if settings.IDEMPOTENCY_REPLAY_SECONDS <= 0:
+            return
+        with self._lock:
+            self._completed[key] = _Completed(fingerprint, result,
+                                              time.monotonic() + settings.IDEMPOTENCY_REPLAY_SECONDS)
+            self._completed.move_to_end(key)
+            while len(self._completed) > settings.IDEMPOTENCY_MAX_ENTRIES:
+                self._completed.popitem(last=False)
+
+    def _check(self, fingerprint: str, expected: str) -> None:
+        if fingerprint != expected:
+            self._count(CONFLICT)
+            raise IdempotencyConflictError("Idempotency-Key 已用於內容不同的請求")
+
+    async def run(self, key: str, fingerprint: str, execute: Callable[[], Awaitable[Dict[str, Any]]],
+                  replay: bool = True) -> Tuple[Dict[str, Any], str]:
+        """
+        以冪等方式執行請求
+
+        Args:
+            key: 冪等鍵（用戶端提供的 Idempotency-Key 或請求指紋）
+            fingerprint: 請求指紋，同一個鍵的指紋不同時視為衝突
+            execute: 實際執行請求的協程函式，返回結果字典
+            replay: 是否重播已完成的結果（不重播時仍會合併同時進行的相同請求）
+
+        Returns:
+            (結果字典, 處理方式)
+
+        Raises:
+            IdempotencyConflictError: 同一個鍵用於不同內容的請求
+        """
+        while True:
+            entry = self._lookup(key) if replay else None
+            if entry is not None:
+                self._check(fingerprint, entry.fingerprint)
+                self._count(REPLAYED)
+                return dict(entry.result), REPLAYED
+            flight = self._in_flight.get(key)
+            if flight is None:
+                break
+            self._check(fingerprint, flight.fingerprint)
+            try:
+                result = await asyncio.shield(flight.future)
+            except asyncio.CancelledError:
+                if not flight.future.cancelled():
+                    raise
+                # 執行中的請求被取消（例如伺服器關閉），改由目前請求重新執行
+                continue
+            self._count(COALESCED)
+            return dict(result), COALESCED
+
+        future = asyncio.get_running_loop().create_future()
+        # 沒有其他請求等待時，避免未取出的例外被記錄為錯誤
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = _Flight(fingerprint, future)
+        self._count(EXECUTED)
+        try:
+            result = await execute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+        future.set_result(result)
+        # 失敗的結果不保留，用戶端重試時重新執行
+        if result.get("status") == "success":
+            self._store(key, fingerprint, result)
+        return result, EXECUTED
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counts,
+                "in_flight": len(self._in_flight),
+                "stored": len(self._completed),
+            }
+
+
+# 全域冪等請求管理器
+idempotency = IdempotencyManager()
@@ -0,0 +1,404 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.core.executor import run_blocking
+from app.core.pipeline import generate_report
+from app.core.processors.registry import registry
+from app.core.uploads import remove_workspace
+
+logger = logging.getLogger(__name__)
+
+# 任務狀態
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """任務佇列已滿"""
+
+
+@dataclass
+class Job:
+    """非同步報告任務"""
+    job_id: str
+    files: List[str]
+    workspace: str
+    prompt: Optional[str] = None
+    use_cache: bool = True
+    status: str = JOB_QUEUED
+    progress: Dict[str, str] = field(default_factory=dict)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """轉換為API回應格式（不包含伺服器端路徑）"""
+        data = asdict(self)
+        data.pop("workspace")
+        data["files"] = [f.rsplit("/", 1)[-1] for f in self.files]
+        return data
+
+
+class BaseJobQueue(ABC):
+    """
+    任務佇列基礎類別，同時負責保存任務狀態
+
+    實作需保證每個任務只會被一個工作者取出
+    """
+
+    # 重新啟動後是否繼續處理未完成的任務（決定關閉時是否保留執行中任務的工作目錄）
+    persistent: bool = False
+
+    @abstractmethod
+    async def put(self, job: Job) -> None:
+        """加入任務，佇列已滿時拋出 QueueFullError"""
+        pass
+
+    @abstractmethod
+    async def get(self) -> Job:
+        """取出下一個待處理的任務，佇列為空時等待"""
+        pass
+
+    @abstractmethod
+    async def save(self, job: Job) -> None:
+        """更新任務狀態"""
+        pass
+
+    @abstractmethod
+    async def load(self, job_id: str) -> Optional[Job]:
+        """依ID讀取任務"""
+        pass
+
+    def close(self) -> None:
+        """釋放資源"""
+        pass
+
+
+class InMemoryJobQueue(BaseJobQueue):
+    """程序內的任務佇列，重新啟動後任務不保留"""
+
+    def __init__(self, max_size: int, result_ttl: float):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._jobs: Dict[str, Job] = {}
+        self._result_ttl = result_ttl
+
+    async def put(self, job: Job) -> None:
+        self._purge_expired()
+        try:
+            self._queue.put_nowait(job.job_id)
+        except asyncio.QueueFull:
+            raise QueueFullError("任務佇列已滿")
+        self._jobs[job.job_id] = job
+
+    async def get(self) -> Job:
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job
+
+    async def save(self, job: Job) -> None:
+        job.updated_at = time.time()
+        self._jobs[job.job_id] = job
+
+    async def load(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _purge_expired(self) -> None:
+        """移除超過保留時間的已完成任務"""
+        cutoff = time.time() - self._result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in (JOB_SUCCEEDED, JOB_FAILED) and job.updated_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class SqliteJobQueue(BaseJobQueue):
+    """
+    以SQLite保存的任務佇列，可在重新啟動後繼續處理未完成的任務
+
+    多個程序（例如多個 uvicorn worker）可共用同一個資料庫：取出任務時以條件更新確保只有一個程序取得，
+    執行中的任務帶有擁有者與租約，由背景執行緒定期續約；只有租約過期（擁有者已停止）的任務才重新排入佇列
+    """
+
+    persistent = True
+
+    def __init__(self, db_path: str, max_size: int, result_ttl: float, poll_interval: float = 0.5,
+                 lease_seconds: float = 60):
+        self._max_size = max_size
+        self._result_ttl = result_ttl
+        self._poll_interval = poll_interval
+        self._lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT,
+                lease_until REAL
+            )"""
+        )
+        # 舊版資料庫沒有擁有者與租約欄位（其中執行中的任務視為租約已過期）
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._renew_loop, name="job-lease", daemon=True)
+        self._heartbeat.start()
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            self._conn.commit()
+            return rows
+
+    def _put(self, job: Job) -> None:
+        with self._lock:
+            cutoff = time.time() - self._result_ttl
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (JOB_SUCCEEDED, JOB_FAILED, cutoff)
+            )
+            (queued,) = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (JOB_QUEUED,)
+            ).fetchone()
+            if queued >= self._max_size:
+                self._conn.commit()
+                raise QueueFullError("任務佇列已滿")
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, status, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job.job_id, job.status, json.dumps(asdict(job), ensure_ascii=False),
+                 job.created_at, job.updated_at)
+            )
+            self._conn.commit()
+
+    def _claim(self) -> Optional[Job]:
+        """
+        取出最舊的待處理任務並標記為執行中
+
+        先將租約過期的執行中任務重新排入佇列；以 status 仍為 queued 作為更新條件，
+        其他程序已先取得同一個任務時改取下一個
+        """
+        with self._lock:
+            now = time.time()
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL "
+                "WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (JOB_QUEUED, JOB_RUNNING, now)
+            ).rowcount
+            if requeued:
+                logger.warning(f"{requeued} 個執行中任務的租約已過期，重新排入佇列")
+            while True:
+                row = self._conn.execute(
+                    "SELECT job_id, data FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                    (JOB_QUEUED,)
+                ).fetchone()
+                if row is None:
+                    self._conn.commit()
+                    return None
+                claimed = self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, lease_until = ? WHERE job_id = ? AND status = ?",
+                    (JOB_RUNNING, self.owner, now + self._lease_seconds, row[0], JOB_QUEUED)
+                ).rowcount
+                self._conn.commit()
+                if claimed:
+                    return Job(**json.loads(row[1]))
+
+    def _renew_loop(self) -> None:
+        """定期延長本程序執行中任務的租約"""
+        while not self._stop.wait(self._lease_seconds / 3):
+            try:
+                self._execute(
+                    "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = ?",
+                    (time.time() + self._lease_seconds, self.owner, JOB_RUNNING)
+                )
+            except Exception as e:
+                logger.error(f"延長任務租約時出錯: {str(e)}")
+
+    async def put(self, job: Job) -> None:
+        await run_blocking(self._put, job)
+
+    async def get(self) -> Job:
+        while True:
+            job = await run_blocking(self._claim)
+            if job is not None:
+                return job
+            await asyncio.sleep(self._poll_interval)
+
+    async def save(self, job: Job) -> None:
+        # 只更新本程序持有的任務，租約過期後已由其他程序取得的任務不覆寫
+        job.updated_at = time.time()
+        await run_blocking(
+            self._execute,
+            "UPDATE jobs SET status = ?, data = ?, updated_at = ? WHERE job_id = ? AND (owner IS NULL OR owner = ?)",
+            (job.status, json.dumps(asdict(job), ensure_ascii=False), job.updated_at, job.job_id, self.owner)
+        )
+
+    async def load(self, job_id: str) -> Optional[Job]:
+        rows = await run_blocking(self._execute, "SELECT data FROM jobs WHERE job_id = ?", (job_id,))
+        return Job(**json.loads(rows[0][0])) if rows else None
+
+    def close(self) -> None:
+        """停止續約，並將本程序中斷的任務立即交還佇列（不等待租約過期）"""
+        self._stop.set()
+        self._heartbeat.join()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL WHERE owner = ? AND status = ?",
+                (JOB_QUEUED, self.owner, JOB_RUNNING)
+            )
+            self._conn.commit()
+            self._conn.close()
+
+
+def create_job_queue() -> BaseJobQueue:
+    """依設定建立任務佇列"""
+    backend = settings.JOB_QUEUE_BACKEND.lower()
+    if backend == "sqlite":
+        return SqliteJobQueue(settings.JOB_SQLITE_PATH, settings.JOB_QUEUE_MAX_SIZE, settings.JOB_RESULT_TTL,
+                              lease_seconds=settings.JOB_LEASE_SECONDS)
+    if backend != "memory":
+        logger.warning(f"未知的任務佇列類型 {backend}，改用記憶體佇列")
+    return InMemoryJobQueue(settings.JOB_QUEUE_MAX_SIZE, settings.JOB_RESULT_TTL)
+
+
+class JobManager:
+    """管理任務佇列與固定數量的背景工作者"""
+
+    def __init__(self):
+        self.queue: Optional[BaseJobQueue] = None
+        self._workers: List[asyncio.Task] = []
+        # 執行中的任務，進度只在記憶體中更新，結束時才寫回佇列
+        self._running: Dict[str, Job] = {}
+
+    async def start(self, queue: Optional[BaseJobQueue] = None, workers: Optional[int] = None) -> None:
+        """建立佇列並啟動工作者"""
+        self.queue = queue or create_job_queue()
+        count = workers or settings.JOB_WORKERS
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(count)]
+        logger.info(f"已啟動 {count} 個任務工作者")
+
+    async def stop(self) -> None:
+        """停止工作者並關閉佇列"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self.queue is not None:
+            self.queue.close()
+            self.queue = None
+
+    async def submit(self, files: List[str], workspace: str, prompt: Optional[str] = None,
+                     use_cache: bool = True) -> Job:
+        """
+        建立並排入新任務
+
+        Args:
+            files: 已保存在工作目錄中的檔案路徑
+            workspace: 任務專屬的工作目錄，任務結束後刪除
+            prompt: 可選的自定義提示詞
+            use_cache: 是否使用LLM回應快取
+
+        Returns:
+            新建立的任務
+        """
+        if self.queue is None:
+            raise RuntimeError("任務管理器尚未啟動")
+        job = Job(job_id=uuid.uuid4().hex, files=files, workspace=workspace, prompt=prompt,
+                  use_cache=use_cache)
+        job.progress = {f"extract:{f.rsplit('/', 1)[-1]}": "pending" for f in files}
+        job.progress["llm"] = "pending"
+        job.progress["save"] = "pending"
+        await self.queue.put(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """依ID查詢任務"""
+        if job_id in self._running:
+            return self._running[job_id]
+        if self.queue is None:
+            return None
+        return await self.queue.load(job_id)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self.queue.get()
+            await self._run(job)
+
+    async def _run(self, job: Job) -> None:
+        """
+        執行提取 → LLM → 保存報告的完整管線
+
+        應用程式關閉時（工作者被取消）可續行的佇列保留工作目錄，重新啟動後再次執行；
+        工作目錄已不存在的任務（例如記憶體佇列的資料已清除）直接標記為失敗，不以缺少的檔案生成報告
+        """
+        job.status = JOB_RUNNING
+        self._running[job.job_id] = job
+        await self.queue.save(job)
+
+        def on_progress(stage: str, status: str) -> None:
+            job.progress[stage] = status
+
+        missing = [os.path.basename(path) for path in job.files if not os.path.isfile(path)]
+        if missing:
+            logger.error(f"任務 {job.job_id} 的上傳檔案已不存在: {', '.join(missing)}")
+            job.status = JOB_FAILED
+            job.error = f"上傳檔案已不存在，請重新送出: {', '.join(missing)}"
+            remove_workspace(job.workspace)
+            await self.queue.save(job)
+            self._running.pop(job.job_id, None)
+            return
+
+        try:
+            tasks = [(registry.create_for_path(path), path) for path in job.files]
+            result = await generate_report(tasks, job.prompt, on_progress, use_cache=job.use_cache,
+                                           request_id=job.job_id)
+            job.result = result
+            if result.get("status") == "success":
+                job.status = JOB_SUCCEEDED
+            else:
+                job.status = JOB_FAILED
+                job.error = result.get("error")
+        except asyncio.CancelledError:
+            # 應用程式關閉：可續行的佇列於關閉時將任務交還（或租約過期後由其他程序取得），需保留上傳的檔案
+            self._running.pop(job.job_id, None)
+            if not self.queue.persistent:
+                remove_workspace(job.workspace)
+            raise
+        except Exception as e:
+            logger.error(f"執行任務 {job.job_id} 時出錯: {str(e)}")
+            job.status = JOB_FAILED
+            job.error = str(e)
+        remove_workspace(job.workspace)
+        await self.queue.save(job)
+        self._running.pop(job.job_id, None)
+
+
+# 全域任務管理器，由應用程式啟動時開始運作
+job_manager = JobManager()
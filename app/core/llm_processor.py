@@ -1,12 +1,17 @@
-import os
+import asyncio
 import logging
-import time
-from pathlib import Path
-from datetime import datetime
-from typing import Optional, Dict, Any, List
-from openai import OpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
 from dotenv import load_dotenv
+from app.config import settings
+from app.core.cache import get_response_cache, make_key
+from app.core.clients import clients
+from app.core.executor import run_blocking
+from app.core.metrics import count_bytes, timed
+from app.core.report_formatter import ReportFormatter
+from app.core.report_store import get_report_store, report_path
+from app.core.scheduler import scheduler, estimate_tokens
+from app.core.token_budget import count_tokens, input_budget, split_by_budget
+from app.core.usage import TokenUsage, gemini_usage, openai_usage, record_usage
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,6 +20,26 @@ logger = logging.getLogger(__name__)
 # 加載環境變數
 load_dotenv()
 
+# 報告標題
+REPORT_HEADER = "# AI 醫生診前報告\n\n"
+
+# 固定的系統角色說明（放在提示詞之前，構成可快取的前綴）
+SYSTEM_PROMPT = "You are a professional medical assistant."
+
+# 各選項實際使用的模型名稱
+OPENAI_MODEL = "gpt-4o-mini"
+GEMINI_MODEL = "gemini-2.0-flash"
+
+# 輸入超過權杖預算時，分塊摘要（map）使用的提示詞
+MAP_PROMPT = """以下是客戶資料的其中一部分（問卷、營養諮詢逐字稿或其他文件）。
+請摘錄其中所有可能用於醫生診前報告的事實，包括預約動機、個人與家族病史、肥胖與減重經驗、用藥、健檢數據、飲食與生活習慣、挑戰與目標。
+保留原本的數字、日期、藥名與客戶的用語，不要推測或補充資料中沒有的內容；與上述主題無關的寒暄可以省略。
+以條列方式輸出，並註明每項資訊來自哪個檔案。"""
+
+
+class LLMProviderError(Exception):
+    """LLM服務呼叫失敗（重試後仍失敗或未設定金鑰）"""
+
 class LLMProcessor:
     """
     使用大型語言模型(LLM)處理文本的處理器
@@ -23,144 +48,216 @@ class LLMProcessor:
     def __init__(self):
         """初始化LLM處理器"""
         # 確保必要的API金鑰設置
-        self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.google_api_key = os.getenv("GOOGLE_API_KEY")
-        self.openai_client = self._initialize_openai_client() if self.openai_api_key else None
-        
-        # 報告儲存目錄
-        self.reports_dir = "./reports"
-        self._ensure_directory_exists(self.reports_dir)
+        self.openai_api_key = settings.OPENAI_API_KEY
+        self.google_api_key = settings.GOOGLE_API_KEY
         
         # 定義報告格式化的關鍵詞
         self.section_keywords = ["基本信息", "健康状况", "飲食習慣", "挑戰與目標", "總結", "結論", "建議"]
 
-    def _initialize_openai_client(self) -> Optional[OpenAI]:
-        """初始化OpenAI客戶端"""
-        try:
-            return OpenAI(api_key=self.openai_api_key)
-        except Exception as e:
-            logger.error(f"初始化OpenAI客戶端時出錯: {str(e)}")
-            return None
-            
-    def _ensure_directory_exists(self, directory_path: str) -> bool:
-        """確保指定的目錄存在，如果不存在則創建它"""
+    def _openai_client(self):
+        """
+        取得目前事件迴圈共用的非同步OpenAI客戶端（keep-alive連線池，不在每個請求重新建立）
+
+        需在事件迴圈中呼叫：非同步客戶端綁定建立時的迴圈，process 等同步介面每次以 asyncio.run 建立新的迴圈
+        """
+        if not self.openai_api_key:
+            raise LLMProviderError("OpenAI客戶端未初始化，請檢查API金鑰")
         try:
-            Path(directory_path).mkdir(parents=True, exist_ok=True)
-            return True
+            client = clients.async_openai()
         except Exception as e:
-            logger.error(f"創建目錄 {directory_path} 時出錯: {str(e)}")
-            return False
+            raise LLMProviderError(f"初始化OpenAI客戶端時出錯: {str(e)}")
+        if client is None:
+            raise LLMProviderError("OpenAI客戶端未初始化，請檢查API金鑰")
+        return client
             
-    def _save_report(self, report: str, identifier: str = "report") -> Optional[str]:
-        """保存生成的報告到文件"""
+    def _save_report(self, report: str, model_choice: str, text_content: str, usage: TokenUsage,
+                     patient_id: Optional[str] = None, request_id: Optional[str] = None) -> Optional[str]:
+        """保存生成的報告到報告庫（背景寫入，不等待磁碟），返回報告ID"""
         try:
-            # 創建帶有時間戳的文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{self.reports_dir}/{identifier}_{timestamp}.md"
+            with timed("save"):
+                report_id = get_report_store().save(
+                    report, patient_id=patient_id, request_id=request_id, model=model_choice,
+                    input_hash=make_key(text_content), usage=usage.to_dict()
+                )
+            count_bytes("report", len(report.encode('utf-8')))
             
-            # 保存報告
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(report)
-                
-            logger.info(f"報告已儲存到 {filename}")
-            return filename
+            logger.info(f"報告已儲存，ID: {report_id}")
+            return report_id
         except Exception as e:
             logger.error(f"儲存報告時出錯: {str(e)}")
             return None
     
-    def _process_with_openai(self, text_content: str, prompt: str, 
-                            model: str = "gpt-4o-mini", retry_count: int = 3) -> str:
-        """使用OpenAI模型處理文本，帶有重試邏輯"""
-        if not self.openai_client:
-            return "OpenAI客戶端未初始化，請檢查API金鑰"
-            
-        for attempt in range(retry_count):
-            try:
-                logger.info(f"使用OpenAI處理中 (嘗試 {attempt+1}/{retry_count})")
-                response = self.openai_client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": "You are a professional medical assistant."},
-                        {"role": "user", "content": f"{prompt}\n\n{text_content}"}
-                    ]
-                )
-                result = response.choices[0].message.content
-                logger.info("OpenAI處理成功")
-                return result
-            except Exception as e:
-                logger.error(f"OpenAI處理時出錯 (嘗試 {attempt+1}): {str(e)}")
-                if attempt < retry_count - 1:
-                    # 指數退避策略
-                    wait_time = 2 ** attempt
-                    logger.info(f"{wait_time} 秒後重試...")
-                    time.sleep(wait_time)
-                else:
-                    return f"OpenAI處理時出錯 (嘗試 {retry_count} 次): {str(e)}"
+    def _system_prompt(self, prompt: str) -> str:
+        """固定的系統指示：不隨病患改變，讓服務提供者的前綴快取可以命中"""
+        return f"{SYSTEM_PROMPT}\n\n{prompt}"
+    
+    def _messages(self, text_content: str, prompt: str) -> List[Dict[str, str]]:
+        """組合OpenAI聊天訊息：指示放在固定的系統訊息，病患資料放在最後的使用者訊息"""
+        return [
+            {"role": "system", "content": self._system_prompt(prompt)},
+            {"role": "user", "content": text_content}
+        ]
+    
+    def _gemini_messages(self, text_content: str, prompt: str) -> List[tuple]:
+        """組合Gemini訊息，結構同 _messages"""
+        return [("system", self._system_prompt(prompt)), ("human", text_content)]
+    
+    async def _process_with_openai(self, text_content: str, prompt: str, 
+                                   model: str = OPENAI_MODEL, retry_count: int = 3,
+                                   usage: Optional[TokenUsage] = None) -> str:
+        """使用OpenAI模型處理文本，由共用排程器負責限速與重試"""
+        client = self._openai_client()
+        
+        logger.info("使用OpenAI處理中")
+        try:
+            response = await scheduler.call(
+                "openai",
+                lambda: client.chat.completions.create(
+                    model=model, messages=self._messages(text_content, prompt)
+                ),
+                estimated_tokens=estimate_tokens(prompt, text_content),
+                retry_count=retry_count
+            )
+        except Exception as e:
+            raise LLMProviderError(f"OpenAI處理時出錯: {str(e)}")
+        record_usage("openai", openai_usage(response.usage), usage)
+        logger.info("OpenAI處理成功")
+        return response.choices[0].message.content
     
-    def _process_with_gemini(self, text_content: str, prompt: str, 
-                            model: str = "gemini-2.0-flash", retry_count: int = 3) -> str:
-        """使用Gemini模型處理文本，帶有重試邏輯"""
+    async def _process_with_gemini(self, text_content: str, prompt: str, 
+                                   model: str = GEMINI_MODEL, retry_count: int = 3,
+                                   usage: Optional[TokenUsage] = None) -> str:
+        """使用Gemini模型處理文本，由共用排程器負責限速與重試"""
         if not self.google_api_key:
-            return "Google API金鑰未設置，請檢查環境變數"
+            raise LLMProviderError("Google API金鑰未設置，請檢查環境變數")
+        
+        logger.info("使用Gemini處理中")
+        try:
+            llm = clients.gemini(model)
+            result = await scheduler.call(
+                "gemini",
+                lambda: llm.ainvoke(self._gemini_messages(text_content, prompt)),
+                estimated_tokens=estimate_tokens(prompt, text_content),
+                retry_count=retry_count
+            )
+        except Exception as e:
+            raise LLMProviderError(f"Gemini處理時出錯: {str(e)}")
+        record_usage("gemini", gemini_usage(getattr(result, "usage_metadata", None)), usage)
+        logger.info("Gemini處理成功")
+        return result.content
+    
+    async def _stream_with_openai(self, text_content: str, prompt: str,
+                                  model: str = OPENAI_MODEL, retry_count: int = 3,
+                                  usage: Optional[TokenUsage] = None) -> AsyncIterator[str]:
+        """使用OpenAI串流API逐段產生回應，只在尚未收到任何內容時重試"""
+        client = self._openai_client()
+        
+        async def open_stream() -> AsyncIterator[str]:
+            stream = await client.chat.completions.create(
+                model=model, messages=self._messages(text_content, prompt), stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                # 最後一個片段只帶有用量資訊
+                if getattr(chunk, "usage", None):
+                    record_usage("openai", openai_usage(chunk.usage), usage)
+        
+        logger.info("使用OpenAI串流處理中")
+        try:
+            async for token in scheduler.stream("openai", open_stream,
+                                                estimated_tokens=estimate_tokens(prompt, text_content),
+                                                retry_count=retry_count):
+                yield token
+        except Exception as e:
+            raise LLMProviderError(f"OpenAI串流處理時出錯: {str(e)}")
+        logger.info("OpenAI串流處理成功")
+    
+    async def _stream_with_gemini(self, text_content: str, prompt: str,
+                                  model: str = GEMINI_MODEL, retry_count: int = 3,
+                                  usage: Optional[TokenUsage] = None) -> AsyncIterator[str]:
+        """使用Gemini串流逐段產生回應，只在尚未收到任何內容時重試"""
+        if not self.google_api_key:
+            raise LLMProviderError("Google API金鑰未設置，請檢查環境變數")
+        
+        async def open_stream() -> AsyncIterator[str]:
+            totals = None
+            async for chunk in clients.gemini(model).astream(self._gemini_messages(text_content, prompt)):
+                if chunk.content:
+                    yield chunk.content
+                # 用量資訊分散在各片段，串流結束後合計記錄一次
+                values = gemini_usage(getattr(chunk, "usage_metadata", None))
+                if values:
+                    totals = values if totals is None else tuple(a + b for a, b in zip(totals, values))
+            record_usage("gemini", totals, usage)
+        
+        logger.info("使用Gemini串流處理中")
+        try:
+            async for token in scheduler.stream("gemini", open_stream,
+                                                estimated_tokens=estimate_tokens(prompt, text_content),
+                                                retry_count=retry_count):
+                yield token
+        except Exception as e:
+            raise LLMProviderError(f"Gemini串流處理時出錯: {str(e)}")
+        logger.info("Gemini串流處理成功")
+    
+    async def _call_model(self, text_content: str, prompt: str, model_choice: str,
+                          usage: Optional[TokenUsage] = None) -> str:
+        """以選定的模型處理文本"""
+        if model_choice == "OpenAI-4o-mini":
+            return await self._process_with_openai(text_content, prompt, usage=usage)
+        return await self._process_with_gemini(text_content, prompt, usage=usage)
+    
+    async def _fit_to_budget(self, text_content: str, prompt: str, model_choice: str,
+                             usage: Optional[TokenUsage] = None) -> Tuple[str, int]:
+        """
+        讓輸入符合單次請求的權杖預算
+        
+        未超過預算時原樣返回；否則依檔案標題與段落切塊，同時摘要各塊（map），
+        以摘要取代原文作為報告的輸入（reduce）。摘要後仍超過預算時再摘要一次，最多 LLM_MAX_REDUCE_ROUNDS 次
+        
+        Args:
+            text_content: 合併後的文本內容
+            prompt: 生成報告的提示詞
+            model_choice: 選擇的模型
+            usage: 用量累計，摘要呼叫的用量也計入
             
-        for attempt in range(retry_count):
-            try:
-                logger.info(f"使用Gemini處理中 (嘗試 {attempt+1}/{retry_count})")
-                llm = ChatGoogleGenerativeAI(model=model, google_api_key=self.google_api_key)
-                result = llm.invoke(f"{prompt}\n\n{text_content}")
-                logger.info("Gemini處理成功")
-                return result.content
-            except Exception as e:
-                logger.error(f"Gemini處理時出錯 (嘗試 {attempt+1}): {str(e)}")
-                if attempt < retry_count - 1:
-                    # 指數退避策略
-                    wait_time = 2 ** attempt
-                    logger.info(f"{wait_time} 秒後重試...")
-                    time.sleep(wait_time)
-                else:
-                    return f"Gemini處理時出錯 (嘗試 {retry_count} 次): {str(e)}"
+        Returns:
+            (交給模型的文本, 摘要的區塊總數)
+        """
+        model = OPENAI_MODEL if model_choice == "OpenAI-4o-mini" else GEMINI_MODEL
+        budget = input_budget(model, prompt)
+        chunk_budget = min(settings.LLM_MAP_CHUNK_TOKENS, input_budget(model, MAP_PROMPT))
+        semaphore = asyncio.Semaphore(settings.LLM_MAP_MAX_CONCURRENCY)
+        
+        async def summarize(chunk: str) -> str:
+            async with semaphore:
+                return await self._call_model(chunk, MAP_PROMPT, model_choice, usage)
+        
+        map_chunks = 0
+        for _ in range(settings.LLM_MAX_REDUCE_ROUNDS):
+            # 大型輸入的權杖計算與切塊佔用CPU，在執行緒池執行
+            tokens = await run_blocking(count_tokens, text_content, model)
+            if tokens <= budget:
+                break
+            chunks = await run_blocking(split_by_budget, text_content, chunk_budget, model)
+            logger.info(f"輸入約 {tokens} 個權杖，超過預算 {budget}，分為 {len(chunks)} 塊同時摘要")
+            summaries = await asyncio.gather(*(summarize(chunk) for chunk in chunks))
+            map_chunks += len(chunks)
+            text_content = "\n\n".join(
+                f"# 摘要 {i+1}/{len(summaries)}\n\n{summary.strip()}" for i, summary in enumerate(summaries)
+            )
+        return text_content, map_chunks
+    
+    def _formatter(self) -> ReportFormatter:
+        """建立報告格式化器（串流時每個回應各用一個）"""
+        return ReportFormatter(self.section_keywords, header=REPORT_HEADER)
     
     def _format_report(self, text: str) -> str:
         """將AI回應格式化為結構良好的營養報告，同時保留換行符"""
-        # 添加具有獨特樣式的標題
-        formatted_text = "# AI 醫生診前報告\n\n"
-        
-        # 逐行處理文本以維持結構並添加格式
-        lines = text.split('\n')
-        current_section = ""
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                formatted_text += "\n"  # 保留空行以進行間隔
-                continue
-                
-            # 檢查此行是否為小節標題
-            is_section = False
-            for keyword in self.section_keywords:
-                if keyword in line and len(line) < 30:
-                    # 這可能是一個小節標題
-                    current_section = line
-                    formatted_text += f"\n## {line}\n\n"
-                    is_section = True
-                    break
-                    
-            if not is_section:
-                # 格式化鍵值對（帶有冒號的項目）
-                if ":" in line or "：" in line:
-                    parts = line.split(":", 1) if ":" in line else line.split("：", 1)
-                    if len(parts) == 2 and len(parts[0]) < 20:  # 鍵值對
-                        key = parts[0].strip()
-                        value = parts[1].strip()
-                        formatted_text += f"**{key}**：{value}\n\n"
-                    else:
-                        # 帶有冒號但不是鍵值對的常規行
-                        formatted_text += f"{line}\n\n"
-                else:
-                    # 常規文本行
-                    formatted_text += f"{line}\n\n"
-                    
-        return formatted_text
+        with timed("format"):
+            return self._formatter().format(text)
     
     def get_default_prompt(self) -> str:
         """獲取默認提示詞"""
@@ -212,8 +309,26 @@ class LLMProcessor:
 請以中英文兩個版本作答。
 """
     
+    @staticmethod
+    async def _replay(response: str) -> AsyncIterator[str]:
+        """將快取的完整回應當作單一片段的串流"""
+        yield response
+    
+    def _cache_key(self, text_content: str, prompt: str, model_choice: str) -> str:
+        """以 (模型選項, 模型名稱, 提示詞雜湊, 文本雜湊) 產生回應快取鍵"""
+        model = OPENAI_MODEL if model_choice == "OpenAI-4o-mini" else GEMINI_MODEL
+        return make_key(model_choice, model, make_key(prompt), make_key(text_content))
+    
     def process(self, text_content: str, prompt: Optional[str] = None, 
-               model_choice: str = "OpenAI-4o-mini") -> Dict[str, Any]:
+               model_choice: str = "OpenAI-4o-mini", use_cache: bool = True) -> Dict[str, Any]:
+        """
+        aprocess 的同步版本，供沒有事件迴圈的呼叫端使用（不可在事件迴圈中呼叫）
+        """
+        return asyncio.run(self.aprocess(text_content, prompt, model_choice, use_cache))
+    
+    async def aprocess(self, text_content: str, prompt: Optional[str] = None, 
+                       model_choice: str = "OpenAI-4o-mini", use_cache: bool = True,
+                       patient_id: Optional[str] = None, request_id: Optional[str] = None) -> Dict[str, Any]:
         """
         使用LLM處理文本並生成報告
         
@@ -221,6 +336,9 @@ class LLMProcessor:
             text_content: 合併後的文本內容
             prompt: 可選的自定義提示詞
             model_choice: 選擇的模型 ("OpenAI-4o-mini" 或 "Gemini")
+            use_cache: 是否使用回應快取，False時一定呼叫模型
+            patient_id: 病患識別碼（保存於報告索引）
+            request_id: 請求或任務識別碼（保存於報告索引）
             
         Returns:
             包含處理結果的字典
@@ -231,26 +349,44 @@ class LLMProcessor:
             # 使用默認提示詞（如果未提供）
             if not prompt:
                 prompt = self.get_default_prompt()
-                
-            # 使用選定的AI模型進行處理
-            if model_choice == "OpenAI-4o-mini":
-                result = self._process_with_openai(text_content, prompt)
-            else:  # Gemini
-                result = self._process_with_gemini(text_content, prompt)
+            
+            # 相同的模型、提示詞與文本直接使用快取的模型回應（快取與報告庫的讀寫在執行緒池執行）
+            cache = await run_blocking(get_response_cache) if use_cache else None
+            cache_key = self._cache_key(text_content, prompt, model_choice) if cache else None
+            result = await run_blocking(cache.get, cache_key) if cache else None
+            cached = result is not None
+            
+            map_chunks = 0
+            usage = TokenUsage()
+            if cached:
+                logger.info("使用快取的模型回應")
+            else:
+                # 超過權杖預算時先分塊摘要，再以選定的AI模型生成報告
+                model_input, map_chunks = await self._fit_to_budget(text_content, prompt, model_choice, usage)
+                result = await self._call_model(model_input, prompt, model_choice, usage)
+            
+            # 只快取成功的模型回應（未格式化），命中時同樣經過格式化
+            if cache and not cached and result:
+                await run_blocking(cache.set, cache_key, result)
                 
             # 格式化結果
             formatted_report = self._format_report(result)
             
-            # 保存報告到文件
-            report_path = self._save_report(formatted_report)
+            # 保存報告到報告庫
+            report_id = await run_blocking(self._save_report, formatted_report, model_choice, text_content, usage,
+                                           patient_id=patient_id, request_id=request_id)
             
             logger.info("資料處理成功完成")
             
             return {
                 "status": "success",
                 "model_used": model_choice,
+                "cached": cached,
+                "map_chunks": map_chunks,
+                "usage": usage.to_dict(),
                 "report": formatted_report,
-                "report_path": report_path
+                "report_id": report_id,
+                "report_path": report_path(report_id)
             }
             
         except Exception as e:
@@ -262,10 +398,128 @@ class LLMProcessor:
                 "error": error_message
             }
             
+    async def stream(self, text_content: str, prompt: Optional[str] = None,
+                     model_choice: str = "OpenAI-4o-mini", use_cache: bool = True,
+                     patient_id: Optional[str] = None, request_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        以串流方式處理文本，邊接收模型輸出邊格式化
+        
+        Args:
+            text_content: 合併後的文本內容
+            prompt: 可選的自定義提示詞
+            model_choice: 選擇的模型 ("OpenAI-4o-mini" 或 "Gemini")
+            use_cache: 是否使用回應快取
+            patient_id: 病患識別碼（保存於報告索引）
+            request_id: 請求或任務識別碼（保存於報告索引）
+            
+        Yields:
+            事件字典：{"event": "token", "text": 模型輸出片段}、
+            {"event": "report", "text": 格式化後的片段}，最後為 {"event": "done", "result": 與 process 相同的結果}；
+            輸入超過權杖預算而先分塊摘要時，串流開始前另有 {"event": "summarized", "chunks": 區塊數}
+        """
+        try:
+            logger.info(f"開始使用 {model_choice} 串流處理資料")
+            
+            # 使用默認提示詞（如果未提供）
+            if not prompt:
+                prompt = self.get_default_prompt()
+            
+            cache = await run_blocking(get_response_cache) if use_cache else None
+            cache_key = self._cache_key(text_content, prompt, model_choice) if cache else None
+            cached_response = await run_blocking(cache.get, cache_key) if cache else None
+            cached = cached_response is not None
+            
+            map_chunks = 0
+            usage = TokenUsage()
+            if cached:
+                logger.info("使用快取的模型回應")
+                tokens = self._replay(cached_response)
+            else:
+                # 超過權杖預算時先分塊摘要，只串流最後的報告生成
+                model_input, map_chunks = await self._fit_to_budget(text_content, prompt, model_choice, usage)
+                if map_chunks:
+                    yield {"event": "summarized", "chunks": map_chunks}
+                if model_choice == "OpenAI-4o-mini":
+                    tokens = self._stream_with_openai(model_input, prompt, usage=usage)
+                else:  # Gemini
+                    tokens = self._stream_with_gemini(model_input, prompt, usage=usage)
+            
+            # 轉發每個模型輸出片段，並在每收到完整的一行時產生格式化結果
+            # （所有格式化片段串接後與 _format_report 的結果相同）
+            formatter = self._formatter()
+            raw_parts = []
+            report_parts = [REPORT_HEADER]
+            yield {"event": "report", "text": REPORT_HEADER}
+            async for token in tokens:
+                raw_parts.append(token)
+                yield {"event": "token", "text": token}
+                piece = formatter.feed(token)
+                if piece:
+                    report_parts.append(piece)
+                    yield {"event": "report", "text": piece}
+            piece = formatter.flush()
+            report_parts.append(piece)
+            yield {"event": "report", "text": piece}
+            
+            response = "".join(raw_parts)
+            if cache and not cached and response:
+                await run_blocking(cache.set, cache_key, response)
+            
+            # 保存完整的格式化報告
+            formatted_report = "".join(report_parts)
+            report_id = await run_blocking(self._save_report, formatted_report, model_choice, text_content, usage,
+                                           patient_id=patient_id, request_id=request_id)
+            
+            logger.info("串流處理成功完成")
+            yield {"event": "done", "result": {
+                "status": "success",
+                "model_used": model_choice,
+                "cached": cached,
+                "map_chunks": map_chunks,
+                "usage": usage.to_dict(),
+                "report": formatted_report,
+                "report_id": report_id,
+                "report_path": report_path(report_id)
+            }}
+            
+        except Exception as e:
+            logger.error(f"串流處理資料時出錯: {str(e)}")
+            yield {"event": "done", "result": {
+                "status": "error",
+                "error": f"處理資料時出錯: {str(e)}"
+            }}
+            
+    async def abatch_process(self, text_contents: List[str], prompt: Optional[str] = None,
+                             model_choice: str = "OpenAI-4o-mini", use_cache: bool = True,
+                             max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        同時處理多個文本，以信號量限制並行數；單一文本失敗只影響該筆結果
+        
+        Args:
+            text_contents: 文本內容列表
+            prompt: 可選的自定義提示詞
+            model_choice: 選擇的模型
+            use_cache: 是否使用回應快取
+            max_concurrency: 最多同時處理的文本數，預設使用 BATCH_MAX_CONCURRENCY
+            
+        Returns:
+            與輸入順序相同的結果字典列表
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or settings.BATCH_MAX_CONCURRENCY)
+        
+        async def run(index: int, content: str) -> Dict[str, Any]:
+            async with semaphore:
+                logger.info(f"處理第 {index+1}/{len(text_contents)} 個文本")
+                result = await self.aprocess(content, prompt, model_choice, use_cache=use_cache)
+            result["index"] = index + 1
+            return result
+        
+        return list(await asyncio.gather(*(run(i, content) for i, content in enumerate(text_contents))))
+    
     def batch_process(self, text_contents: List[str], prompt: Optional[str] = None, 
                      model_choice: str = "OpenAI-4o-mini") -> List[Dict[str, Any]]:
         """
-        批量處理多個文本並生成多份報告
+        批量處理多個文本並生成多份報告（同步介面，內部並行處理）
         
         Args:
             text_contents: 文本內容列表
@@ -275,12 +529,38 @@ class LLMProcessor:
         Returns:
             包含處理結果的字典列表
         """
-        results = []
+        return asyncio.run(self.abatch_process(text_contents, prompt, model_choice))
+    
+    def batch_request(self, custom_id: str, text_content: str, prompt: Optional[str] = None,
+                      model_choice: str = "OpenAI-4o-mini") -> Dict[str, Any]:
+        """
+        組成服務提供者離線批次檔案（JSONL）中的一行請求
         
-        for i, content in enumerate(text_contents):
-            logger.info(f"處理第 {i+1}/{len(text_contents)} 個文本")
-            result = self.process(content, prompt, model_choice)
-            result["index"] = i + 1
-            results.append(result)
+        OpenAI 使用 Batch API 的 custom_id/method/url/body 格式，
+        Gemini 使用批次模式的 key/request 格式
+        
+        Args:
+            custom_id: 請求識別碼，批次結果以此對應回病患
+            text_content: 合併後的文本內容
+            prompt: 可選的自定義提示詞
+            model_choice: 選擇的模型
             
-        return results
+        Returns:
+            單行請求字典
+        """
+        if not prompt:
+            prompt = self.get_default_prompt()
+        if model_choice == "OpenAI-4o-mini":
+            return {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": OPENAI_MODEL, "messages": self._messages(text_content, prompt)}
+            }
+        return {
+            "key": custom_id,
+            "request": {
+                "system_instruction": {"parts": [{"text": self._system_prompt(prompt)}]},
+                "contents": [{"role": "user", "parts": [{"text": text_content}]}]
+            }
+        }
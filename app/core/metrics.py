@@ -0,0 +1,440 @@
+import contextvars
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 階段耗時直方圖的分界（秒），涵蓋毫秒級的格式化到數分鐘的轉錄
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """組成 {a="x",b="y"} 形式的標籤字串"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+_INF_LABEL = 'le="+Inf"'
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    """指標基礎類別：每組標籤值各有一份數值"""
+    kind = ""
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """
+        輸出 Prometheus 文字格式
+
+        Returns:
+            HELP、TYPE 標頭與各組標籤值的樣本行
+        """
+        pass
+
+
+class Counter(_Metric):
+    """只會增加的計數"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """可增可減的目前數值"""
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, *labels: str) -> None:
+        self.inc(-amount, *labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """固定分界的直方圖（累計數量、總和與次數）"""
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # [各分界的數量（非累計）, 總和, 次數]
+                entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, (list(e[0]), e[1], e[2])) for labels, e in self._values.items()]
+        lines = self._header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, _INF_LABEL)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """收集所有指標並輸出 Prometheus 文字格式"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        # 輸出時才讀取的外部統計（例如排程器與快取），返回已格式化的行
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def counter(self, name: str, description: str, label_names: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, description, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, description: str, label_names: Sequence[str] = ()) -> Gauge:
+        metric = Gauge(name, description, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, description: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, description, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.error(f"收集指標時出錯: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "report_stage_duration_seconds", "各處理階段的耗時", ("stage", "kind")
+)
+STAGE_ERRORS = registry.counter(
+    "report_stage_errors_total", "各處理階段拋出例外的次數", ("stage", "kind")
+)
+STAGE_IN_FLIGHT = registry.gauge(
+    "report_stage_in_flight", "目前執行中的階段數", ("stage",)
+)
+BYTES_TOTAL = registry.counter(
+    "report_bytes_total", "處理的位元組數（upload：寫入磁碟的上傳檔案，audio：提取的音訊，report：保存的報告）", ("kind",)
+)
+AUDIO_SECONDS = registry.counter(
+    "report_audio_seconds_total", "送出轉錄的音訊秒數（sent：修剪靜音後，source：對應的原始長度）", ("kind",)
+)
+
+
+class RequestTimings:
+    """單一請求內各階段的耗時紀錄（同一請求的執行緒共用）"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._entries: List[Tuple[str, str, float]] = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, kind: str, seconds: float) -> None:
+        with self._lock:
+            self._entries.append((stage, kind, seconds))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """各次階段耗時（依完成順序）與請求總耗時；並行的階段耗時會重疊"""
+        with self._lock:
+            entries = list(self._entries)
+        return {
+            "stages": [
+                {"stage": stage, "kind": kind, "seconds": round(seconds, 4)} for stage, kind, seconds in entries
+            ],
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+        }
+
+
+# 目前請求的耗時紀錄；執行緒池中的工作需以 contextvars.copy_context 執行才看得到
+_request_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def start_request_timings() -> RequestTimings:
+    """為目前的請求開始記錄各階段耗時"""
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+
+class _Timer:
+    """記錄一個階段的耗時、錯誤與執行中數量"""
+    __slots__ = ("stage", "kind", "timings", "record", "start")
+
+    def __init__(self, stage: str, kind: str, timings: Optional[RequestTimings], record: bool):
+        self.stage = stage
+        self.kind = kind
+        self.timings = timings
+        self.record = record
+
+    def __enter__(self) -> "_Timer":
+        if self.record:
+            STAGE_IN_FLIGHT.inc(1, self.stage)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        elapsed = time.perf_counter() - self.start
+        if self.record:
+            STAGE_IN_FLIGHT.dec(1, self.stage)
+            STAGE_SECONDS.observe(elapsed, self.stage, self.kind)
+            if exc_type is not None:
+                STAGE_ERRORS.inc(1, self.stage, self.kind)
+        if self.timings is not None:
+            self.timings.add(self.stage, self.kind, elapsed)
+        return False
+
+
+class _NoopTimer:
+    """停用指標且目前請求沒有要求耗時紀錄時使用，不做任何事"""
+
+    def __enter__(self) -> "_NoopTimer":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def timed(stage: str, kind: str = ""):
+    """
+    計時一個處理階段，用法為 `with timed("extract", "json"):`
+
+    Args:
+        stage: 階段名稱
+        kind: 細分類別（檔案類型、服務提供者等）
+
+    Returns:
+        context manager；停用指標且目前請求沒有要求耗時紀錄時為共用的空操作物件
+    """
+    timings = _request_timings.get()
+    if not settings.METRICS_ENABLED and timings is None:
+        return _NOOP_TIMER
+    return _Timer(stage, kind, timings, settings.METRICS_ENABLED)
+
+
+def count_bytes(kind: str, amount: int) -> None:
+    """累計處理的位元組數"""
+    if settings.METRICS_ENABLED:
+        BYTES_TOTAL.inc(amount, kind)
+
+
+# 目前報告請求送出轉錄的音訊用量；執行緒池中的工作需以 contextvars.copy_context 執行才看得到
+_request_usage: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_usage", default=None
+)
+_usage_lock = threading.Lock()
+
+
+@contextmanager
+def track_usage() -> Iterator[Dict[str, float]]:
+    """
+    累計區塊內送出轉錄的音訊位元組數與秒數，用法為 `with track_usage() as usage:`
+
+    Yields:
+        用量字典：audio_bytes、audio_seconds、audio_source_seconds（沒有送出音訊時為空）
+    """
+    usage: Dict[str, float] = {}
+    token = _request_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _request_usage.reset(token)
+
+
+def count_audio(size: int, seconds: Optional[float], source_seconds: Optional[float]) -> None:
+    """
+    累計送出轉錄的音訊
+
+    Args:
+        size: 音訊位元組數
+        seconds: 音訊長度（修剪靜音後），無法判斷時為None
+        source_seconds: 對應的原始影片長度，無法判斷時為None
+    """
+    count_bytes("audio", size)
+    amounts = {"audio_bytes": size, "audio_seconds": seconds, "audio_source_seconds": source_seconds}
+    if settings.METRICS_ENABLED:
+        if seconds is not None:
+            AUDIO_SECONDS.inc(seconds, "sent")
+        if source_seconds is not None:
+            AUDIO_SECONDS.inc(source_seconds, "source")
+    merge_usage(amounts)
+
+
+def merge_usage(amounts: Dict[str, Optional[float]]) -> None:
+    """
+    將用量併入目前請求的累計（不計入指標），例如上傳期間在其他請求中提前轉錄的分段
+
+    Args:
+        amounts: 用量名稱 -> 數量，None表示無法判斷
+    """
+    usage = _request_usage.get()
+    if usage is not None:
+        with _usage_lock:
+            for name, amount in amounts.items():
+                if amount is not None:
+                    usage[name] = usage.get(name, 0) + amount
+
+
+def _flat_stats(prefix: str, stats: Dict[str, Any]) -> Iterable[Tuple[str, float]]:
+    """將巢狀統計字典攤平為 (名稱, 數值)"""
+    for key, value in stats.items():
+        name = f"{prefix}_{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from _flat_stats(name, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def _render_samples(samples: Dict[str, Tuple[str, List[str]]]) -> List[str]:
+    """將 名稱 -> (類型, 樣本行) 輸出為每個指標一個 TYPE 標頭"""
+    lines: List[str] = []
+    for name, (kind, rows) in samples.items():
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(rows)
+    return lines
+
+
+def _add_sample(samples: Dict[str, Tuple[str, List[str]]], name: str, kind: str,
+                label: str, value: float) -> None:
+    samples.setdefault(name, (kind, []))[1].append(f"{name}{label} {_number(value)}")
+
+
+# 排程器統計中屬於目前數值（而非累計）的欄位
+_SCHEDULER_GAUGES = {"in_flight", "max_in_flight", "prompt_cache_hit_rate"}
+
+
+def _collect_scheduler() -> List[str]:
+    """LLM排程器的請求、重試、錯誤、權杖計數與目前並行數"""
+    from app.core.scheduler import scheduler
+
+    samples: Dict[str, Tuple[str, List[str]]] = {}
+    for provider, stats in scheduler.stats().items():
+        label = _labels(("provider",), (provider,))
+        for key, value in _flat_stats("", stats):
+            if key in _SCHEDULER_GAUGES:
+                _add_sample(samples, f"llm_{key}", "gauge", label, value)
+            else:
+                _add_sample(samples, f"llm_{key}_total", "counter", label, value)
+    return _render_samples(samples)
+
+
+def _collect_caches() -> List[str]:
+    """LLM回應與轉錄快取的命中、未命中與容量"""
+    from app.core.cache import get_response_cache, get_transcription_cache
+
+    samples: Dict[str, Tuple[str, List[str]]] = {}
+    for cache_name, cache in (("llm_response", get_response_cache()), ("transcription", get_transcription_cache())):
+        if cache is None:
+            continue
+        stats = cache.stats()
+        # 兩層快取的統計依層分開，單層快取以快取類型（memory、disk）為層名
+        if all(isinstance(v, dict) for v in stats.values()):
+            layers = stats
+        else:
+            layers = {type(cache).__name__.replace("Cache", "").lower(): stats}
+        for layer, layer_stats in layers.items():
+            label = _labels(("cache", "layer"), (cache_name, layer))
+            for field, value in _flat_stats("", layer_stats):
+                if field in ("hits", "misses", "evictions"):
+                    _add_sample(samples, f"cache_{field}_total", "counter", label, value)
+                else:
+                    _add_sample(samples, f"cache_{field}", "gauge", label, value)
+    return _render_samples(samples)
+
+
+def _collect_idempotency() -> List[str]:
+    """/api/process 的冪等請求：實際執行、合併、重播與鍵衝突的次數，以及執行中與保留的結果數"""
+    from app.core.idempotency import idempotency
+
+    samples: Dict[str, Tuple[str, List[str]]] = {}
+    for field, value in idempotency.stats().items():
+        if field in ("in_flight", "stored"):
+            _add_sample(samples, f"report_idempotency_{field}", "gauge", "", value)
+        else:
+            _add_sample(samples, "report_idempotency_requests_total", "counter",
+                        _labels(("outcome",), (field,)), value)
+    return _render_samples(samples)
+
+
+registry.add_collector(_collect_scheduler)
+registry.add_collector(_collect_caches)
+registry.add_collector(_collect_idempotency)
+
+
+def render_metrics() -> str:
+    """Prometheus 文字格式的所有指標"""
+    return registry.render()
@@ -0,0 +1,360 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.core.llm_processor import LLMProcessor
+from app.core.metrics import timed, track_usage
+from app.core import process_pool
+from app.core.executor import run_blocking
+from app.core.processors.base_processor import BaseProcessor, stage_callback
+from app.core.processors.registry import registry
+
+logger = logging.getLogger(__name__)
+
+# 進度回呼：(階段名稱, 狀態)，例如 ("extract:a.mp4", "done")
+ProgressCallback = Callable[[str, str], None]
+
+# 離線批次檔的識別碼（同時為 BATCH_OUTPUT_DIR 中不含副檔名的檔名）
+BATCH_ID_PATTERN = re.compile(r"^batch_\d{8}_\d{6}_[0-9a-f]{8}$")
+
+
+def get_processor(filename: str, head: bytes = b"") -> Optional[BaseProcessor]:
+    """
+    根據檔案名稱選擇處理器，沒有副檔名時依檔案開頭的內容判斷
+
+    處理器模組與其依賴在第一次使用時才載入（見 processors.registry）
+
+    Args:
+        filename: 上傳的檔案名稱
+        head: 檔案開頭的位元組
+
+    Returns:
+        對應的處理器，不支援的格式返回None
+    """
+    return registry.create(filename, head)
+
+
+def _notify(on_progress: Optional[ProgressCallback], stage: str, status: str) -> None:
+    """回報階段進度，回呼本身的錯誤不影響處理流程"""
+    if on_progress is None:
+        return
+    try:
+        on_progress(stage, status)
+    except Exception as e:
+        logger.error(f"回報進度時出錯: {str(e)}")
+
+
+async def extract_in_process(kind: str, file_path: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    在程序池中執行處理器，CPU密集的解析不與事件迴圈所在的程序競爭GIL
+
+    子程序讀取檔案路徑並將文本寫入工作目錄中的檔案，不以pickle傳遞大型字串
+
+    Args:
+        kind: 處理器名稱
+        file_path: 檔案路徑
+
+    Returns:
+        (提取的文本, 處理器記錄的附加資訊)，程序池異常時返回None（由呼叫端改在執行緒池處理）
+    """
+    loop = asyncio.get_running_loop()
+    output_path = process_pool.extract_output_path(file_path)
+    try:
+        info = await loop.run_in_executor(
+            process_pool.get_process_pool(), process_pool.extract_to_file, kind, file_path, output_path
+        )
+        return await run_blocking(process_pool.read_output, output_path), info
+    except BrokenProcessPool:
+        process_pool.reset_broken_pool()
+        return None
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+
+async def extract_text(processor: BaseProcessor, file_path: str,
+                       on_progress: Optional[ProgressCallback] = None) -> str:
+    """
+    執行單一處理器：PROCESS_POOL_KINDS 中的類型在程序池執行，其他在執行緒池執行
+
+    處理器內部的階段（例如MP4的轉錄完成）以 "階段:檔名" 回報為 done，回呼可能在執行緒池中呼叫
+    """
+    filename = os.path.basename(file_path)
+    stage = f"extract:{filename}"
+    logger.info(f"開始處理檔案 {filename}")
+    _notify(on_progress, stage, "running")
+    kind = registry.kind(processor)
+    with timed("extract", kind or "unknown"), \
+            stage_callback(lambda name: _notify(on_progress, f"{name}:{filename}", "done")):
+        extracted = await extract_in_process(kind, file_path) if process_pool.is_routed(kind) else None
+        if extracted is None:
+            text = await run_blocking(processor.process, file_path)
+        else:
+            # 子程序中的處理器實例不會傳回，將其記錄的資訊（例如偵測到的編碼）寫回本程序的處理器
+            text, info = extracted
+            processor.record_info(**info)
+    _notify(on_progress, stage, "done")
+    return text
+
+
+async def extract_texts(tasks: List[Tuple[BaseProcessor, str]],
+                        on_progress: Optional[ProgressCallback] = None) -> List[str]:
+    """
+    同時處理多個檔案，總耗時取決於最慢的檔案
+
+    Args:
+        tasks: (處理器, 檔案路徑) 列表
+        on_progress: 可選的進度回呼
+
+    Returns:
+        與輸入順序相同的文本列表
+    """
+    return list(await asyncio.gather(
+        *(extract_text(processor, path, on_progress) for processor, path in tasks)
+    ))
+
+
+def _file_info(tasks: List[Tuple[BaseProcessor, str]]) -> List[Dict[str, Any]]:
+    """各處理器記錄的附加資訊（例如文本檔偵測到的編碼），沒有記錄的檔案不列出"""
+    return [
+        {"file": os.path.basename(path), **processor.extraction_info()}
+        for processor, path in tasks if processor.extraction_info()
+    ]
+
+
+async def generate_report(tasks: List[Tuple[BaseProcessor, str]], prompt: Optional[str] = None,
+                          on_progress: Optional[ProgressCallback] = None,
+                          use_cache: bool = True, model_choice: str = "OpenAI-4o-mini",
+                          patient_id: Optional[str] = None, request_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    完整的報告管線：同時提取所有檔案文本，再交由LLM生成並保存報告
+
+    Args:
+        tasks: (處理器, 檔案路徑) 列表
+        prompt: 可選的自定義提示詞
+        on_progress: 可選的進度回呼
+        use_cache: 是否使用LLM回應快取
+        model_choice: 選擇的模型
+        patient_id: 病患識別碼（保存於報告索引）
+        request_id: 請求或任務識別碼（保存於報告索引）
+
+    Returns:
+        LLMProcessor.process 的結果字典；有送出音訊轉錄時另含 audio_usage（位元組數與秒數），
+        處理器有記錄附加資訊時另含 files（例如文本檔偵測到的編碼）
+    """
+    with track_usage() as usage:
+        processed_texts = await extract_texts(tasks, on_progress)
+    
+    # 合併所有處理後的文本
+    combined_text = "\n\n".join(processed_texts)
+    
+    # 使用LLM處理器生成最終報告（非同步呼叫，由共用排程器控制速率與重試）
+    _notify(on_progress, "llm", "running")
+    llm_processor = LLMProcessor()
+    result = await llm_processor.aprocess(combined_text, prompt, model_choice,
+                                          use_cache=use_cache, patient_id=patient_id, request_id=request_id)
+    if usage:
+        result["audio_usage"] = {name: round(amount, 2) for name, amount in usage.items()}
+    files = _file_info(tasks)
+    if files:
+        result["files"] = files
+    if result.get("status") != "success":
+        _notify(on_progress, "llm", "error")
+        return result
+    _notify(on_progress, "llm", "done")
+    _notify(on_progress, "save", "done" if result.get("report_path") else "error")
+    return result
+
+
+async def stream_report(tasks: List[Tuple[BaseProcessor, str]], prompt: Optional[str] = None,
+                        use_cache: bool = True, patient_id: Optional[str] = None,
+                        request_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    串流版本的報告管線，依發生順序產生各階段事件
+
+    Args:
+        tasks: (處理器, 檔案路徑) 列表
+        prompt: 可選的自定義提示詞
+        use_cache: 是否使用LLM回應快取
+        patient_id: 病患識別碼（保存於報告索引）
+        request_id: 請求識別碼（保存於報告索引）
+
+    Yields:
+        事件字典：MP4轉錄完成時的 transcribed、每個檔案完成時的 extracted，
+        之後為 LLMProcessor.stream 的 token、report 與 done 事件；
+        提取文本時出錯則產生 error 事件，接著以失敗結果的 done 事件結束
+    """
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_progress(stage: str, status: str) -> None:
+        # 處理器內部的階段在執行緒池中回報，轉交事件迴圈
+        name, _, filename = stage.partition(":")
+        if name == "transcribe" and status == "done":
+            loop.call_soon_threadsafe(events.put_nowait, {"event": "transcribed", "file": filename})
+
+    processed_texts: List[str] = [""] * len(tasks)
+
+    async def run(index: int, processor: BaseProcessor, file_path: str) -> None:
+        try:
+            text = await extract_text(processor, file_path, on_progress)
+        except Exception as e:
+            events.put_nowait(e)
+            return
+        processed_texts[index] = text
+        events.put_nowait({"event": "extracted", "file": os.path.basename(file_path), "chars": len(text),
+                           **processor.extraction_info()})
+
+    extraction = asyncio.gather(*(run(i, processor, path) for i, (processor, path) in enumerate(tasks)))
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await events.get()
+            if isinstance(event, Exception):
+                # 串流已開始，無法再回傳HTTP錯誤，改以事件告知用戶端並結束
+                logger.error(f"串流提取文本時出錯: {str(event)}")
+                error_message = f"處理資料時出錯: {str(event)}"
+                yield {"event": "error", "error": error_message}
+                yield {"event": "done", "result": {"status": "error", "error": error_message}}
+                return
+            if event["event"] == "extracted":
+                remaining -= 1
+            yield event
+    finally:
+        # 用戶端中途斷線時取消尚未完成的檔案
+        extraction.cancel()
+    
+    # 合併時維持上傳順序
+    combined_text = "\n\n".join(processed_texts)
+    
+    llm_processor = LLMProcessor()
+    async for event in llm_processor.stream(combined_text, prompt, use_cache=use_cache,
+                                            patient_id=patient_id, request_id=request_id):
+        yield event
+
+
+async def run_batch(bundles: Dict[str, List[Tuple[BaseProcessor, str]]], prompt: Optional[str] = None,
+                    use_cache: bool = True, model_choice: str = "OpenAI-4o-mini",
+                    max_concurrency: Optional[int] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    同時為多位病患生成報告，依完成順序產生結果
+
+    以信號量限制同時處理的病患數（LLM呼叫另受共用排程器限速），
+    單一病患失敗只會產生該病患的錯誤結果，不影響其他病患
+
+    Args:
+        bundles: 病患識別碼 -> (處理器, 檔案路徑) 列表
+        prompt: 可選的自定義提示詞
+        use_cache: 是否使用LLM回應快取
+        model_choice: 選擇的模型
+        max_concurrency: 最多同時處理的病患數，預設使用 BATCH_MAX_CONCURRENCY
+
+    Yields:
+        (病患識別碼, generate_report 的結果字典)
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or settings.BATCH_MAX_CONCURRENCY)
+
+    async def run(patient_id: str, tasks: List[Tuple[BaseProcessor, str]]) -> Tuple[str, Dict[str, Any]]:
+        async with semaphore:
+            try:
+                if not tasks:
+                    return patient_id, {"status": "error", "error": "沒有有效的檔案可處理"}
+                return patient_id, await generate_report(
+                    tasks, prompt, use_cache=use_cache, model_choice=model_choice, patient_id=patient_id
+                )
+            except Exception as e:
+                logger.error(f"處理病患 {patient_id} 時出錯: {str(e)}")
+                return patient_id, {"status": "error", "error": f"處理資料時出錯: {str(e)}"}
+
+    pending = [asyncio.ensure_future(run(patient_id, tasks)) for patient_id, tasks in bundles.items()]
+    try:
+        for future in asyncio.as_completed(pending):
+            yield await future
+    finally:
+        # 用戶端中途斷線時取消尚未完成的病患
+        for task in pending:
+            task.cancel()
+
+
+async def write_batch_file(bundles: Dict[str, List[Tuple[BaseProcessor, str]]], prompt: Optional[str] = None,
+                           model_choice: str = "OpenAI-4o-mini",
+                           max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """
+    離線批次模式：提取各病患文本後寫成服務提供者的批次請求檔（JSONL），不呼叫LLM
+
+    產生的檔案可直接提交至 OpenAI Batch API 或 Gemini 批次模式，以較低費用於夜間執行
+
+    Args:
+        bundles: 病患識別碼 -> (處理器, 檔案路徑) 列表
+        prompt: 可選的自定義提示詞
+        model_choice: 選擇的模型，決定批次檔格式
+        max_concurrency: 最多同時提取的病患數
+
+    Returns:
+        包含批次檔識別碼、下載路徑、請求數與各病患錯誤的字典
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or settings.BATCH_MAX_CONCURRENCY)
+    llm_processor = LLMProcessor()
+
+    async def extract(tasks: List[Tuple[BaseProcessor, str]]) -> str:
+        if not tasks:
+            raise ValueError("沒有有效的檔案可處理")
+        async with semaphore:
+            return "\n\n".join(await extract_texts(tasks))
+
+    patient_ids = list(bundles)
+    texts = await asyncio.gather(*(extract(bundles[p]) for p in patient_ids), return_exceptions=True)
+
+    lines = []
+    errors: Dict[str, str] = {}
+    for patient_id, text in zip(patient_ids, texts):
+        if isinstance(text, BaseException):
+            logger.error(f"提取病患 {patient_id} 的資料時出錯: {str(text)}")
+            errors[patient_id] = str(text)
+            continue
+        request = llm_processor.batch_request(patient_id, text, prompt, model_choice)
+        lines.append(json.dumps(request, ensure_ascii=False))
+
+    os.makedirs(settings.BATCH_OUTPUT_DIR, exist_ok=True)
+    batch_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    batch_path = os.path.join(settings.BATCH_OUTPUT_DIR, f"{batch_id}.jsonl")
+    content = "".join(line + "\n" for line in lines)
+    await run_blocking(_write_text, batch_path, content)
+    logger.info(f"已寫入 {len(lines)} 筆離線批次請求到 {batch_path}")
+
+    return {
+        "status": "success",
+        "model_used": model_choice,
+        "batch_id": batch_id,
+        "batch_path": f"/api/batches/{batch_id}",
+        "requests": len(lines),
+        "errors": errors
+    }
+
+
+def batch_file_path(batch_id: str) -> Optional[str]:
+    """
+    離線批次檔在伺服器上的路徑
+
+    Args:
+        batch_id: write_batch_file 返回的批次檔識別碼
+
+    Returns:
+        批次檔路徑，識別碼格式不符或檔案不存在時返回None
+    """
+    if not BATCH_ID_PATTERN.match(batch_id):
+        return None
+    path = os.path.join(settings.BATCH_OUTPUT_DIR, f"{batch_id}.jsonl")
+    return path if os.path.isfile(path) else None
+
+
+def _write_text(path: str, content: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
@@ -0,0 +1,167 @@
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Optional, Set
+
+from app.config import settings
+from app.core.processors.registry import registry
+
+logger = logging.getLogger(__name__)
+
+# 可路由至程序池的工作：處理器名稱（見 processors.registry）與MP4轉錄後的繁簡轉換
+OPENCC_KIND = "opencc"
+
+# 處理CPU密集工作的程序池（延遲建立）
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# 子程序內的OpenCC轉換器（依設定名稱快取）
+_converters: Dict[str, Any] = {}
+
+
+def routed_kinds() -> Set[str]:
+    """PROCESS_POOL_KINDS 中設定的工作類型"""
+    return {kind.strip() for kind in settings.PROCESS_POOL_KINDS.split(",") if kind.strip()}
+
+
+def is_routed(kind: Optional[str]) -> bool:
+    """此類工作是否交由程序池執行"""
+    return kind is not None and kind in routed_kinds()
+
+
+def _init_worker(kinds: Iterable[str]) -> None:
+    """子程序啟動時預先載入要執行的處理器，避免第一個工作承擔載入時間"""
+    names = [kind for kind in kinds if kind != OPENCC_KIND]
+    if names:
+        registry.warmup(names)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    取得程序池，首次呼叫時建立
+
+    使用 spawn 啟動子程序：父程序有多個執行緒，fork 可能複製到被持有的鎖
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                kwargs: Dict[str, Any] = {}
+                if settings.PROCESS_POOL_MAX_TASKS_PER_CHILD > 0:
+                    if sys.version_info >= (3, 11):
+                        kwargs["max_tasks_per_child"] = settings.PROCESS_POOL_MAX_TASKS_PER_CHILD
+                    else:
+                        logger.warning("PROCESS_POOL_MAX_TASKS_PER_CHILD 需要Python 3.11以上，已忽略")
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.PROCESS_POOL_WORKERS or os.cpu_count() or 1,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(sorted(routed_kinds()),),
+                    **kwargs
+                )
+    return _pool
+
+
+def shutdown_process_pool() -> None:
+    """關閉程序池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def reset_broken_pool() -> None:
+    """子程序異常結束（例如記憶體不足被終止）後丟棄程序池，下次使用時重新建立"""
+    logger.warning("程序池的子程序異常結束，將重新建立程序池")
+    shutdown_process_pool()
+
+
+def _output_path(directory: Optional[str], prefix: str) -> str:
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=".txt", dir=directory)
+    os.close(fd)
+    return path
+
+
+def read_output(path: str) -> str:
+    """讀取子程序寫出的文本後刪除檔案"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def extract_to_file(kind: str, file_path: str, output_path: str) -> Dict[str, Any]:
+    """
+    於子程序中執行處理器，將文本寫入檔案
+
+    文本經由檔案傳回父程序，不以pickle傳遞大型字串
+
+    Args:
+        kind: 處理器名稱
+        file_path: 輸入檔案路徑
+        output_path: 文本輸出路徑
+
+    Returns:
+        處理器記錄的附加資訊（例如偵測到的編碼），子程序中的處理器實例不會傳回父程序
+    """
+    processor = registry.processor_class(kind)()
+    text = processor.process(file_path)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return processor.extraction_info()
+
+
+def extract_output_path(file_path: str) -> str:
+    """在輸入檔案所在的工作目錄建立文本輸出檔，隨請求工作目錄一併清除"""
+    return _output_path(os.path.dirname(file_path) or None, "extracted_")
+
+
+def _convert_file(config: str, input_path: str, output_path: str) -> None:
+    """於子程序中以OpenCC轉換文本檔"""
+    converter = _converters.get(config)
+    if converter is None:
+        import opencc
+        converter = _converters[config] = opencc.OpenCC(config)
+    with open(input_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(converter.convert(text))
+
+
+def convert_chinese(converter: Any, config: str, text: str) -> str:
+    """
+    簡轉繁；opencc 路由至程序池時經由暫存檔交給子程序轉換，子程序失敗時改在目前執行緒轉換
+
+    Args:
+        converter: 目前程序的OpenCC轉換器
+        config: OpenCC設定名稱（子程序以此建立轉換器）
+        text: 要轉換的文本
+
+    Returns:
+        轉換後的文本
+    """
+    if not is_routed(OPENCC_KIND):
+        return converter.convert(text)
+    input_path = _output_path(None, "opencc_in_")
+    output_path = _output_path(None, "opencc_out_")
+    try:
+        with open(input_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        get_process_pool().submit(_convert_file, config, input_path, output_path).result()
+        return read_output(output_path)
+    except BrokenProcessPool:
+        reset_broken_pool()
+    except Exception as e:
+        logger.error(f"程序池轉換文本時出錯: {str(e)}")
+    finally:
+        for path in (input_path, output_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return converter.convert(text)
@@ -1,5 +1,30 @@
+import contextvars
+import logging
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# 目前處理的檔案的階段回呼（由 pipeline 設定）；執行緒池中的工作需以 contextvars.copy_context 執行才看得到
+_stage_callback: contextvars.ContextVar[Optional[Callable[[str], None]]] = contextvars.ContextVar(
+    "processor_stage_callback", default=None
+)
+
+
+@contextmanager
+def stage_callback(callback: Callable[[str], None]) -> Iterator[None]:
+    """
+    區塊內執行的處理器以 report_stage 回報內部階段時呼叫 callback，用法為 `with stage_callback(cb):`
+
+    Args:
+        callback: 接收階段名稱的函式（可能在執行緒池中呼叫）
+    """
+    token = _stage_callback.set(callback)
+    try:
+        yield
+    finally:
+        _stage_callback.reset(token)
 
 class BaseProcessor(ABC):
     """
@@ -49,3 +74,36 @@ class BaseProcessor(ABC):
             "file_type": os.path.splitext(file_path)[1],
             "last_modified": os.path.getmtime(file_path)
         }
+    
+    def record_info(self, **info: Any) -> None:
+        """
+        記錄最近一次處理的附加資訊（例如偵測到的編碼），隨報告結果返回
+        
+        Args:
+            info: 可序列化為JSON的欄位
+        """
+        self.__dict__.setdefault("_info", {}).update(info)
+    
+    def extraction_info(self) -> Dict[str, Any]:
+        """
+        獲取最近一次處理記錄的附加資訊
+        
+        Returns:
+            附加資訊字典，沒有記錄時為空字典
+        """
+        return dict(self.__dict__.get("_info", {}))
+    
+    def report_stage(self, stage: str) -> None:
+        """
+        回報處理器內部的階段已完成（例如MP4轉錄完成），沒有設定回呼或在子程序中執行時不做任何事
+        
+        Args:
+            stage: 階段名稱
+        """
+        callback = _stage_callback.get()
+        if callback is None:
+            return
+        try:
+            callback(stage)
+        except Exception as e:
+            logger.error(f"回報處理階段時出錯: {str(e)}")
@@ -0,0 +1,83 @@
+import os
+from typing import List
+
+import pandas as pd
+
+from app.core.processors.base_processor import BaseProcessor
+
+# 以問答格式輸出的問卷表單（依此順序），其餘表單以表格文字輸出
+QUESTIONNAIRE_SHEETS = ["基本問卷", "身型問卷"]
+
+
+class ExcelProcessor(BaseProcessor):
+    """處理Excel問卷檔案並提取文本"""
+
+    def process(self, file_path: str) -> str:
+        """
+        處理Excel檔案並提取文本
+
+        活頁簿只解析一次（一次讀取所有表單），問卷表單的問答文本以欄位向量運算組合
+
+        Args:
+            file_path: Excel檔案路徑
+
+        Returns:
+            提取的文本內容
+        """
+        if not self.validate(file_path):
+            return "無效的檔案路徑"
+
+        try:
+            sheets = pd.read_excel(file_path, sheet_name=None)
+        except Exception as e:
+            return f"處理檔案時發生錯誤: {str(e)}"
+
+        filename = os.path.basename(file_path)
+        parts: List[str] = []
+
+        # 處理問卷表單
+        for sheet_name in QUESTIONNAIRE_SHEETS:
+            df = sheets.get(sheet_name)
+            if df is None or df.empty or "問題" not in df.columns or "答案" not in df.columns:
+                continue
+            try:
+                text = self._format_questionnaire(df)
+            except Exception as e:
+                parts.append(f"處理 '{sheet_name}' 表單時發生錯誤: {str(e)}\n\n")
+                continue
+            parts.append(f"# 檔案: {filename} - {sheet_name}\n\n")
+            parts.append(text)
+
+        # 處理其他表單
+        for sheet_name, df in sheets.items():
+            if sheet_name in QUESTIONNAIRE_SHEETS or df.empty:
+                continue
+            try:
+                parts.append(f"# 檔案: {filename} - {sheet_name}\n\n{df.to_string(index=False)}\n\n")
+            except Exception as e:
+                parts.append(f"處理 '{sheet_name}' 表單時發生錯誤: {str(e)}\n\n")
+
+        return "".join(parts)
+
+    @staticmethod
+    def _format_questionnaire(df: pd.DataFrame) -> str:
+        """
+        將問卷表單轉為「問題／答案／備註」文本
+
+        只保留問題與答案都有值的列；以整欄字串運算組合每列文本，最後一次合併
+
+        Args:
+            df: 含「問題」、「答案」及可選「備註」欄位的表單
+
+        Returns:
+            問答文本
+        """
+        df = df[df["問題"].notna() & df["答案"].notna()]
+        if df.empty:
+            return ""
+
+        text = "問題: " + df["問題"].map(str) + "\n答案: " + df["答案"].map(str) + "\n"
+        if "備註" in df.columns:
+            note = df["備註"]
+            text = text.where(note.isna(), text + "備註: " + note.map(str) + "\n")
+        return "".join((text + "\n").tolist())
@@ -1,110 +1,198 @@
+import io
 import json
-import pandas as pd
 import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from app.config import settings
 from app.core.processors.base_processor import BaseProcessor
 
+# 路徑元素：字典鍵（str）或列表索引（int）
+PathPart = Union[str, int]
+
+
+def _walk(data: Any, prefix: Tuple[PathPart, ...]) -> Iterator[Tuple[Tuple[PathPart, ...], Any]]:
+    """遞迴攤平已載入的JSON資料"""
+    if isinstance(data, dict):
+        if not data and prefix:
+            yield prefix, "{}"
+        for key, value in data.items():
+            yield from _walk(value, prefix + (key,))
+    elif isinstance(data, list):
+        if not data and prefix:
+            yield prefix, "[]"
+        for index, item in enumerate(data):
+            yield from _walk(item, prefix + (index,))
+    else:
+        yield prefix, data
+
+
+def flatten_data(data: Any) -> Iterator[Tuple[int, Tuple[PathPart, ...], Any]]:
+    """
+    將已載入的JSON資料攤平為 (項目編號, 路徑, 值)，輸出與 flatten_events 相同
+
+    Args:
+        data: json.load 的結果
+    """
+    if isinstance(data, list):
+        for index, item in enumerate(data):
+            for parts, value in _walk(item, ()):
+                yield index, parts, value
+    else:
+        for parts, value in _walk(data, ()):
+            yield 0, parts, value
+
+
+def format_path(parts: Tuple[PathPart, ...]) -> str:
+    """將路徑元素組成 a.b[0].c 形式"""
+    text = ""
+    for part in parts:
+        if isinstance(part, int):
+            text += f"[{part}]"
+        else:
+            text += f".{part}" if text else str(part)
+    return text
+
+
+def flatten_events(events: Iterable[Tuple[str, Any]]) -> Iterator[Tuple[int, Tuple[PathPart, ...], Any]]:
+    """
+    將JSON事件序列攤平為 (項目編號, 路徑, 值)
+
+    最外層為列表時，每個元素視為一個項目，路徑從元素內部開始；
+    其他情況只有一個項目（編號0）。巢狀的空字典與空列表以 {} 與 [] 作為值輸出
+
+    Args:
+        events: (事件, 值) 序列，格式同 ijson.basic_parse
+
+    Yields:
+        (項目編號, 路徑元素列表, 值)
+    """
+    path: List[PathPart] = []
+    # 每層容器：[是否為列表, 下一個索引, 是否仍為空]
+    stack: List[list] = []
+    top_array = False
+
+    def enter_value() -> None:
+        if stack:
+            frame = stack[-1]
+            frame[2] = False
+            if frame[0]:
+                path.append(frame[1])
+                frame[1] += 1
+
+    def leave_value() -> None:
+        if stack:
+            path.pop()
+
+    def item() -> Tuple[int, Tuple[PathPart, ...]]:
+        # 最外層列表的元素編號與元素內的相對路徑
+        if top_array and path:
+            return path[0], tuple(path[1:])
+        return 0, tuple(path)
+
+    for event, value in events:
+        if event in ("start_map", "start_array"):
+            if not stack:
+                top_array = event == "start_array"
+            enter_value()
+            stack.append([event == "start_array", 0, True])
+        elif event == "map_key":
+            path.append(value)
+        elif event in ("end_map", "end_array"):
+            frame = stack.pop()
+            if frame[2] and stack:
+                index, relative = item()
+                if relative:
+                    yield index, relative, "[]" if frame[0] else "{}"
+            leave_value()
+        else:
+            enter_value()
+            index, relative = item()
+            yield index, relative, value
+            leave_value()
+
+
 class JsonProcessor(BaseProcessor):
     """處理JSON檔案並提取文本內容"""
-    
+
+    def __init__(self, fields: Optional[Iterable[str]] = None):
+        """
+        Args:
+            fields: 只輸出這些欄位（以 . 分隔、不含索引的路徑，可指定整個子結構），
+                    預設使用 JSON_FIELD_ALLOWLIST，空值表示全部輸出
+        """
+        if fields is None:
+            fields = [f.strip() for f in settings.JSON_FIELD_ALLOWLIST.split(",") if f.strip()]
+        self.fields = list(fields)
+        # 不含索引的路徑 -> 是否允許（同一欄位在每筆資料重複出現，只判斷一次）
+        self._allowed_paths: Dict[Tuple[str, ...], bool] = {}
+
+    def _allowed(self, parts: Tuple[PathPart, ...]) -> bool:
+        """路徑是否在欄位白名單內"""
+        if not self.fields:
+            return True
+        keys = tuple(str(p) for p in parts if not isinstance(p, int))
+        allowed = self._allowed_paths.get(keys)
+        if allowed is None:
+            key_path = ".".join(keys)
+            allowed = any(key_path == f or key_path.startswith(f + ".") for f in self.fields)
+            self._allowed_paths[keys] = allowed
+        return allowed
+
+    def _flatten(self, f) -> Iterator[Tuple[int, Tuple[PathPart, ...], Any]]:
+        """大型檔案以ijson逐步解析（記憶體用量固定），否則整份載入"""
+        if os.path.getsize(f.name) >= settings.JSON_STREAM_MIN_BYTES:
+            try:
+                import ijson
+                return flatten_events(ijson.basic_parse(f, use_float=True))
+            except ImportError:
+                pass
+        return flatten_data(json.load(f))
+
+    def iter_lines(self, file_path: str) -> Iterator[str]:
+        """
+        逐段產生攤平後的文本
+
+        巢狀結構攤平為 `a.b[0].c: 值`，最外層為列表時各元素之間以空行分隔
+
+        Args:
+            file_path: JSON檔案路徑
+
+        Yields:
+            文本片段，依序串接即為完整內容
+        """
+        with open(file_path, 'rb') as f:
+            current = None
+            for index, parts, value in self._flatten(f):
+                if not self._allowed(parts):
+                    continue
+                if current is not None:
+                    yield "\n" if index == current else "\n\n"
+                current = index
+                yield f"{format_path(parts)}: {value}" if parts else str(value)
+
     def process(self, file_path: str) -> str:
         """
         處理JSON檔案並提取文本
-        
+
         Args:
             file_path: JSON檔案路徑
-            
+
         Returns:
             提取的文本內容
         """
         if not self.validate(file_path):
             return "無效的檔案路徑"
-        
+
         try:
-            # 檢查檔案副檔名
-            if file_path.endswith('.json'):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                # 將JSON轉換為文本格式
-                if isinstance(data, dict):
-                    # 如果是字典，將鍵值對轉為文本
-                    text_parts = []
-                    for key, value in data.items():
-                        text_parts.append(f"{key}: {value}")
-                    return "\n".join(text_parts)
-                elif isinstance(data, list):
-                    # 如果是列表，嘗試提取所有文本字段
-                    text_parts = []
-                    for item in data:
-                        if isinstance(item, dict):
-                            item_parts = []
-                            for key, value in item.items():
-                                if isinstance(value, (str, int, float, bool)):
-                                    item_parts.append(f"{key}: {value}")
-                            text_parts.append("\n".join(item_parts))
-                        else:
-                            text_parts.append(str(item))
-                    return "\n\n".join(text_parts)
-                else:
-                    # 其他情況轉為字符串
-                    return str(data)
-            
-            # 處理Excel檔案 (參考提供的代碼)
-            elif file_path.endswith(('.xlsx', '.xls')):
-                output_text = ""
-                filename = os.path.basename(file_path)
-                
-                # 處理 "基本問卷" 表單
-                try:
-                    df_basic = pd.read_excel(file_path, sheet_name="基本問卷")
-                    if not df_basic.empty and "問題" in df_basic.columns and "答案" in df_basic.columns:
-                        output_text += f"# 檔案: {filename} - 基本問卷\n\n"
-
-                        for _, row in df_basic.iterrows():
-                            question = row.get("問題", "")
-                            answer = row.get("答案", "")
-                            note = row.get("備註", "")
-
-                            if pd.notna(question) and pd.notna(answer):
-                                output_text += f"問題: {question}\n答案: {answer}\n"
-                                if pd.notna(note):
-                                    output_text += f"備註: {note}\n"
-                                output_text += "\n"
-                except Exception as e:
-                    output_text += f"處理 '基本問卷' 表單時發生錯誤: {str(e)}\n\n"
-                
-                # 處理 "身型問卷" 表單
-                try:
-                    df_body = pd.read_excel(file_path, sheet_name="身型問卷")
-                    if not df_body.empty and "問題" in df_body.columns and "答案" in df_body.columns:
-                        output_text += f"# 檔案: {filename} - 身型問卷\n\n"
-
-                        for _, row in df_body.iterrows():
-                            question = row.get("問題", "")
-                            answer = row.get("答案", "")
-                            note = row.get("備註", "")
-
-                            if pd.notna(question) and pd.notna(answer):
-                                output_text += f"問題: {question}\n答案: {answer}\n"
-                                if pd.notna(note):
-                                    output_text += f"備註: {note}\n"
-                                output_text += "\n"
-                except Exception as e:
-                    output_text += f"處理 '身型問卷' 表單時發生錯誤: {str(e)}\n\n"
-                
-                # 處理其他表單
-                try:
-                    excel_file = pd.ExcelFile(file_path)
-                    for sheet_name in excel_file.sheet_names:
-                        if sheet_name not in ["基本問卷", "身型問卷"]:
-                            df = pd.read_excel(file_path, sheet_name=sheet_name)
-                            if not df.empty:
-                                output_text += f"# 檔案: {filename} - {sheet_name}\n\n"
-                                output_text += df.to_string(index=False) + "\n\n"
-                except Exception as e:
-                    output_text += f"處理其他表單時發生錯誤: {str(e)}\n\n"
-                
-                return output_text
-                
+            # Excel檔案交由專用的處理器（只解析一次活頁簿），處理器與 pandas 在此才載入
+            if file_path.lower().endswith(('.xlsx', '.xls')):
+                from app.core.processors.excel_processor import ExcelProcessor
+                return ExcelProcessor().process(file_path)
+
+            # 其他檔案（包含依內容判斷為JSON、沒有副檔名的檔案）視為JSON
+            output = io.StringIO()
+            for chunk in self.iter_lines(file_path):
+                output.write(chunk)
+            return output.getvalue()
+
         except Exception as e:
             return f"處理檔案時發生錯誤: {str(e)}"
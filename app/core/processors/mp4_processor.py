@@ -1,12 +1,61 @@
 import os
-import tempfile
-import moviepy.editor as mp
+from typing import List, Optional, Union
+from app.core.audio_extractor import ExtractedAudio
 from app.core.processors.base_processor import BaseProcessor
+from app.core.transcription import ChunkedTranscriber, TranscriptSegment
+from app.core.cache import get_transcription_cache, hash_file, make_key
+from app.core.clients import clients
+from app.core.metrics import timed
+from app.core.process_pool import convert_chinese
 from app.config import settings
 
+# 轉錄設定，同時作為快取鍵的一部分
+WHISPER_MODEL = "whisper-1"
+WHISPER_LANGUAGE = "zh"
+
+def _cache_key(file_path: str) -> str:
+    """轉錄快取鍵，包含影片內容雜湊與所有會影響送出音訊或逐字稿內容的設定"""
+    return make_key(
+        hash_file(file_path), WHISPER_MODEL, WHISPER_LANGUAGE, settings.TRANSCRIPTION_OPENCC_CONFIG,
+        settings.TRANSCRIPTION_TIMESTAMPS, settings.AUDIO_CONDITIONING, settings.AUDIO_CODEC,
+        settings.AUDIO_SAMPLE_RATE, settings.AUDIO_BITRATE, settings.AUDIO_TRIM_SILENCE,
+        settings.AUDIO_TRIM_MIN_SILENCE_SECONDS, settings.AUDIO_TRIM_PADDING_SECONDS,
+        settings.TRANSCRIPTION_SILENCE_DB, settings.TRANSCRIPTION_MIN_SILENCE_SECONDS,
+        settings.TRANSCRIPTION_CHUNK_SECONDS, settings.TRANSCRIPTION_OVERLAP_SECONDS,
+    )
+
+def _field(item, name: str):
+    """API回應的段落可能是物件或字典"""
+    return item[name] if isinstance(item, dict) else getattr(item, name)
+
+def whisper_transcribe(audio: ExtractedAudio) -> Union[str, List[TranscriptSegment]]:
+    """
+    調用Whisper API，音訊直接從記憶體上傳，副檔名讓API判斷音訊格式
+
+    啟用 TRANSCRIPTION_TIMESTAMPS 時返回帶時間的段落（以送出的音訊計時，由轉錄器換算為原始影片時間）
+    """
+    options = {}
+    if settings.TRANSCRIPTION_TIMESTAMPS:
+        options = {"response_format": "verbose_json", "timestamp_granularities": ["segment"]}
+    with timed("whisper", WHISPER_MODEL):
+        transcript = clients.openai().audio.transcriptions.create(
+            model=WHISPER_MODEL,
+            file=(audio.filename, audio.data),
+            language=WHISPER_LANGUAGE,  # 中文語言
+            **options
+        )
+    segments = getattr(transcript, "segments", None) if options else None
+    if segments is None:
+        return transcript.text
+    return [TranscriptSegment(float(_field(s, "start")), float(_field(s, "end")), _field(s, "text")) for s in segments]
+
 class Mp4Processor(BaseProcessor):
     """處理MP4影片檔案並使用Whisper生成文本"""
     
+    def __init__(self, transcriber: Optional[ChunkedTranscriber] = None):
+        # 轉錄器，預設為分段轉錄；上傳工作階段傳入邊上傳邊轉錄的 IncrementalTranscriber
+        self.transcriber = transcriber
+    
     def process(self, file_path: str) -> str:
         """
         處理MP4影片檔案並使用Whisper提取語音文本
@@ -20,65 +69,49 @@ class Mp4Processor(BaseProcessor):
         if not self.validate(file_path):
             return "無效的檔案路徑"
         
+        # 以檔案內容的雜湊查詢轉錄快取，命中時略過音訊提取與API呼叫
+        cache = get_transcription_cache()
+        cache_key = None
+        if cache is not None:
+            try:
+                cache_key = _cache_key(file_path)
+                cached_text = cache.get(cache_key)
+                if cached_text is not None:
+                    self.report_stage("transcribe")
+                    return f"# 檔案: {os.path.basename(file_path)}\n\n{cached_text}\n\n"
+            except Exception:
+                cache_key = None
+        
         try:
-            # 創建臨時目錄來存儲MP3文件
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # 將MP4轉換為MP3
-                mp3_path = os.path.join(temp_dir, os.path.splitext(os.path.basename(file_path))[0] + ".mp3")
+            # 使用OpenAI Whisper API進行轉錄
+            try:
+                # 檢查API密鑰是否有效
+                api_key = settings.OPENAI_API_KEY
+                if not api_key:
+                    return "OpenAI API密鑰未設置，請在.env檔案中設置OPENAI_API_KEY"
+                
+                # 使用程序共用的繁簡轉換器（未安裝opencc時為None）
+                converter = clients.opencc()
+                
+                # 使用ffmpeg提取音訊，長錄音在靜音處分段並行轉錄
+                transcriber = self.transcriber or ChunkedTranscriber(whisper_transcribe)
+                text = transcriber.transcribe(file_path)
+                self.report_stage("transcribe")
+                
+                # 轉為繁體中文(如果有安裝opencc)，長逐字稿可交由程序池轉換
+                if converter:
+                    text = convert_chinese(converter, settings.TRANSCRIPTION_OPENCC_CONFIG, text)
+                
+                # 保存轉換後的文本到快取（僅在已完成繁體轉換時，避免快取鍵與內容不符）
+                if cache_key is not None and converter:
+                    cache.set(cache_key, text)
                 
-                try:
-                    # 使用moviepy轉換MP4到MP3
-                    video = mp.VideoFileClip(file_path)
-                    audio = video.audio
-                    audio.write_audiofile(mp3_path, verbose=False, logger=None)
-                    video.close()
-                    audio.close()
-                except Exception as e:
-                    return f"轉換MP4到MP3時發生錯誤: {str(e)}"
+                # 添加檔案信息和轉錄文本
+                output_text = f"# 檔案: {os.path.basename(file_path)}\n\n{text}\n\n"
+                return output_text
                 
-                # 使用OpenAI Whisper API進行轉錄
-                try:
-                    # 檢查是否安裝OpenAI庫
-                    try:
-                        from openai import OpenAI
-                    except ImportError:
-                        return "請安裝OpenAI庫: pip install openai"
-                    
-                    # 檢查API密鑰是否有效
-                    api_key = settings.OPENAI_API_KEY
-                    if not api_key:
-                        return "OpenAI API密鑰未設置，請在.env檔案中設置OPENAI_API_KEY"
-                    
-                    # 初始化OpenAI客戶端
-                    client = OpenAI(api_key=api_key)
-                    
-                    # 嘗試繁簡轉換
-                    try:
-                        import opencc
-                        converter = opencc.OpenCC('s2twp')  # s2twp converts Simplified to Traditional Chinese (Taiwan)
-                    except ImportError:
-                        converter = None
-                    
-                    # 開啟音頻檔案
-                    with open(mp3_path, "rb") as audio_file:
-                        # 調用Whisper API
-                        transcript = client.audio.transcriptions.create(
-                            model="whisper-1",
-                            file=audio_file,
-                            language="zh"  # 中文語言
-                        )
-                    
-                    # 轉為繁體中文(如果有安裝opencc)
-                    text = transcript.text
-                    if converter:
-                        text = converter.convert(text)
-                    
-                    # 添加檔案信息和轉錄文本
-                    output_text = f"# 檔案: {os.path.basename(file_path)}\n\n{text}\n\n"
-                    return output_text
-                    
-                except Exception as e:
-                    return f"使用Whisper API轉錄時發生錯誤: {str(e)}"
+            except Exception as e:
+                return f"使用Whisper API轉錄時發生錯誤: {str(e)}"
                 
         except Exception as e:
             return f"處理MP4檔案時發生錯誤: {str(e)}"
@@ -0,0 +1,170 @@
+import importlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from app.core.processors.base_processor import BaseProcessor
+
+logger = logging.getLogger(__name__)
+
+# 判斷檔案類型時讀取的開頭位元組數
+SNIFF_BYTES = 512
+
+
+def _sniff_mp4(head: bytes) -> bool:
+    # ISO 基本媒體檔案格式：第4至8個位元組為 ftyp
+    return head[4:8] == b"ftyp"
+
+
+def _sniff_excel(head: bytes) -> bool:
+    # xls 為 OLE 複合文件；xlsx 為 ZIP，開頭的項目為 [Content_Types].xml 或 xl/ 目錄
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return True
+    return head.startswith(b"PK\x03\x04") and (b"[Content_Types].xml" in head or b"xl/" in head)
+
+
+def _sniff_json(head: bytes) -> bool:
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    return text[:1] in (b"{", b"[")
+
+
+def _sniff_text(head: bytes) -> bool:
+    # 有BOM的UTF-16/32文本含有NUL位元組，其他含NUL的內容視為二進位檔
+    if head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return True
+    return bool(head) and b"\x00" not in head
+
+
+@dataclass(frozen=True)
+class ProcessorSpec:
+    """處理器的註冊資料：模組在第一次使用時才載入"""
+    name: str
+    target: str  # "模組路徑:類別名稱"
+    extensions: Tuple[str, ...]
+    sniff: Optional[Callable[[bytes], bool]] = None
+    # 預熱時一併載入的重量級依賴（處理器本身延遲載入的模組）
+    warmup_modules: Tuple[str, ...] = ()
+
+
+class ProcessorRegistry:
+    """
+    檔案類型 -> 處理器的註冊表
+
+    依副檔名選擇處理器，沒有副檔名時依檔案開頭的內容判斷
+    （有副檔名但不支援的檔案，例如 .pdf、.docx，不做內容判斷以免誤判）；
+    處理器模組（及其 pandas、ffmpeg 等依賴）在第一次使用或預熱時才載入
+    """
+
+    def __init__(self):
+        self._specs: List[ProcessorSpec] = []
+        self._classes: Dict[str, Type[BaseProcessor]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, spec: ProcessorSpec) -> None:
+        """註冊處理器，內容判斷依註冊順序進行（較寬鬆的判斷應最後註冊）"""
+        self._specs.append(spec)
+
+    def resolve(self, filename: str, head: bytes = b"") -> Optional[ProcessorSpec]:
+        """
+        選擇處理器
+
+        Args:
+            filename: 檔案名稱
+            head: 檔案開頭的位元組（沒有副檔名時用於判斷類型）
+
+        Returns:
+            處理器的註冊資料，不支援的檔案返回None
+        """
+        extension = os.path.splitext(filename)[1].lower()
+        if extension:
+            for spec in self._specs:
+                if extension in spec.extensions:
+                    return spec
+        elif head:
+            for spec in self._specs:
+                if spec.sniff is not None and spec.sniff(head):
+                    return spec
+        return None
+
+    def processor_class(self, name: str) -> Type[BaseProcessor]:
+        """取得處理器類別，第一次使用時載入模組"""
+        cls = self._classes.get(name)
+        if cls is None:
+            spec = next(s for s in self._specs if s.name == name)
+            module_name, _, class_name = spec.target.partition(":")
+            with self._lock:
+                cls = self._classes.get(name)
+                if cls is None:
+                    cls = getattr(importlib.import_module(module_name), class_name)
+                    self._classes[name] = cls
+        return cls
+
+    def create(self, filename: str, head: bytes = b"") -> Optional[BaseProcessor]:
+        """建立對應的處理器，不支援的檔案返回None"""
+        spec = self.resolve(filename, head)
+        if spec is None:
+            return None
+        return self.processor_class(spec.name)()
+
+    def create_for_path(self, file_path: str) -> Optional[BaseProcessor]:
+        """依已保存檔案的名稱與開頭內容建立處理器"""
+        head = b""
+        if not os.path.splitext(file_path)[1]:
+            try:
+                with open(file_path, "rb") as f:
+                    head = f.read(SNIFF_BYTES)
+            except OSError:
+                return None
+        return self.create(file_path, head)
+
+    def kind(self, processor: BaseProcessor) -> Optional[str]:
+        """處理器實例對應的註冊名稱"""
+        for name, cls in self._classes.items():
+            if type(processor) is cls:
+                return name
+        return None
+
+    def warmup(self, names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """
+        預先載入處理器模組與其重量級依賴，避免第一個請求承擔載入時間
+
+        Args:
+            names: 要預熱的處理器名稱，預設為全部
+
+        Returns:
+            各處理器的載入秒數
+        """
+        wanted = set(names) if names is not None else None
+        timings: Dict[str, float] = {}
+        for spec in self._specs:
+            if wanted is not None and spec.name not in wanted:
+                continue
+            start = time.perf_counter()
+            try:
+                self.processor_class(spec.name)
+                for module in spec.warmup_modules:
+                    importlib.import_module(module)
+            except ImportError as e:
+                logger.warning(f"預熱處理器 {spec.name} 時無法載入依賴: {str(e)}")
+            timings[spec.name] = round(time.perf_counter() - start, 4)
+        logger.info(f"已預熱處理器: {timings}")
+        return timings
+
+
+registry = ProcessorRegistry()
+registry.register(ProcessorSpec(
+    "json", "app.core.processors.json_processor:JsonProcessor", (".json",), _sniff_json, ("ijson",)
+))
+registry.register(ProcessorSpec(
+    "excel", "app.core.processors.excel_processor:ExcelProcessor", (".xlsx", ".xls"), _sniff_excel, ("openpyxl",)
+))
+registry.register(ProcessorSpec(
+    "mp4", "app.core.processors.mp4_processor:Mp4Processor", (".mp4",), _sniff_mp4, ("opencc",)
+))
+# 文本的判斷最寬鬆，最後註冊
+registry.register(ProcessorSpec(
+    "text", "app.core.processors.text_processor:TextProcessor", (".txt",), _sniff_text, ("chardet",)
+))
@@ -1,57 +1,232 @@
-from app.core.processors.base_processor import BaseProcessor
+import codecs
+import logging
 import os
+from typing import Callable, Iterator, List, NamedTuple, Optional
+from app.config import settings
+from app.core.processors.base_processor import BaseProcessor
+
+logger = logging.getLogger(__name__)
+
+# 依序嘗試的編碼
+CANDIDATE_ENCODINGS = ['utf-8', 'cp950', 'big5', 'gbk']
+
+# BOM -> 編碼（UTF-32 需在 UTF-16 之前比對）
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+class DetectedEncoding(NamedTuple):
+    """編碼偵測結果"""
+    encoding: str
+    confidence: float
+    method: str  # bom、candidate 或 chardet
+
+
+def _decodes(sample: bytes, encoding: str, final: bool) -> bool:
+    """樣本能否以指定編碼解碼（樣本在檔案中間截斷時容許結尾不完整的字元）"""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=final)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_encoding(sample: bytes, final: bool = True) -> Optional[DetectedEncoding]:
+    """
+    從有限長度的樣本判斷編碼：先比對BOM，再依序嘗試常用編碼，最後使用chardet
+
+    Args:
+        sample: 檔案開頭的位元組
+        final: 樣本是否為完整檔案
+
+    Returns:
+        偵測結果，無法判斷或chardet信心不足時返回None
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return DetectedEncoding(encoding, 1.0, "bom")
+
+    for encoding in CANDIDATE_ENCODINGS:
+        if _decodes(sample, encoding, final):
+            return DetectedEncoding(encoding, 1.0, "candidate")
+
+    try:
+        import chardet
+    except ImportError:
+        return None
+    detected = chardet.detect(sample)
+    if detected.get('encoding') and (detected.get('confidence') or 0) >= settings.TEXT_ENCODING_MIN_CONFIDENCE:
+        return DetectedEncoding(detected['encoding'], detected['confidence'], "chardet")
+    return None
+
+
+def detect_encoding_full(file_path: str, data: Optional[bytes] = None,
+                         chunk_size: int = 1024 * 1024) -> Optional[DetectedEncoding]:
+    """
+    以chardet分析完整內容（樣本判斷的編碼與常用編碼都無法解碼時的最後手段）
+
+    Args:
+        file_path: 文本檔案路徑
+        data: 已讀入記憶體的完整內容；未提供時逐塊讀取檔案，記憶體用量不隨檔案大小增加
+        chunk_size: 逐塊讀取時每次讀取的位元組數
+
+    Returns:
+        偵測結果，未安裝chardet或無法判斷時返回None
+    """
+    try:
+        import chardet
+        from chardet.universaldetector import UniversalDetector
+    except ImportError:
+        return None
+    if data is not None:
+        detected = chardet.detect(data)
+    else:
+        detector = UniversalDetector()
+        with open(file_path, 'rb') as f:
+            while not detector.done:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                detector.feed(chunk)
+        detected = detector.close()
+    if not detected.get('encoding'):
+        return None
+    return DetectedEncoding(detected['encoding'], detected.get('confidence') or 0.0, "chardet")
+
 
 class TextProcessor(BaseProcessor):
     """處理文本檔案"""
-    
+
+    def __init__(self):
+        # 最近一次處理時偵測到的編碼
+        self.detected_encoding: Optional[DetectedEncoding] = None
+
+    @staticmethod
+    def _attempts(detected: Optional[DetectedEncoding],
+                  full_detect: Callable[[], Optional[DetectedEncoding]]) -> Iterator[DetectedEncoding]:
+        """依序嘗試的編碼：樣本判斷的結果、其餘常用編碼，最後才以chardet分析完整內容"""
+        tried = set()
+        if detected is not None:
+            tried.add(detected.encoding.lower())
+            yield detected
+        for encoding in CANDIDATE_ENCODINGS:
+            if encoding not in tried:
+                tried.add(encoding)
+                yield DetectedEncoding(encoding, 1.0, "candidate")
+        fallback = full_detect()
+        if fallback is not None and fallback.encoding.lower() not in tried:
+            yield fallback
+
+    def _accept(self, candidate: DetectedEncoding, filename: str) -> None:
+        self.detected_encoding = candidate
+        self.record_info(encoding=candidate.encoding, encoding_method=candidate.method,
+                         encoding_confidence=round(candidate.confidence, 2))
+        logger.info(f"{filename} 編碼: {candidate.encoding} ({candidate.method}, 信心 {candidate.confidence:.2f})")
+
+    def _decode(self, data: bytes, file_path: str) -> Optional[List[str]]:
+        """以樣本判斷編碼後一次解碼整個內容，無法解碼時改試其餘編碼"""
+        sample_size = settings.TEXT_ENCODING_SAMPLE_BYTES
+        detected = detect_encoding(data[:sample_size], final=len(data) <= sample_size)
+        for candidate in self._attempts(detected, lambda: detect_encoding_full(file_path, data)):
+            try:
+                content = data.decode(candidate.encoding)
+            except (UnicodeDecodeError, LookupError):
+                continue
+            self._accept(candidate, os.path.basename(file_path))
+            return [content]
+        return None
+
+    def _decode_stream(self, file_path: str) -> Optional[List[str]]:
+        """大型檔案逐塊解碼，不將完整的位元組內容讀入記憶體；無法解碼時改試其餘編碼"""
+        with open(file_path, 'rb') as f:
+            sample = f.read(settings.TEXT_ENCODING_SAMPLE_BYTES)
+        detected = detect_encoding(sample, final=len(sample) < settings.TEXT_ENCODING_SAMPLE_BYTES)
+        for candidate in self._attempts(detected, lambda: detect_encoding_full(file_path)):
+            try:
+                pieces = list(self.iter_text(file_path, candidate.encoding))
+            except (UnicodeDecodeError, LookupError):
+                continue
+            self._accept(candidate, os.path.basename(file_path))
+            return pieces
+        return None
+
+    def iter_text(self, file_path: str, encoding: Optional[str] = None,
+                  chunk_size: int = 1024 * 1024) -> Iterator[str]:
+        """
+        串流解碼：逐塊讀取並解碼，記憶體用量不隨檔案大小增加
+
+        Args:
+            file_path: 文本檔案路徑
+            encoding: 使用的編碼，未指定時以開頭樣本判斷
+            chunk_size: 每次讀取的位元組數
+
+        Yields:
+            解碼後的文本片段
+
+        Raises:
+            UnicodeDecodeError: 無法判斷編碼或內容無法以該編碼解碼
+        """
+        with open(file_path, 'rb') as f:
+            if encoding is None:
+                sample = f.read(settings.TEXT_ENCODING_SAMPLE_BYTES)
+                detected = detect_encoding(sample, final=len(sample) < settings.TEXT_ENCODING_SAMPLE_BYTES)
+                if detected is None:
+                    raise UnicodeDecodeError("unknown", sample[:1], 0, 1, "無法判斷檔案編碼")
+                self.detected_encoding = detected
+                encoding = detected.encoding
+            else:
+                sample = f.read(chunk_size)
+            decoder = codecs.getincrementaldecoder(encoding)()
+            chunk = sample
+            while chunk:
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+                chunk = f.read(chunk_size)
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield text
+
     def process(self, file_path: str) -> str:
         """
         處理文本檔案並返回內容
-        
+
+        編碼由開頭樣本判斷，無法解碼時依序改試常用編碼，最後以chardet分析完整內容；
+        超過 TEXT_STREAM_MIN_BYTES 的檔案逐塊解碼。偵測到的編碼以 extraction_info 隨報告結果返回
+
         Args:
             file_path: 文本檔案路徑
-            
+
         Returns:
             檔案內容
         """
         if not self.validate(file_path):
             return "無效的檔案路徑"
-        
+
+        filename = os.path.basename(file_path)
         try:
-            # 嘗試不同的編碼讀取文件
-            encodings = ['utf-8', 'cp950', 'big5', 'gbk']
-            
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        content = f.read()
-                    
-                    # 添加檔案名稱作為標題
-                    filename = os.path.basename(file_path)
-                    formatted_content = f"# 檔案: {filename}\n\n{content}\n\n"
-                    return formatted_content
-                except UnicodeDecodeError:
-                    continue
-            
-            # 如果所有編碼都失敗，嘗試以二進制方式讀取
-            with open(file_path, 'rb') as f:
-                binary_content = f.read()
-                
-                # 嘗試檢測編碼
-                try:
-                    import chardet
-                    detected = chardet.detect(binary_content)
-                    encoding = detected['encoding']
-                    
-                    if encoding:
-                        content = binary_content.decode(encoding)
-                        filename = os.path.basename(file_path)
-                        formatted_content = f"# 檔案: {filename}\n\n{content}\n\n"
-                        return formatted_content
-                except (ImportError, Exception) as e:
-                    pass
-            
-            return f"無法讀取檔案: {os.path.basename(file_path)}，請檢查檔案編碼"
-            
+            if os.path.getsize(file_path) >= settings.TEXT_STREAM_MIN_BYTES:
+                pieces = self._decode_stream(file_path)
+            else:
+                with open(file_path, 'rb') as f:
+                    pieces = self._decode(f.read(), file_path)
+
+            if pieces is None:
+                return f"無法讀取檔案: {filename}，請檢查檔案編碼"
+
+            # 添加檔案名稱作為標題（與解碼片段一次串接，不另外複製完整內容）
+            return "".join([f"# 檔案: {filename}\n\n", *pieces, "\n\n"])
+
         except Exception as e:
             return f"處理文本檔案時發生錯誤: {str(e)}"
+
+    def get_metadata(self, file_path: str):
+        """獲取檔案元數據，包含最近一次偵測到的編碼"""
+        metadata = super().get_metadata(file_path)
+        metadata.update(self.extraction_info())
+        return metadata
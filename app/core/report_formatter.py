@@ -0,0 +1,98 @@
+import functools
+import re
+from typing import Iterable, List, Optional, Pattern, Tuple
+
+# 小節標題的最大長度（不含），較長的行即使含關鍵詞也視為一般文字
+SECTION_MAX_LENGTH = 30
+# 鍵值對中鍵的最大長度（不含）
+KEY_MAX_LENGTH = 20
+
+
+@functools.lru_cache(maxsize=16)
+def _compile_keywords(keywords: Tuple[str, ...]) -> Optional[Pattern]:
+    """將所有小節關鍵詞編譯為單一比對式"""
+    if not keywords:
+        return None
+    return re.compile("|".join(re.escape(k) for k in keywords))
+
+
+class ReportFormatter:
+    """
+    將模型回應逐行格式化為 Markdown 報告
+
+    小節關鍵詞預先編譯為單一比對式，輸出以 join 一次組合（線性時間）。
+    可一次格式化整份文本（format），也可逐段餵入串流的部分文本（feed／flush），
+    兩者串接後的結果相同
+    """
+
+    def __init__(self, section_keywords: Iterable[str], header: str = ""):
+        """
+        Args:
+            section_keywords: 小節標題關鍵詞
+            header: format 輸出開頭的報告標題
+        """
+        self.header = header
+        section = _compile_keywords(tuple(section_keywords))
+        self._search = section.search if section is not None else None
+        # 串流時尚未遇到換行的部分文本
+        self._partial: List[str] = []
+
+    def _format_lines(self, lines: Iterable[str]) -> List[str]:
+        """逐行格式化（小節標題、鍵值對或一般文字），返回各行的格式化片段"""
+        parts: List[str] = []
+        append = parts.append
+        search = self._search
+        for line in lines:
+            line = line.strip()
+            if not line:
+                append("\n")  # 保留空行以進行間隔
+                continue
+
+            # 檢查此行是否為小節標題（較長的行不需比對關鍵詞）
+            if len(line) < SECTION_MAX_LENGTH and search is not None and search(line):
+                append(f"\n## {line}\n\n")
+                continue
+
+            # 格式化鍵值對：優先以半形冒號分隔，沒有時才使用全形冒號
+            index = line.find(":")
+            if index < 0:
+                index = line.find("：")
+            if 0 <= index < KEY_MAX_LENGTH:
+                append(f"**{line[:index].strip()}**：{line[index+1:].strip()}\n\n")
+            else:
+                # 帶有冒號但不是鍵值對的常規行，或常規文本行
+                append(f"{line}\n\n")
+        return parts
+
+    def format_line(self, line: str) -> str:
+        """格式化單行文本"""
+        return self._format_lines((line,))[0]
+
+    def format(self, text: str) -> str:
+        """格式化整份文本（含報告標題）"""
+        return self.header + "".join(self._format_lines(text.split('\n')))
+
+    def feed(self, chunk: str) -> str:
+        """
+        餵入串流的部分文本，返回其中已完整的各行格式化結果
+
+        Args:
+            chunk: 模型輸出片段
+
+        Returns:
+            格式化片段，沒有完整的行時為空字串
+        """
+        if '\n' not in chunk:
+            self._partial.append(chunk)
+            return ""
+        lines = chunk.split('\n')
+        self._partial.append(lines[0])
+        lines[0] = "".join(self._partial)
+        self._partial = [lines.pop()]
+        return "".join(self._format_lines(lines))
+
+    def flush(self) -> str:
+        """格式化最後一行（與 format 相同，即使為空也會輸出空行）並重設狀態"""
+        line = "".join(self._partial)
+        self._partial = []
+        return self.format_line(line)
@@ -0,0 +1,410 @@
+import gzip
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.core.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# 每次清除過期報告時刪除的筆數，避免長時間佔用寫入鎖
+PRUNE_BATCH_SIZE = 1000
+
+# 批次寫入失敗時的嘗試次數與間隔（秒，依次數遞增），期間報告仍保留在記憶體中可供讀取
+WRITE_ATTEMPTS = 3
+WRITE_RETRY_DELAY = 0.5
+
+
+def _zstd():
+    """取得zstandard模組，未安裝時返回None"""
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def compress(data: bytes, method: str) -> Tuple[bytes, str]:
+    """
+    壓縮報告內容
+
+    Args:
+        data: 報告內容（UTF-8）
+        method: zstd、gzip 或 none
+
+    Returns:
+        (壓縮後的內容, 實際使用的壓縮方式)；未安裝zstandard時改用gzip
+    """
+    if method == "zstd":
+        zstandard = _zstd()
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=3).compress(data), "zstd"
+        method = "gzip"
+    if method == "gzip":
+        return gzip.compress(data, compresslevel=6), "gzip"
+    return data, "none"
+
+
+def decompress(data: bytes, method: str) -> bytes:
+    """依保存時的壓縮方式還原報告內容"""
+    if method == "zstd":
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("需要安裝 zstandard 才能讀取此報告")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if method == "gzip":
+        return gzip.decompress(data)
+    return data
+
+
+@dataclass
+class ReportRecord:
+    """報告的索引資料（不含內容）"""
+    report_id: str
+    created_at: float
+    patient_id: Optional[str] = None
+    request_id: Optional[str] = None
+    model: Optional[str] = None
+    input_hash: Optional[str] = None
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    size: int = 0  # 未壓縮的位元組數
+    stored_size: int = 0
+    compression: str = "none"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+_COLUMNS = [
+    "report_id", "created_at", "patient_id", "request_id", "model", "input_hash",
+    "prompt_tokens", "cached_tokens", "completion_tokens", "size", "stored_size", "compression",
+]
+
+
+class ReportStore:
+    """
+    以SQLite索引保存報告
+
+    索引與（可壓縮的）內容分表保存，列表查詢只讀索引；寫入交由背景執行緒批次提交，
+    save 不等待磁碟，尚未提交的報告仍可以 get 取得。超過保留天數的報告定期清除
+    """
+
+    def __init__(self, db_path: str, compression: str = "gzip", retention_days: float = 0,
+                 prune_interval: float = 3600):
+        """
+        Args:
+            db_path: SQLite資料庫路徑
+            compression: zstd、gzip 或 none
+            retention_days: 保留天數，0表示永久保存
+            prune_interval: 兩次清除之間至少間隔的秒數
+        """
+        self.compression = compression.lower()
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._read_lock = threading.Lock()
+        self._pending: Dict[str, Tuple[ReportRecord, str]] = {}
+        self._pending_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._last_prune = 0.0
+
+        self._write_conn = self._connect(db_path)
+        self._write_conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS reports (
+                report_id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                patient_id TEXT,
+                request_id TEXT,
+                model TEXT,
+                input_hash TEXT,
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_tokens INTEGER NOT NULL DEFAULT 0,
+                completion_tokens INTEGER NOT NULL DEFAULT 0,
+                size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL,
+                compression TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS report_bodies (
+                report_id TEXT PRIMARY KEY,
+                body BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_reports_created ON reports (created_at, report_id);
+            CREATE INDEX IF NOT EXISTS idx_reports_patient ON reports (patient_id, created_at, report_id);
+            CREATE INDEX IF NOT EXISTS idx_reports_request ON reports (request_id);
+            CREATE INDEX IF NOT EXISTS idx_reports_model ON reports (model, created_at, report_id);
+            CREATE INDEX IF NOT EXISTS idx_reports_input ON reports (input_hash);
+            """
+        )
+        self._write_conn.commit()
+        self._read_conn = self._connect(db_path)
+
+        self._writer = threading.Thread(target=self._write_loop, name="report-store", daemon=True)
+        self._writer.start()
+
+    @staticmethod
+    def _connect(db_path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL 讓讀取不被背景寫入阻擋
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def save(self, report: str, patient_id: Optional[str] = None, request_id: Optional[str] = None,
+             model: Optional[str] = None, input_hash: Optional[str] = None,
+             usage: Optional[Dict[str, Any]] = None) -> str:
+        """
+        排入背景寫入並立即返回報告ID
+
+        Args:
+            report: 格式化後的報告
+            patient_id: 病患識別碼
+            request_id: 請求或任務識別碼
+            model: 使用的模型
+            input_hash: 模型輸入的雜湊
+            usage: TokenUsage.to_dict() 的結果
+
+        Returns:
+            報告ID
+        """
+        usage = usage or {}
+        record = ReportRecord(
+            report_id=uuid.uuid4().hex,
+            created_at=time.time(),
+            patient_id=patient_id,
+            request_id=request_id,
+            model=model,
+            input_hash=input_hash,
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            cached_tokens=usage.get("cached_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            size=len(report.encode("utf-8")),
+        )
+        with self._pending_lock:
+            self._pending[record.report_id] = (record, report)
+        self._queue.put(record.report_id)
+        return record.report_id
+
+    def _write_loop(self) -> None:
+        """背景寫入：一次取出所有待寫入的報告，在同一個交易中提交"""
+        while True:
+            report_id = self._queue.get()
+            batch = [report_id]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            ids = [i for i in batch if i is not None]
+            if ids:
+                self._write_with_retry(ids)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+            if self.retention_days and time.time() - self._last_prune >= self.prune_interval:
+                try:
+                    self.prune()
+                except Exception as e:
+                    logger.error(f"清除過期報告時出錯: {str(e)}")
+
+    def _write_with_retry(self, ids: List[str]) -> None:
+        """
+        寫入一批報告，失敗時重試；仍失敗時逐筆寫入，只放棄無法寫入的報告並記錄其ID
+        """
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                with timed("report_store_write"):
+                    self._write(ids)
+                return
+            except Exception as e:
+                logger.warning(f"寫入 {len(ids)} 份報告時出錯（第 {attempt}/{WRITE_ATTEMPTS} 次）: {str(e)}")
+                if attempt < WRITE_ATTEMPTS:
+                    time.sleep(WRITE_RETRY_DELAY * attempt)
+        for report_id in ids:
+            try:
+                self._write([report_id])
+            except Exception as e:
+                logger.error(f"報告 {report_id} 無法寫入，已遺失: {str(e)}")
+                with self._pending_lock:
+                    self._pending.pop(report_id, None)
+
+    def _write(self, ids: List[str]) -> None:
+        """在同一個交易中寫入報告，提交成功後才從待寫入的報告中移除"""
+        with self._pending_lock:
+            items = [self._pending[i] for i in ids if i in self._pending]
+        rows, bodies = [], []
+        for record, report in items:
+            body, record.compression = compress(report.encode("utf-8"), self.compression)
+            record.stored_size = len(body)
+            rows.append(tuple(getattr(record, c) for c in _COLUMNS))
+            bodies.append((record.report_id, body))
+        with self._write_conn:
+            self._write_conn.executemany(
+                f"INSERT INTO reports ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})", rows
+            )
+            self._write_conn.executemany("INSERT INTO report_bodies (report_id, body) VALUES (?, ?)", bodies)
+        with self._pending_lock:
+            for i in ids:
+                self._pending.pop(i, None)
+
+    def flush(self) -> None:
+        """等待所有已排入的報告寫入"""
+        self._queue.join()
+
+    def get(self, report_id: str) -> Optional[Tuple[ReportRecord, str]]:
+        """
+        讀取報告
+
+        Returns:
+            (索引資料, 報告內容)，不存在時返回None
+        """
+        with self._pending_lock:
+            pending = self._pending.get(report_id)
+        if pending is not None:
+            return pending
+        with self._read_lock:
+            row = self._read_conn.execute(
+                f"SELECT {', '.join('r.' + c for c in _COLUMNS)}, b.body FROM reports r "
+                "JOIN report_bodies b ON b.report_id = r.report_id WHERE r.report_id = ?",
+                (report_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = ReportRecord(*row[:-1])
+        return record, decompress(row[-1], record.compression).decode("utf-8")
+
+    def list(self, patient_id: Optional[str] = None, request_id: Optional[str] = None,
+             model: Optional[str] = None, input_hash: Optional[str] = None,
+             since: Optional[float] = None, until: Optional[float] = None,
+             limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[ReportRecord], Optional[str]]:
+        """
+        依建立時間由新到舊列出報告索引（只包含已寫入的報告）
+
+        以 (建立時間, 報告ID) 作為游標分頁，任何頁數的查詢成本都相同
+
+        Args:
+            patient_id: 只列出此病患的報告
+            request_id: 只列出此請求的報告
+            model: 只列出此模型產生的報告
+            input_hash: 只列出此輸入產生的報告
+            since: 建立時間下限（Unix時間，含）
+            until: 建立時間上限（Unix時間，不含）
+            limit: 每頁筆數
+            cursor: 上一頁返回的游標
+
+        Returns:
+            (索引資料列表, 下一頁的游標；沒有下一頁時為None)
+
+        Raises:
+            ValueError: 游標格式錯誤
+        """
+        conditions, params = [], []
+        for column, value in (("patient_id", patient_id), ("request_id", request_id),
+                              ("model", model), ("input_hash", input_hash)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            params.append(until)
+        if cursor:
+            created_at, _, last_id = cursor.partition(":")
+            conditions.append("(created_at, report_id) < (?, ?)")
+            params.extend([float(created_at), last_id])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM reports {where} "
+                "ORDER BY created_at DESC, report_id DESC LIMIT ?",
+                (*params, limit + 1)
+            ).fetchall()
+        records = [ReportRecord(*row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = records[-1]
+            next_cursor = f"{last.created_at!r}:{last.report_id}"
+        return records, next_cursor
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """
+        刪除超過保留天數的報告（分批刪除）
+
+        Returns:
+            刪除的筆數
+        """
+        if not self.retention_days:
+            return 0
+        now = now or time.time()
+        self._last_prune = now
+        cutoff = now - self.retention_days * 86400
+        deleted = 0
+        while True:
+            with self._write_conn:
+                ids = [row[0] for row in self._write_conn.execute(
+                    "SELECT report_id FROM reports WHERE created_at < ? ORDER BY created_at LIMIT ?",
+                    (cutoff, PRUNE_BATCH_SIZE)
+                )]
+                if not ids:
+                    break
+                marks = ", ".join("?" * len(ids))
+                self._write_conn.execute(f"DELETE FROM report_bodies WHERE report_id IN ({marks})", ids)
+                self._write_conn.execute(f"DELETE FROM reports WHERE report_id IN ({marks})", ids)
+            deleted += len(ids)
+        if deleted:
+            logger.info(f"已清除 {deleted} 份超過 {self.retention_days:g} 天的報告")
+        return deleted
+
+    def close(self) -> None:
+        """寫入剩餘的報告並關閉資料庫"""
+        self._queue.put(None)
+        self._writer.join()
+        self._write_conn.close()
+        with self._read_lock:
+            self._read_conn.close()
+
+
+def report_path(report_id: Optional[str]) -> Optional[str]:
+    """報告在API中的路徑，保存失敗（沒有報告ID）時返回None"""
+    return f"/api/reports/{report_id}" if report_id else None
+
+
+# 共用報告庫（延遲建立）
+_report_store: Optional[ReportStore] = None
+_store_lock = threading.Lock()
+
+
+def get_report_store() -> ReportStore:
+    """取得共用的報告庫，首次呼叫時建立"""
+    global _report_store
+    with _store_lock:
+        if _report_store is None:
+            _report_store = ReportStore(
+                settings.REPORT_STORE_PATH, settings.REPORT_COMPRESSION, settings.REPORT_RETENTION_DAYS
+            )
+    return _report_store
+
+
+def close_report_store() -> None:
+    """關閉共用報告庫"""
+    global _report_store
+    with _store_lock:
+        if _report_store is not None:
+            _report_store.close()
+            _report_store = None
@@ -0,0 +1,392 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+from app.config import settings
+from app.core.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ProviderUnavailableError(Exception):
+    """服務提供者的斷路器開啟中，暫停送出請求"""
+
+
+class TokenBucket:
+    """
+    每分鐘配額的權杖桶
+
+    採預約制：配額不足時直接扣成負值並返回需等待的秒數，
+    讓同時到達的請求依序排開而不是一起重試
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """預約配額，返回需要等待的秒數（0表示可立即送出）"""
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class CircuitBreaker:
+    """
+    連續失敗達門檻時開啟，冷卻後允許一個試探請求（半開）
+
+    試探請求需以 record_success、record_failure 或 release 回報結果；
+    超過 probe_timeout 秒仍未回報時，允許下一個請求重新試探，避免停在半開狀態
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, probe_timeout: float = 600):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否允許送出請求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.probe_started = now
+                return True
+            if self.state == self.HALF_OPEN and (
+                    self.probe_started is None or now - self.probe_started >= self.probe_timeout):
+                if self.probe_started is not None:
+                    logger.warning(f"試探請求超過 {self.probe_timeout} 秒未回報結果，改由下一個請求試探")
+                self.probe_started = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probe_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.probe_started = None
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"斷路器開啟，{self.reset_timeout} 秒內暫停送出請求")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """請求被取消或串流被放棄而沒有結果：半開時讓下一個請求重新試探"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.probe_started = None
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """從不同SDK的例外中取得HTTP狀態碼"""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """讀取錯誤回應中的 Retry-After（retry-after-ms、秒數或HTTP日期）"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """429、5xx與連線錯誤可重試，其餘4xx（金鑰錯誤、請求格式錯誤等）不重試"""
+    status = _status_code(error)
+    if status is None:
+        return True
+    return status == 429 or status == 408 or status >= 500
+
+
+class ProviderLimiter:
+    """單一服務提供者的速率限制、並行上限、斷路器與統計資料"""
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float,
+                 max_in_flight: int, failure_threshold: int, reset_timeout: float, probe_timeout: float = 600):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, probe_timeout)
+        self.max_in_flight = max_in_flight
+        # asyncio.Semaphore 綁定事件迴圈，每個迴圈各自建立
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self.in_flight = 0
+        self.counters: Dict[str, float] = {
+            "requests": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "throttled": 0,
+            "throttle_wait_seconds": 0.0,
+            "queue_wait_seconds": 0.0,
+            "circuit_rejections": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def admit(self, estimated_tokens: int) -> None:
+        """檢查斷路器並依權杖桶等待配額"""
+        if not self.breaker.allow():
+            self.counters["circuit_rejections"] += 1
+            raise ProviderUnavailableError(f"{self.name} 暫時無法使用（斷路器開啟中）")
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            self.counters["throttled"] += 1
+            self.counters["throttle_wait_seconds"] += wait
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                self.breaker.release()
+                raise
+
+    def settle(self, error: Optional[Exception] = None) -> bool:
+        """
+        依一次嘗試的結果更新斷路器與統計
+
+        只有服務端問題（429、5xx、連線錯誤）計入斷路器；請求本身的錯誤（金鑰、格式等4xx）
+        表示服務可以連線，與成功同樣關閉斷路器，不影響其他請求
+
+        Args:
+            error: 嘗試失敗時的例外，成功時為None
+
+        Returns:
+            失敗是否可重試
+        """
+        if error is None:
+            self.breaker.record_success()
+            self.counters["successes"] += 1
+            return False
+        retryable = is_retryable(error)
+        if retryable:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        self.counters["failures"] += 1
+        return retryable
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """取得並行名額，記錄排隊等待時間"""
+        started = time.monotonic()
+        async with self._semaphore():
+            self.counters["queue_wait_seconds"] += time.monotonic() - started
+            self.counters["requests"] += 1
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """計算重試前的等待秒數：優先採用 Retry-After，否則使用帶抖動的指數退避"""
+        retry_after = retry_after_seconds(error)
+        if _status_code(error) == 429:
+            self.counters["rate_limited"] += 1
+        if retry_after is not None:
+            return min(retry_after, settings.LLM_BACKOFF_MAX_SECONDS)
+        ceiling = min(settings.LLM_BACKOFF_MAX_SECONDS, settings.LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        return random.uniform(0, ceiling)  # full jitter，避免同時重試
+
+    def record_usage(self, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> None:
+        """累計服務提供者回報的權杖用量"""
+        self.counters["prompt_tokens"] += prompt_tokens
+        self.counters["cached_tokens"] += cached_tokens
+        self.counters["completion_tokens"] += completion_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        prompt_tokens = self.counters["prompt_tokens"]
+        return {
+            **self.counters,
+            "prompt_cache_hit_rate": round(self.counters["cached_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "circuit_state": self.breaker.state,
+        }
+
+
+class ProviderScheduler:
+    """
+    所有LLM服務呼叫共用的非同步排程器
+
+    依服務提供者套用每分鐘請求數／權杖數限制、並行上限與斷路器，
+    失敗時以不阻塞的方式退避重試
+    """
+
+    def __init__(self):
+        self._limiters: Dict[str, ProviderLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, provider: str) -> ProviderLimiter:
+        """取得服務提供者的限制器，首次使用時依設定建立"""
+        if provider not in self._limiters:
+            with self._lock:
+                if provider not in self._limiters:
+                    prefix = provider.upper()
+                    self._limiters[provider] = ProviderLimiter(
+                        provider,
+                        getattr(settings, f"{prefix}_REQUESTS_PER_MINUTE", 0),
+                        getattr(settings, f"{prefix}_TOKENS_PER_MINUTE", 0),
+                        settings.LLM_MAX_IN_FLIGHT,
+                        settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                        settings.LLM_CIRCUIT_RESET_SECONDS,
+                        settings.LLM_CIRCUIT_PROBE_TIMEOUT_SECONDS,
+                    )
+        return self._limiters[provider]
+
+    async def call(self, provider: str, func: Callable[[], Awaitable[T]],
+                   estimated_tokens: int = 0, retry_count: int = 3) -> T:
+        """
+        在限制下執行一次服務呼叫，失敗時退避重試
+
+        Args:
+            provider: 服務提供者名稱（openai、gemini）
+            func: 每次嘗試時呼叫、返回awaitable的函式
+            estimated_tokens: 預估使用的權杖數，用於每分鐘權杖限制
+            retry_count: 最多嘗試次數
+
+        Returns:
+            func 的結果
+        """
+        limiter = self.limiter(provider)
+        for attempt in range(retry_count):
+            await limiter.admit(estimated_tokens)
+            try:
+                async with limiter.slot():
+                    with timed("llm_attempt", provider):
+                        result = await func()
+            except Exception as e:
+                retryable = limiter.settle(e)
+                logger.error(f"{provider} 呼叫時出錯 (嘗試 {attempt+1}/{retry_count}): {str(e)}")
+                if attempt == retry_count - 1 or not retryable:
+                    raise
+                wait = limiter.backoff(attempt, e)
+                limiter.counters["retries"] += 1
+                logger.info(f"{wait:.1f} 秒後重試...")
+                await asyncio.sleep(wait)
+                continue
+            except BaseException:
+                # 呼叫被取消：沒有結果，斷路器半開時讓下一個請求試探
+                limiter.breaker.release()
+                raise
+            limiter.settle()
+            return result
+
+    async def stream(self, provider: str, open_stream: Callable[[], AsyncIterator[T]],
+                     estimated_tokens: int = 0, retry_count: int = 3) -> AsyncIterator[T]:
+        """
+        串流版本的 call：並行名額保留到串流結束，只在尚未收到任何內容時重試
+
+        Args:
+            provider: 服務提供者名稱
+            open_stream: 每次嘗試時呼叫、返回非同步迭代器的函式
+            estimated_tokens: 預估使用的權杖數
+            retry_count: 最多嘗試次數
+        """
+        limiter = self.limiter(provider)
+        for attempt in range(retry_count):
+            await limiter.admit(estimated_tokens)
+            received = False
+            try:
+                async with limiter.slot():
+                    with timed("llm_attempt", provider):
+                        async for item in open_stream():
+                            received = True
+                            yield item
+            except Exception as e:
+                retryable = limiter.settle(e)
+                logger.error(f"{provider} 串流時出錯 (嘗試 {attempt+1}/{retry_count}): {str(e)}")
+                if received or attempt == retry_count - 1 or not retryable:
+                    raise
+                wait = limiter.backoff(attempt, e)
+                limiter.counters["retries"] += 1
+                await asyncio.sleep(wait)
+                continue
+            except BaseException:
+                # 被取消或用戶端放棄串流（GeneratorExit）：已收到內容表示服務正常，否則讓下一個請求試探
+                if received:
+                    limiter.settle()
+                else:
+                    limiter.breaker.release()
+                raise
+            limiter.settle()
+            return
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各服務提供者的節流、排隊與錯誤統計"""
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+def estimate_tokens(*texts: str) -> int:
+    """粗估權杖數（中文約一字一個權杖，其他文字約四字元一個）"""
+    total = 0
+    for text in texts:
+        ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+        total += (len(text) - ascii_chars) + ascii_chars // 4
+    return total
+
+
+# 全域排程器
+scheduler = ProviderScheduler()
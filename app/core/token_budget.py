@@ -0,0 +1,125 @@
+import functools
+import re
+from typing import List, Optional
+
+from app.config import settings
+from app.core.scheduler import estimate_tokens
+
+# 各模型的上下文長度（權杖數）
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4o-mini": 128000,
+    "gemini-2.0-flash": 1048576,
+}
+
+# 處理器輸出中每個檔案的標題
+_FILE_HEADER = re.compile(r"^# 檔案: .*$", re.MULTILINE)
+
+
+@functools.lru_cache(maxsize=8)
+def _encoding(model: str):
+    """取得模型的tiktoken編碼，未安裝tiktoken或不支援的模型返回None"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    計算文本的權杖數
+
+    OpenAI模型在已安裝tiktoken時精確計算，其他情況使用 estimate_tokens 粗估
+
+    Args:
+        text: 文本
+        model: 模型名稱
+    """
+    encoding = _encoding(model) if model else None
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def input_budget(model: str, prompt: str) -> int:
+    """
+    單次請求可放入的資料權杖數
+
+    取 LLM_MAX_INPUT_TOKENS 與模型上下文扣除提示詞及輸出保留量兩者的較小值
+
+    Args:
+        model: 模型名稱
+        prompt: 提示詞
+    """
+    context = MODEL_CONTEXT_TOKENS.get(model, settings.LLM_MAX_INPUT_TOKENS)
+    available = context - settings.LLM_OUTPUT_TOKEN_RESERVE - count_tokens(prompt, model)
+    return max(1, min(settings.LLM_MAX_INPUT_TOKENS, available))
+
+
+def _split_sections(text: str) -> List[str]:
+    """依 `# 檔案:` 標題切成各檔案的區段（標題保留在區段開頭）"""
+    starts = [m.start() for m in _FILE_HEADER.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)]) if text[a:b].strip()]
+
+
+def _split_oversized(text: str, max_tokens: int, model: Optional[str]) -> List[str]:
+    """依段落、行、最後依字元數切開超過上限的文本"""
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
+    for separator in ("\n\n", "\n"):
+        pieces = [p for p in text.split(separator) if p.strip()]
+        if len(pieces) > 1:
+            return _pack([piece for p in pieces for piece in _split_oversized(p, max_tokens, model)],
+                         max_tokens, model, separator)
+    # 沒有自然邊界的長段落依字元數硬切
+    size = max(1, len(text) * max_tokens // count_tokens(text, model))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _pack(pieces: List[str], max_tokens: int, model: Optional[str], separator: str) -> List[str]:
+    """將相鄰的片段依序合併，每塊不超過上限"""
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for piece in pieces:
+        tokens = count_tokens(piece, model)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(separator.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def split_by_budget(text: str, max_tokens: int, model: Optional[str] = None) -> List[str]:
+    """
+    將合併後的文本切成不超過權杖上限的區塊
+
+    先依 `# 檔案:` 標題分開各檔案，小檔案合併到同一塊；單一檔案過大時依段落與行切開，
+    後續區塊重複該檔案的標題，讓模型知道內容來源
+
+    Args:
+        text: 合併後的文本
+        max_tokens: 每塊的權杖上限
+        model: 用於計算權杖數的模型名稱
+
+    Returns:
+        依原始順序排列的區塊
+    """
+    pieces: List[str] = []
+    for section in _split_sections(text):
+        header = ""
+        match = _FILE_HEADER.match(section)
+        if match:
+            header = match.group(0) + "（續）\n\n"
+        parts = _split_oversized(section.strip("\n"), max(1, max_tokens - count_tokens(header, model)), model)
+        pieces.append(parts[0])
+        pieces.extend(header + part for part in parts[1:])
+    return _pack(pieces, max_tokens, model, "\n\n")
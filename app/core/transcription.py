@@ -0,0 +1,428 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from app.config import settings
+from app.core.audio_extractor import (
+    AudioExtractionError, ExtractedAudio, Mp4Layout, detect_silences, extract_audio, extract_segment,
+    probe_audio_codec, probe_duration, read_mp4_layout
+)
+from app.core.metrics import merge_usage, track_usage
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptSegment(NamedTuple):
+    """帶時間的轉錄段落"""
+    start: float  # 秒數：轉錄函式返回時以送出的音訊計時，轉錄器換算為原始影片中的時間
+    end: float
+    text: str
+
+
+# 轉錄函式：(音訊) -> 文本或帶時間的段落列表，預設呼叫Whisper API，可替換為本地替身
+TranscribeFn = Callable[[ExtractedAudio], Union[str, List[TranscriptSegment]]]
+# 單一分段的轉錄結果：文本，或已換算為原始影片時間的段落列表
+ChunkResult = Union[str, List[TranscriptSegment]]
+
+
+def to_source_segments(audio: ExtractedAudio, segments: List[TranscriptSegment],
+                       offset: float) -> List[TranscriptSegment]:
+    """
+    將送出的音訊中的段落時間換算為原始影片中的時間
+
+    Args:
+        audio: 送出的音訊；去除了靜音時依 timeline 換算
+        segments: 轉錄函式返回的段落（以送出的音訊計時）
+        offset: 音訊在原始影片中的起點（未去除靜音時使用）
+    """
+    if audio.timeline is not None:
+        to_source = audio.timeline.to_source
+        return [TranscriptSegment(to_source(s.start), to_source(s.end), s.text) for s in segments]
+    return [TranscriptSegment(offset + s.start, offset + s.end, s.text) for s in segments]
+
+
+def format_timestamp(seconds: float) -> str:
+    """秒數 -> mm:ss（超過一小時為 h:mm:ss）"""
+    total = int(seconds)
+    hours, rest = divmod(total, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+def render_segments(segments: List[TranscriptSegment]) -> str:
+    """每個段落一行，前面加上原始影片中的時間"""
+    return "\n".join(f"[{format_timestamp(s.start)}] {s.text.strip()}" for s in segments if s.text.strip())
+
+
+def stitch_segments(parts: List[List[TranscriptSegment]], overlapped: Optional[List[bool]] = None) -> str:
+    """
+    依序合併各分段帶時間的段落，與前一段重疊時以時間去除重複：
+    中點落在前一段最後一個段落結束之前的段落視為重複
+
+    Args:
+        parts: 依時間順序排列、已換算為原始影片時間的段落列表
+        overlapped: 每段是否與前一段重疊，預設全部視為重疊
+    """
+    merged: List[TranscriptSegment] = []
+    for index, part in enumerate(parts):
+        if merged and (overlapped is None or overlapped[index]):
+            last_end = merged[-1].end
+            part = [s for s in part if (s.start + s.end) / 2 > last_end]
+        merged.extend(part)
+    return render_segments(merged)
+
+
+def choose_cut(cursor: float, midpoints: List[float], target: float, overlap: float,
+               duration: float) -> Tuple[float, float]:
+    """
+    從 cursor 開始的下一個分段：在目標長度附近的靜音中點切割，找不到靜音時硬切並與下一段重疊
+
+    Returns:
+        (下一段的起點, 本段的結束秒數)
+    """
+    ideal = cursor + target
+    # 允許在目標長度的 50% ~ 125% 之間尋找切點
+    candidates = [m for m in midpoints if cursor + target * 0.5 <= m <= cursor + target * 1.25]
+    if candidates:
+        cut = min(candidates, key=lambda m: abs(m - ideal))
+        return cut, cut
+    return ideal, min(ideal + overlap, duration)
+
+
+def plan_chunks(duration: float, silences: List[Tuple[float, float]], target: float,
+                overlap: float) -> List[Tuple[float, float]]:
+    """
+    規劃分段：在目標長度附近的靜音中點切割，找不到靜音時硬切並與下一段重疊
+
+    Args:
+        duration: 音訊總長度（秒）
+        silences: 靜音區段
+        target: 目標分段長度（秒）
+        overlap: 硬切時的重疊長度（秒）
+
+    Returns:
+        (起始秒數, 結束秒數) 列表
+    """
+    midpoints = sorted((start + end) / 2 for start, end in silences)
+    chunks = []
+    cursor = 0.0
+    while duration - cursor > target * 1.25:
+        cut, end = choose_cut(cursor, midpoints, target, overlap, duration)
+        chunks.append((cursor, end))
+        cursor = cut
+    chunks.append((cursor, duration))
+    return chunks
+
+
+def stitch_transcripts(parts: List[str], overlapped: Optional[List[bool]] = None,
+                       max_overlap: int = 200, min_overlap: int = 4) -> str:
+    """
+    依序合併各分段的轉錄結果，移除相鄰分段因重疊而重複的文字
+
+    只對與前一段有時間重疊的分段去重，以前一段結尾與後一段開頭的最長相同字串
+    判斷重複（中文以字元為單位）
+
+    Args:
+        parts: 依時間順序排列的分段文本
+        overlapped: 每段是否與前一段重疊，預設全部視為重疊
+    """
+    merged = ""
+    for index, part in enumerate(parts):
+        part = part.strip()
+        if not part:
+            continue
+        if not merged:
+            merged = part
+            continue
+        overlap = 0
+        if overlapped is None or overlapped[index]:
+            tail = merged[-max_overlap:]
+            for size in range(min(len(tail), len(part)), min_overlap - 1, -1):
+                if tail.endswith(part[:size]):
+                    overlap = size
+                    break
+        separator = "" if overlap else " "
+        merged = merged + separator + part[overlap:]
+    return merged
+
+
+class ChunkedTranscriber:
+    """
+    將長錄音在靜音處分段，以有限的並行數轉錄後依序合併
+
+    每段失敗時獨立重試；短錄音或無法分段時退回單次轉錄
+    """
+
+    def __init__(self, transcribe_fn: TranscribeFn, chunk_seconds: Optional[float] = None,
+                 overlap_seconds: Optional[float] = None, max_concurrency: Optional[int] = None,
+                 retry_count: Optional[int] = None):
+        self.transcribe_fn = transcribe_fn
+        self.chunk_seconds = chunk_seconds or settings.TRANSCRIPTION_CHUNK_SECONDS
+        self.overlap_seconds = overlap_seconds if overlap_seconds is not None else settings.TRANSCRIPTION_OVERLAP_SECONDS
+        self.max_concurrency = max_concurrency or settings.TRANSCRIPTION_MAX_CONCURRENCY
+        self.retry_count = retry_count or settings.TRANSCRIPTION_RETRY_COUNT
+
+    def _transcribe_with_retry(self, audio: ExtractedAudio, label: str, offset: float = 0.0) -> ChunkResult:
+        """轉錄單一分段，失敗時以指數退避重試；帶時間的段落換算為原始影片中的時間"""
+        if not audio.data:
+            # 整段都是靜音，不需送出
+            logger.info(f"{label}沒有語音，略過轉錄")
+            return []
+        for attempt in range(self.retry_count):
+            try:
+                result = self.transcribe_fn(audio)
+                if isinstance(result, str):
+                    return result
+                return to_source_segments(audio, result, offset)
+            except Exception as e:
+                logger.error(f"轉錄{label}時出錯 (嘗試 {attempt+1}/{self.retry_count}): {str(e)}")
+                if attempt == self.retry_count - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def _transcribe_chunk(self, file_path: str, codec: Optional[str], index: int,
+                          start: float, end: float) -> ChunkResult:
+        audio = extract_segment(file_path, start, end - start, codec)
+        return self._transcribe_with_retry(audio, f"第 {index+1} 段 ({start:.1f}s - {end:.1f}s)", start)
+
+    @staticmethod
+    def _merge(parts: List[ChunkResult], overlapped: Optional[List[bool]] = None) -> str:
+        """合併各分段：全部帶時間時以時間去重並標示時間，否則以文字比對去重"""
+        if all(isinstance(part, list) for part in parts):
+            return stitch_segments(parts, overlapped)
+        texts = [part if isinstance(part, str) else " ".join(s.text.strip() for s in part) for part in parts]
+        return stitch_transcripts(texts, overlapped)
+
+    def transcribe(self, file_path: str) -> str:
+        """
+        轉錄影片中的語音
+
+        Args:
+            file_path: 影片檔案路徑
+
+        Returns:
+            合併後的轉錄文本
+        """
+        duration = probe_duration(file_path)
+        if duration is not None and duration <= self.chunk_seconds * 1.25:
+            return self._transcribe_single(file_path)
+
+        try:
+            silences, detected_duration = detect_silences(
+                file_path, settings.TRANSCRIPTION_SILENCE_DB, settings.TRANSCRIPTION_MIN_SILENCE_SECONDS
+            )
+        except (AudioExtractionError, OSError) as e:
+            # 無法執行ffmpeg時整段轉錄，由 extract_audio 改用moviepy提取音訊
+            logger.warning(f"無法偵測靜音（{str(e)}），改為整段轉錄")
+            return self._transcribe_single(file_path)
+        duration = duration or detected_duration
+        if duration is None or duration <= self.chunk_seconds * 1.25:
+            return self._transcribe_single(file_path)
+
+        chunks = plan_chunks(duration, silences, self.chunk_seconds, self.overlap_seconds)
+        logger.info(f"錄音長度 {duration:.0f} 秒，分為 {len(chunks)} 段轉錄")
+        codec = probe_audio_codec(file_path)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="transcribe") as executor:
+            futures = [
+                # 每段帶入目前的context，讓分段的耗時計入同一請求
+                executor.submit(contextvars.copy_context().run, self._transcribe_chunk, file_path, codec, i, start, end)
+                for i, (start, end) in enumerate(chunks)
+            ]
+            parts = [future.result() for future in futures]
+        overlapped = [i > 0 and chunks[i - 1][1] > chunks[i][0] for i in range(len(chunks))]
+        return self._merge(parts, overlapped)
+
+    def _transcribe_single(self, file_path: str) -> str:
+        """不分段，整段音訊一次轉錄"""
+        return self._merge([self._transcribe_with_retry(extract_audio(file_path), "音訊")])
+
+
+class IncrementalTranscriber(ChunkedTranscriber):
+    """
+    邊上傳邊轉錄
+
+    影片為 faststart（moov 在檔案開頭）時，依已連續收到的媒體資料比例估計可解碼到的秒數，
+    扣除安全邊界後已完整的分段立即提取音訊並開始轉錄；上傳完成後呼叫 transcribe 只需處理剩餘的分段。
+    moov 在檔案結尾的影片在收到最後一個位元組前無法解碼，改在 transcribe 時才整段轉錄
+    """
+
+    def __init__(self, file_path: str, total_size: int, transcribe_fn: TranscribeFn,
+                 margin_seconds: Optional[float] = None, **kwargs: Any):
+        """
+        Args:
+            file_path: 上傳中的影片檔案路徑
+            total_size: 完整檔案的大小
+            transcribe_fn: 轉錄函式
+            margin_seconds: 估計的可解碼秒數需保留的安全邊界（影音交錯不均勻時避免讀到尚未收到的資料）
+        """
+        super().__init__(transcribe_fn, **kwargs)
+        self.file_path = file_path
+        self.total_size = total_size
+        self.margin_seconds = (margin_seconds if margin_seconds is not None
+                               else settings.TRANSCRIPTION_INCREMENTAL_MARGIN_SECONDS)
+        self.layout: Optional[Mp4Layout] = None
+        self.duration: Optional[float] = None
+        self.deferred = False
+        self._codec: Optional[str] = None
+        self._cursor = 0.0
+        # 已開始轉錄的分段：(起始秒數, 結束秒數, 轉錄結果)
+        self._segments: List[Tuple[float, float, Future]] = []
+        # 提前轉錄的分段送出的音訊用量
+        self._early_usage: List[Dict[str, float]] = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="transcribe")
+
+    def _defer(self, reason: str) -> None:
+        self.deferred = True
+        logger.info(f"{os.path.basename(self.file_path)} {reason}，上傳完成後才轉錄")
+
+    def _horizon(self, available: int) -> float:
+        """估計已收到的資料可解碼到的秒數"""
+        media_start = self.layout.media_start
+        fraction = (available - media_start) / max(self.total_size - media_start, 1)
+        return max(0.0, min(fraction, 1.0)) * self.duration - self.margin_seconds
+
+    def _submit(self, start: float, end: float) -> None:
+        index = len(self._segments)
+        future = self._executor.submit(contextvars.copy_context().run, self._transcribe_early,
+                                       self.file_path, self._codec, index, start, end)
+        self._segments.append((start, end, future))
+
+    def _transcribe_early(self, file_path: str, codec: Optional[str], index: int,
+                          start: float, end: float) -> ChunkResult:
+        """
+        上傳期間轉錄分段；此時仍在上傳請求的context中，音訊用量另外累計，於 transcribe 時併入完成請求的用量
+        """
+        with track_usage() as usage:
+            try:
+                return self._transcribe_chunk(file_path, codec, index, start, end)
+            finally:
+                with self._lock:
+                    self._early_usage.append(dict(usage))
+
+    def advance(self, available: int) -> int:
+        """
+        開始轉錄已收到的資料中完整的分段，可在每次收到資料後重複呼叫（於背景執行緒執行）
+
+        Args:
+            available: 檔案開頭已連續寫入的位元組數
+
+        Returns:
+            已開始轉錄的分段數
+        """
+        with self._lock:
+            if self.deferred or self._closed:
+                return len(self._segments)
+            try:
+                if self.layout is None:
+                    self.layout = read_mp4_layout(self.file_path, available, self.total_size)
+                    if self.layout is None:
+                        return 0
+                    if not self.layout.faststart:
+                        self._defer("的索引（moov）位於檔案結尾")
+                        return 0
+                    self.duration = probe_duration(self.file_path)
+                    if self.duration is None:
+                        self._defer("無法判斷長度")
+                        return 0
+                    self._codec = probe_audio_codec(self.file_path)
+                horizon = self._horizon(available)
+                while horizon - self._cursor > self.chunk_seconds * 1.25:
+                    # 只解碼切點可能所在的區間尋找靜音
+                    silences, _ = detect_silences(
+                        self.file_path, settings.TRANSCRIPTION_SILENCE_DB, settings.TRANSCRIPTION_MIN_SILENCE_SECONDS,
+                        start=self._cursor + self.chunk_seconds * 0.5, length=self.chunk_seconds * 0.75
+                    )
+                    midpoints = sorted((start + end) / 2 for start, end in silences)
+                    cut, end = choose_cut(self._cursor, midpoints, self.chunk_seconds, self.overlap_seconds,
+                                          self.duration)
+                    self._submit(self._cursor, end)
+                    self._cursor = cut
+            except (AudioExtractionError, OSError) as e:
+                self._defer(f"無法提前解碼（{str(e)}）")
+            return len(self._segments)
+
+    def status(self) -> Dict[str, Any]:
+        """提前轉錄的進度"""
+        with self._lock:
+            segments = list(self._segments)
+            mode = "deferred" if self.deferred else "incremental" if segments else "waiting"
+        done = [segment for segment in segments if segment[2].done()]
+        # 從開頭起連續完成的分段涵蓋的秒數
+        transcribed = 0.0
+        for start, end, future in segments:
+            if not future.done():
+                break
+            transcribed = end
+        return {
+            "mode": mode,
+            "segments_started": len(segments),
+            "segments_done": len(done),
+            "transcribed_seconds": round(transcribed, 1),
+            "duration_seconds": round(self.duration, 1) if self.duration else None,
+        }
+
+    def transcribe(self, file_path: str) -> str:
+        """
+        上傳完成後呼叫：轉錄剩餘的分段，等待所有分段後依序合併
+
+        Args:
+            file_path: 已完整寫入的影片檔案路徑
+
+        Returns:
+            合併後的轉錄文本
+        """
+        with self._lock:
+            self._closed = True
+            segments = list(self._segments)
+            cursor = self._cursor
+        try:
+            if not segments:
+                # 尚未開始（較短的錄音、moov 在結尾或無法提前解碼）時與一般轉錄相同
+                return super().transcribe(file_path)
+            early = len(segments)
+            try:
+                silences, _ = detect_silences(
+                    file_path, settings.TRANSCRIPTION_SILENCE_DB, settings.TRANSCRIPTION_MIN_SILENCE_SECONDS,
+                    start=cursor
+                )
+            except (AudioExtractionError, OSError) as e:
+                # 上傳完成後無法執行ffmpeg：放棄提前轉錄的結果，整段轉錄（extract_audio 會改用moviepy）
+                logger.warning(f"無法偵測剩餘部分的靜音（{str(e)}），改為整段轉錄")
+                return self._transcribe_single(file_path)
+            tail = plan_chunks(self.duration - cursor, [(start - cursor, end - cursor) for start, end in silences],
+                               self.chunk_seconds, self.overlap_seconds)
+            for start, end in tail:
+                segments.append((cursor + start, cursor + end, self._executor.submit(
+                    contextvars.copy_context().run, self._transcribe_chunk, file_path, self._codec, len(segments),
+                    cursor + start, cursor + end
+                )))
+            logger.info(f"{os.path.basename(file_path)} 上傳期間已轉錄 {early} 段，完成後再轉錄 {len(tail)} 段")
+            parts = []
+            for index, (start, end, future) in enumerate(segments):
+                try:
+                    parts.append(future.result())
+                except Exception:
+                    if index >= early:
+                        raise
+                    # 提前轉錄的分段失敗時以完整的檔案重新轉錄一次
+                    parts.append(self._transcribe_chunk(file_path, self._codec, index, start, end))
+            with self._lock:
+                early_usage = list(self._early_usage)
+            for usage in early_usage:
+                merge_usage(usage)
+            overlapped = [i > 0 and segments[i - 1][1] > segments[i][0] for i in range(len(segments))]
+            return self._merge(parts, overlapped)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """停止提前轉錄並釋放執行緒（取消上傳時呼叫）"""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import math
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+
+from app.config import settings
+from app.core.metrics import count_bytes, timed
+from app.core.executor import run_blocking
+from app.core.processors.base_processor import BaseProcessor
+from app.core.processors.registry import registry
+from app.core.uploads import create_workspace, remove_workspace, upload_path
+
+if TYPE_CHECKING:
+    from app.core.transcription import IncrementalTranscriber
+
+logger = logging.getLogger(__name__)
+
+
+class UploadSessionError(Exception):
+    """上傳工作階段的請求不合法"""
+
+
+class IncompleteUploadError(UploadSessionError):
+    """完成上傳時仍有區塊尚未收到"""
+
+    def __init__(self, missing: List[int]):
+        super().__init__(f"尚有 {len(missing)} 個區塊未上傳")
+        self.missing = missing
+
+
+@dataclass
+class UploadSession:
+    """
+    可續傳的分塊上傳：檔案依固定的區塊大小編號，每個區塊寫入檔案中對應的位置，
+    重複上傳同一區塊會覆寫相同內容，連線中斷後只需補傳缺少的區塊
+    """
+    session_id: str
+    filename: str
+    size: int
+    chunk_size: int
+    workspace: str
+    file_path: str
+    received: Set[int] = field(default_factory=set)
+    contiguous: int = 0  # 從第0塊起連續收到的區塊數
+    finalizing: bool = False
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    # MP4 在上傳期間提前轉錄
+    transcriber: Optional["IncrementalTranscriber"] = field(default=None, repr=False)
+    advancing: bool = field(default=False, repr=False)
+
+    @property
+    def total_chunks(self) -> int:
+        return math.ceil(self.size / self.chunk_size)
+
+    @property
+    def contiguous_bytes(self) -> int:
+        return min(self.contiguous * self.chunk_size, self.size)
+
+    def chunk_length(self, index: int) -> int:
+        """第 index 塊應有的位元組數（最後一塊可較短）"""
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def missing(self) -> List[int]:
+        return [index for index in range(self.total_chunks) if index not in self.received]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """轉換為API回應格式（不包含伺服器端路徑）"""
+        return {
+            "session_id": self.session_id,
+            "filename": self.filename,
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "total_chunks": self.total_chunks,
+            "received_chunks": len(self.received),
+            "received_bytes": sum(self.chunk_length(index) for index in self.received),
+            "missing": self.missing(),
+            "transcription": self.transcriber.status() if self.transcriber else None,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+def _write_at(file_path: str, offset: int, data: bytes) -> None:
+    with open(file_path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+class UploadSessionManager:
+    """管理程序內的上傳工作階段，閒置超過 UPLOAD_SESSION_TTL 的工作階段連同已上傳的資料一併刪除"""
+
+    def __init__(self):
+        self._sessions: Dict[str, UploadSession] = {}
+        # 背景轉錄工作，保留參照避免被回收
+        self._tasks: Set[asyncio.Task] = set()
+
+    def create(self, filename: str, size: int, chunk_size: Optional[int] = None) -> UploadSession:
+        """
+        建立上傳工作階段
+
+        Args:
+            filename: 檔案名稱（決定處理器，MP4 會在上傳期間提前轉錄）
+            size: 完整檔案的位元組數
+            chunk_size: 區塊大小，預設使用 UPLOAD_SESSION_CHUNK_SIZE
+
+        Returns:
+            新建立的工作階段
+        """
+        self._purge_expired()
+        chunk_size = chunk_size or settings.UPLOAD_SESSION_CHUNK_SIZE
+        if size <= 0 or size > settings.UPLOAD_SESSION_MAX_SIZE:
+            raise UploadSessionError(f"檔案大小需介於1與 {settings.UPLOAD_SESSION_MAX_SIZE} 位元組之間")
+        if chunk_size <= 0 or chunk_size > settings.UPLOAD_SESSION_MAX_CHUNK_SIZE:
+            raise UploadSessionError(f"區塊大小需介於1與 {settings.UPLOAD_SESSION_MAX_CHUNK_SIZE} 位元組之間")
+        spec = registry.resolve(filename)
+        if spec is None:
+            raise UploadSessionError("不支援的檔案類型")
+
+        workspace = create_workspace(prefix="session_")
+        file_path = upload_path(workspace, filename)
+        open(file_path, "wb").close()
+        session = UploadSession(session_id=uuid.uuid4().hex, filename=os.path.basename(filename), size=size,
+                                chunk_size=chunk_size, workspace=workspace, file_path=file_path)
+        if spec.name == "mp4" and settings.TRANSCRIPTION_INCREMENTAL and settings.OPENAI_API_KEY:
+            # 轉錄相關模組（ffmpeg等）在第一次需要時才載入
+            from app.core.processors.mp4_processor import whisper_transcribe
+            from app.core.transcription import IncrementalTranscriber
+            session.transcriber = IncrementalTranscriber(file_path, size, whisper_transcribe)
+        self._sessions[session.session_id] = session
+        logger.info(f"已建立上傳工作階段 {session.session_id}: {session.filename} ({size} bytes, "
+                    f"{session.total_chunks} 個區塊)")
+        return session
+
+    def get(self, session_id: str) -> Optional[UploadSession]:
+        self._purge_expired()
+        return self._sessions.get(session_id)
+
+    async def write_chunk(self, session: UploadSession, index: int, data: bytes) -> None:
+        """
+        寫入一個區塊，MP4 收到新的連續資料時在背景開始轉錄已完整的分段
+
+        Args:
+            session: 上傳工作階段
+            index: 區塊編號（從0開始）
+            data: 區塊內容，除最後一塊外長度需等於區塊大小
+        """
+        if session.finalizing:
+            raise UploadSessionError("上傳已完成，不能再寫入區塊")
+        if not 0 <= index < session.total_chunks:
+            raise UploadSessionError(f"區塊編號需介於0與 {session.total_chunks - 1} 之間")
+        expected = session.chunk_length(index)
+        if len(data) != expected:
+            raise UploadSessionError(f"第 {index} 塊應為 {expected} 位元組，收到 {len(data)} 位元組")
+
+        with timed("upload", "chunk"):
+            await run_blocking(_write_at, session.file_path, index * session.chunk_size, data)
+        count_bytes("upload", len(data))
+        session.received.add(index)
+        session.updated_at = time.time()
+        while session.contiguous in session.received:
+            session.contiguous += 1
+        if session.transcriber is not None and not session.advancing:
+            session.advancing = True
+            task = asyncio.create_task(self._advance(session))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _advance(self, session: UploadSession) -> None:
+        """依連續收到的資料推進提前轉錄，期間收到的新資料在同一個背景工作中接著處理"""
+        try:
+            while not session.finalizing:
+                available = session.contiguous_bytes
+                await run_blocking(session.transcriber.advance, available)
+                if session.contiguous_bytes == available:
+                    break
+        except Exception as e:
+            logger.error(f"上傳工作階段 {session.session_id} 提前轉錄時出錯: {str(e)}")
+        finally:
+            session.advancing = False
+
+    def begin_finalize(self, session: UploadSession) -> BaseProcessor:
+        """
+        確認所有區塊都已收到並停止接受寫入
+
+        Returns:
+            處理完整檔案的處理器（MP4 沿用上傳期間的轉錄結果）
+
+        Raises:
+            IncompleteUploadError: 仍有區塊未收到
+        """
+        missing = session.missing()
+        if missing:
+            raise IncompleteUploadError(missing)
+        if session.finalizing:
+            raise UploadSessionError("上傳已在處理中")
+        session.finalizing = True
+        if session.transcriber is not None:
+            return registry.processor_class("mp4")(transcriber=session.transcriber)
+        processor = registry.create_for_path(session.file_path)
+        if processor is None:
+            raise UploadSessionError("不支援的檔案類型")
+        return processor
+
+    def remove(self, session_id: str) -> bool:
+        """刪除工作階段與已上傳的資料"""
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        if session.transcriber is not None:
+            session.transcriber.close()
+        remove_workspace(session.workspace)
+        return True
+
+    def close(self) -> None:
+        """刪除所有工作階段（應用程式關閉時呼叫）"""
+        for session_id in list(self._sessions):
+            self.remove(session_id)
+
+    def _purge_expired(self) -> None:
+        cutoff = time.time() - settings.UPLOAD_SESSION_TTL
+        for session_id, session in list(self._sessions.items()):
+            if session.updated_at < cutoff and not session.finalizing:
+                logger.info(f"上傳工作階段 {session_id} 已逾時，刪除已上傳的資料")
+                self.remove(session_id)
+
+
+# 全域上傳工作階段管理器
+upload_sessions = UploadSessionManager()
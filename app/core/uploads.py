@@ -0,0 +1,111 @@
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from fastapi import UploadFile
+
+from app.config import settings
+from app.core.metrics import count_bytes, timed
+from app.core.executor import run_blocking
+from app.core.processors.registry import SNIFF_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+def _workspace_root() -> str:
+    """選擇請求工作目錄的根目錄，優先使用tmpfs"""
+    tmpfs_dir = settings.UPLOAD_TMPFS_DIR
+    if tmpfs_dir and os.path.isdir(tmpfs_dir):
+        return tmpfs_dir
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    return settings.UPLOAD_DIR
+
+
+def create_workspace(prefix: str = "req_") -> str:
+    """建立唯一的臨時工作目錄，由呼叫端負責以 remove_workspace 清除"""
+    return tempfile.mkdtemp(prefix=prefix, dir=_workspace_root())
+
+
+def remove_workspace(workspace: str) -> None:
+    """刪除工作目錄及其中所有檔案"""
+    shutil.rmtree(workspace, ignore_errors=True)
+
+
+@contextmanager
+def request_workspace() -> Iterator[str]:
+    """
+    為單一請求建立唯一的臨時目錄，離開時無論成功或失敗都會清除
+
+    Yields:
+        臨時目錄路徑
+    """
+    workspace = create_workspace()
+    try:
+        yield workspace
+    finally:
+        remove_workspace(workspace)
+
+
+def _safe_filename(filename: Optional[str], directory: str) -> str:
+    """去除路徑成分，並避免同一請求內的同名檔案互相覆蓋"""
+    name = os.path.basename(filename or "") or "upload"
+    candidate = name
+    index = 1
+    while os.path.exists(os.path.join(directory, candidate)):
+        candidate = f"{index}_{name}"
+        index += 1
+    return candidate
+
+
+def upload_path(directory: str, filename: Optional[str]) -> str:
+    """在工作目錄中為上傳的檔案選擇路徑，不覆蓋同名檔案"""
+    return os.path.join(directory, _safe_filename(filename, directory))
+
+
+def _copy_stream(source, destination: str, chunk_size: int, digest: Any = None) -> int:
+    """以固定大小的區塊複製串流，返回寫入的位元組數；提供 digest（hashlib物件）時同時計算雜湊"""
+    written = 0
+    source.seek(0)
+    with open(destination, "wb") as f:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            f.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            written += len(chunk)
+    return written
+
+
+def read_head(file: UploadFile, size: int = SNIFF_BYTES) -> bytes:
+    """讀取上傳檔案開頭的位元組（沒有副檔名時用於判斷檔案類型），讀取後回到檔案開頭"""
+    file.file.seek(0)
+    head = file.file.read(size)
+    file.file.seek(0)
+    return head
+
+
+async def save_upload(file: UploadFile, directory: str, chunk_size: Optional[int] = None, digest: Any = None) -> str:
+    """
+    將上傳檔案分塊寫入磁碟，記憶體用量與檔案大小無關
+
+    Args:
+        file: 上傳的檔案
+        directory: 請求工作目錄
+        chunk_size: 每次複製的位元組數，預設使用設定值
+        digest: 可選的hashlib物件，寫入時一併計算內容雜湊（不需再讀一次檔案）
+
+    Returns:
+        寫入後的檔案路徑
+    """
+    file_path = upload_path(directory, file.filename)
+    with timed("upload"):
+        size = await run_blocking(_copy_stream, file.file, file_path, chunk_size or settings.UPLOAD_CHUNK_SIZE,
+                                  digest)
+    count_bytes("upload", size)
+    logger.info(f"已保存上傳檔案 {file.filename} ({size} bytes)")
+    return file_path
@@ -0,0 +1,62 @@
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.scheduler import scheduler
+
+
+@dataclass
+class TokenUsage:
+    """一次報告生成（可能包含多次模型呼叫）累計的權杖用量"""
+    prompt_tokens: int = 0
+    cached_tokens: int = 0  # prompt_tokens 中命中服務提供者前綴快取的部分
+    completion_tokens: int = 0
+    calls: int = 0
+
+    def add(self, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.completion_tokens += completion_tokens
+        self.calls += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["cache_hit_rate"] = round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0
+        return data
+
+
+def record_usage(provider: str, values: Optional[Tuple[int, int, int]],
+                 usage: Optional[TokenUsage] = None) -> None:
+    """
+    記錄一次模型呼叫的用量：加到服務提供者的統計，並計入該次報告的累計
+
+    Args:
+        provider: 服務提供者名稱
+        values: (prompt_tokens, cached_tokens, completion_tokens)，回應沒有用量資訊時為None
+        usage: 該次報告的用量累計
+    """
+    if values is None:
+        return
+    if usage is not None:
+        usage.add(*values)
+    scheduler.limiter(provider).record_usage(*values)
+
+
+def openai_usage(usage: Any) -> Optional[Tuple[int, int, int]]:
+    """從OpenAI回應的 usage 取得 (輸入, 快取命中, 輸出) 權杖數"""
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    return usage.prompt_tokens or 0, cached, usage.completion_tokens or 0
+
+
+def gemini_usage(usage_metadata: Optional[Dict[str, Any]]) -> Optional[Tuple[int, int, int]]:
+    """從LangChain訊息的 usage_metadata 取得 (輸入, 快取命中, 輸出) 權杖數"""
+    if not usage_metadata:
+        return None
+    details = usage_metadata.get("input_token_details") or {}
+    return (
+        usage_metadata.get("input_tokens") or 0,
+        details.get("cache_read") or 0,
+        usage_metadata.get("output_tokens") or 0,
+    )
@@ -1,9 +1,36 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.api.routes import router as api_router
 from app.config import settings
+from app.core.clients import clients
+from app.core.jobs import job_manager
+from app.core.metrics import render_metrics
+from app.core.executor import run_blocking, shutdown_executor
+from app.core.process_pool import shutdown_process_pool
+from app.core.processors.registry import registry
+from app.core.report_store import close_report_store
+from app.core.upload_sessions import upload_sessions
 
-app = FastAPI(title="檔案處理API", description="處理不同類型檔案並整合報告")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """應用程式啟動時開始任務工作者（設定 PROCESSOR_WARMUP 時先預熱處理器與共用客戶端），關閉時釋放資源"""
+    warmup = [name.strip() for name in settings.PROCESSOR_WARMUP.split(",") if name.strip()]
+    if warmup:
+        await run_blocking(clients.warmup)
+        await run_blocking(registry.warmup, None if "all" in warmup else warmup)
+        clients.async_openai()  # 非同步客戶端需在事件迴圈中建立
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+    upload_sessions.close()
+    await clients.aclose()
+    await run_blocking(close_report_store)
+    shutdown_executor()
+    shutdown_process_pool()
+
+app = FastAPI(title="檔案處理API", description="處理不同類型檔案並整合報告", lifespan=lifespan)
 
 # 配置CORS
 app.add_middleware(
@@ -21,6 +48,11 @@ app.include_router(api_router, prefix="/api")
 async def root():
     return {"message": "歡迎使用檔案處理API"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 格式的各階段耗時、位元組與權杖計數、重試與錯誤次數及目前並行數"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
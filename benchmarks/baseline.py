@@ -0,0 +1,71 @@
+"""
+基準結果的保存與比較（micro 與 load_test 共用）
+
+結果為 {"名稱": {指標: 數值}}，比較時只檢查指定的指標，
+超過容許比例的退步列為 regressions
+"""
+import json
+import os
+import platform
+from datetime import datetime
+from typing import Any, Dict, List
+
+# 指標 -> 數值較小為佳（lower）或較大為佳（higher）
+Directions = Dict[str, str]
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, Any]], config: Dict[str, Any]) -> None:
+    """寫入基準檔，附上執行環境以便判斷比較是否有意義"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    data = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def compare_baseline(path: str, results: Dict[str, Dict[str, Any]], directions: Directions,
+                     tolerance: float) -> Dict[str, Any]:
+    """
+    與基準檔比較
+
+    Args:
+        path: 基準檔路徑
+        results: 本次結果
+        directions: 要比較的指標及其方向
+        tolerance: 容許的退步比例（0.2 表示 20%）
+
+    Returns:
+        {"baseline": 路徑, "changes": [...], "regressions": [...]}
+    """
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+
+    changes: List[Dict[str, Any]] = []
+    for name, metrics in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, direction in directions.items():
+            old, new = previous.get(metric), metrics.get(metric)
+            if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or old == 0:
+                continue
+            change = (new - old) / old
+            worse = change > tolerance if direction == "lower" else change < -tolerance
+            changes.append({
+                "name": name, "metric": metric, "baseline": old, "current": new,
+                "change": round(change, 4), "regression": worse,
+            })
+    return {
+        "baseline": path,
+        "changes": changes,
+        "regressions": [c for c in changes if c["regression"]],
+    }
@@ -0,0 +1,98 @@
+"""
+比較送出轉錄前的音訊前處理對上傳量與音訊長度的影響
+
+用法:
+    python -m benchmarks.bench_audio_conditioning [影片路徑] [--minutes 10] [--repeat 3]
+
+未指定影片時以 ffmpeg 產生雙聲道 44.1kHz AAC 的測試影片，每 --cycle 秒中最後 --pause 秒為靜音
+（模擬諮詢中翻閱紀錄的停頓）。依序量測：
+- copy：停用 AUDIO_CONDITIONING，直接複製AAC串流（改版前的行為）
+- speech：單聲道 16kHz、AUDIO_CODEC / AUDIO_BITRATE，不去除靜音
+- speech_trimmed：另去除長於 AUDIO_TRIM_MIN_SILENCE_SECONDS 的靜音
+上傳秒數以 --uplink-mbps 的上行頻寬估算。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Any, Dict
+
+from app.config import settings
+from app.core import audio_extractor
+
+
+def make_clip(path: str, seconds: int, cycle: int, pause: int) -> None:
+    """以 ffmpeg 測試訊號產生 H.264 + 雙聲道AAC 的 MP4"""
+    subprocess.run(
+        [settings.FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y",
+         "-f", "lavfi", "-i",
+         f"aevalsrc='if(lt(mod(t,{cycle}),{cycle - pause}),0.5*sin(2*PI*440*t),0)|"
+         f"if(lt(mod(t,{cycle}),{cycle - pause}),0.5*sin(2*PI*660*t),0)':s=44100:d={seconds}",
+         "-f", "lavfi", "-i", f"testsrc=size=160x120:rate=5:d={seconds}",
+         "-c:a", "aac", "-b:a", "128k", "-c:v", "mpeg4", "-shortest", path],
+        check=True
+    )
+
+
+def measure(path: str, repeat: int, uplink_mbps: float, **overrides: Any) -> Dict[str, Any]:
+    saved = {name: getattr(settings, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    try:
+        durations = []
+        audio = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            audio = audio_extractor.extract_audio(path)
+            durations.append(time.perf_counter() - start)
+    finally:
+        for name, value in saved.items():
+            setattr(settings, name, value)
+    return {
+        "method": audio.method,
+        "codec": audio.codec,
+        "bytes": len(audio.data),
+        "audio_seconds": round(audio.seconds, 1) if audio.seconds is not None else None,
+        "kept_intervals": len(audio.timeline.intervals) if audio.timeline else None,
+        "extract_seconds": round(statistics.median(durations), 3),
+        "upload_seconds": round(len(audio.data) * 8 / (uplink_mbps * 1_000_000), 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video", nargs="?")
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--cycle", type=int, default=30, help="語音加停頓的週期（秒）")
+    parser.add_argument("--pause", type=int, default=8, help="每個週期結尾的靜音秒數")
+    parser.add_argument("--uplink-mbps", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = args.video
+        if path is None:
+            path = os.path.join(temp_dir, "sample.mp4")
+            make_clip(path, int(args.minutes * 60), args.cycle, args.pause)
+        results = {
+            "copy": measure(path, args.repeat, args.uplink_mbps, AUDIO_CONDITIONING=False),
+            "speech": measure(path, args.repeat, args.uplink_mbps, AUDIO_CONDITIONING=True, AUDIO_TRIM_SILENCE=False),
+            "speech_trimmed": measure(path, args.repeat, args.uplink_mbps, AUDIO_CONDITIONING=True,
+                                      AUDIO_TRIM_SILENCE=True),
+        }
+        source_seconds = audio_extractor.probe_duration(path)
+
+    print(json.dumps({
+        "source_seconds": round(source_seconds, 1) if source_seconds else None,
+        "codec": settings.AUDIO_CODEC,
+        "bitrate": settings.AUDIO_BITRATE,
+        "sample_rate": settings.AUDIO_SAMPLE_RATE,
+        "results": results,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+比較 ffmpeg 串流複製與 moviepy 解碼兩種音訊提取方式的耗時
+
+用法:
+    python -m benchmarks.bench_audio_extraction [影片路徑] [--seconds 600] [--repeat 3]
+
+未指定影片時以 ffmpeg 產生含 AAC 音訊的測試影片。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+from app.config import settings
+from app.core import audio_extractor
+
+
+def make_sample_clip(path: str, seconds: int) -> None:
+    """以 ffmpeg 測試訊號產生 H.264 + AAC 的 MP4"""
+    subprocess.run(
+        [settings.FFMPEG_BINARY, "-loglevel", "error", "-y",
+         "-f", "lavfi", "-i", "testsrc=size=640x360:rate=25",
+         "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+         "-t", str(seconds), "-c:v", "libx264", "-preset", "ultrafast",
+         "-c:a", "aac", "-shortest", path],
+        check=True
+    )
+
+
+def time_call(func, path: str, repeat: int) -> dict:
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(path)
+        durations.append(time.perf_counter() - start)
+    return {
+        "method": result.method,
+        "codec": result.codec,
+        "bytes": len(result.data),
+        "median_seconds": round(statistics.median(durations), 4),
+        "min_seconds": round(min(durations), 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clip", nargs="?", help="測試影片路徑")
+    parser.add_argument("--seconds", type=int, default=600, help="產生測試影片的長度（秒）")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        clip = args.clip
+        if not clip:
+            clip = os.path.join(temp_dir, "sample.mp4")
+            make_sample_clip(clip, args.seconds)
+
+        results = {
+            "clip": os.path.basename(clip),
+            "clip_bytes": os.path.getsize(clip),
+            "ffmpeg": time_call(audio_extractor.extract_audio, clip, args.repeat),
+            "moviepy": time_call(audio_extractor._extract_with_moviepy, clip, args.repeat),
+        }
+        results["speedup"] = round(
+            results["moviepy"]["median_seconds"] / max(results["ffmpeg"]["median_seconds"], 1e-9), 1
+        )
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+比較舊版 Excel 問卷提取（每個表單各讀一次活頁簿、iterrows、字串累加）
+與 ExcelProcessor（一次讀取所有表單、欄位向量運算）的耗時
+
+用法:
+    python -m benchmarks.bench_excel [問卷路徑] [--rows 5000] [--repeat 3]
+
+未指定問卷時產生含「基本問卷」、「身型問卷」與一個其他表單的測試活頁簿，
+並確認兩種方式的輸出相同。
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import pandas as pd
+
+from app.core.processors.excel_processor import ExcelProcessor
+
+
+def make_sample_workbook(path: str, rows: int) -> None:
+    """產生測試用問卷活頁簿，部分列缺答案或備註"""
+    def questionnaire(prefix: str) -> pd.DataFrame:
+        return pd.DataFrame({
+            "問題": [f"{prefix}問題{i}：最近一週的飲食與睡眠狀況如何？" for i in range(rows)],
+            "答案": [None if i % 17 == 0 else f"答案{i}，每天約睡{6 + i % 3}小時" for i in range(rows)],
+            "備註": [f"備註{i}" if i % 5 == 0 else None for i in range(rows)],
+        })
+
+    with pd.ExcelWriter(path) as writer:
+        questionnaire("基本").to_excel(writer, sheet_name="基本問卷", index=False)
+        questionnaire("身型").to_excel(writer, sheet_name="身型問卷", index=False)
+        pd.DataFrame({
+            "日期": [f"2024-01-{i % 28 + 1:02d}" for i in range(rows // 10)],
+            "體重": [60 + i % 10 for i in range(rows // 10)],
+        }).to_excel(writer, sheet_name="體重紀錄", index=False)
+
+
+def legacy_extract(file_path: str) -> str:
+    """舊版 JsonProcessor 的 Excel 分支（僅供比較）"""
+    output_text = ""
+    filename = os.path.basename(file_path)
+    for sheet in ["基本問卷", "身型問卷"]:
+        try:
+            df = pd.read_excel(file_path, sheet_name=sheet)
+            if not df.empty and "問題" in df.columns and "答案" in df.columns:
+                output_text += f"# 檔案: {filename} - {sheet}\n\n"
+                for _, row in df.iterrows():
+                    question = row.get("問題", "")
+                    answer = row.get("答案", "")
+                    note = row.get("備註", "")
+                    if pd.notna(question) and pd.notna(answer):
+                        output_text += f"問題: {question}\n答案: {answer}\n"
+                        if pd.notna(note):
+                            output_text += f"備註: {note}\n"
+                        output_text += "\n"
+        except Exception as e:
+            output_text += f"處理 '{sheet}' 表單時發生錯誤: {str(e)}\n\n"
+    try:
+        excel_file = pd.ExcelFile(file_path)
+        for sheet_name in excel_file.sheet_names:
+            if sheet_name not in ["基本問卷", "身型問卷"]:
+                df = pd.read_excel(file_path, sheet_name=sheet_name)
+                if not df.empty:
+                    output_text += f"# 檔案: {filename} - {sheet_name}\n\n"
+                    output_text += df.to_string(index=False) + "\n\n"
+    except Exception as e:
+        output_text += f"處理其他表單時發生錯誤: {str(e)}\n\n"
+    return output_text
+
+
+def time_call(func, path: str, repeat: int) -> tuple:
+    durations = []
+    result = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(path)
+        durations.append(time.perf_counter() - start)
+    return result, {
+        "chars": len(result),
+        "median_seconds": round(statistics.median(durations), 4),
+        "min_seconds": round(min(durations), 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("workbook", nargs="?", help="問卷活頁簿路徑")
+    parser.add_argument("--rows", type=int, default=5000, help="產生測試問卷時每個問卷表單的列數")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        workbook = args.workbook
+        if not workbook:
+            workbook = os.path.join(temp_dir, "questionnaire.xlsx")
+            make_sample_workbook(workbook, args.rows)
+
+        legacy_text, legacy = time_call(legacy_extract, workbook, args.repeat)
+        current_text, current = time_call(ExcelProcessor().process, workbook, args.repeat)
+        results = {
+            "workbook": os.path.basename(workbook),
+            "legacy": legacy,
+            "excel_processor": current,
+            "identical_output": legacy_text == current_text,
+            "speedup": round(legacy["median_seconds"] / max(current["median_seconds"], 1e-9), 1),
+        }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
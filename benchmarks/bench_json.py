@@ -0,0 +1,80 @@
+"""
+比較 JSON 整份載入與 ijson 逐步解析兩種模式的耗時與記憶體峰值
+
+用法:
+    python -m benchmarks.bench_json [--records 20000 100000] [--fields answers.a]
+
+為每個筆數產生一份 EHR 匯出格式的 JSON 陣列，以 tracemalloc 量測處理時的
+Python 記憶體峰值（tracemalloc 會使耗時偏高）。逐步解析時只有輸出文本隨輸入增加，
+不保留輸出的 stream_generator_only 峰值應不隨輸入大小增加。
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from app.config import settings
+from app.core.processors.json_processor import JsonProcessor
+
+
+def make_export(path: str, records: int) -> None:
+    """逐筆寫入測試用的病歷匯出陣列"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i in range(records):
+            record = {
+                "id": i,
+                "patient": {"name": f"病患{i}", "age": 20 + i % 60},
+                "answers": [{"q": "最近睡眠品質如何？", "a": f"普通{i}"}, {"q": "每日飲水量", "a": "2000ml"}],
+                "vitals": {"bp": [120, 80], "hr": 70 + i % 20},
+            }
+            f.write(("," if i else "") + json.dumps(record, ensure_ascii=False))
+        f.write("]")
+
+
+def measure(path: str, stream: bool, fields: list, collect: bool = True) -> dict:
+    """collect 為 False 時只逐段讀取 iter_lines 而不保留輸出，量測解析本身的記憶體峰值"""
+    settings.JSON_STREAM_MIN_BYTES = 0 if stream else 1 << 62
+    processor = JsonProcessor(fields=fields)
+    tracemalloc.start()
+    start = time.perf_counter()
+    if collect:
+        chars = len(processor.process(path))
+    else:
+        chars = sum(len(chunk) for chunk in processor.iter_lines(path))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 3), "peak_mb": round(peak / 1024 / 1024, 1), "chars": chars}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--fields", nargs="*", default=["answers.a"], help="欄位白名單，不指定值表示全部輸出")
+    args = parser.parse_args()
+
+    try:
+        import ijson  # noqa: F401
+    except ImportError:
+        raise SystemExit("需要安裝 ijson 才能比較逐步解析模式")
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for records in args.records:
+            path = os.path.join(temp_dir, f"export_{records}.json")
+            make_export(path, records)
+            results.append({
+                "records": records,
+                "input_mb": round(os.path.getsize(path) / 1024 / 1024, 1),
+                "load": measure(path, False, args.fields),
+                "stream": measure(path, True, args.fields),
+                "stream_generator_only": measure(path, True, args.fields, collect=False),
+            })
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
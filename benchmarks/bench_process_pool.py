@@ -0,0 +1,116 @@
+"""
+比較在執行緒池與程序池中同時提取多個檔案的吞吐量與事件迴圈延遲
+
+用法:
+    python -m benchmarks.bench_process_pool [--files 24] [--workers 1 2 4] [--repeat 3]
+
+產生 Excel 問卷、JSON 匯出與 GBK 文本（需經候選編碼判斷）各三分之一，
+以 pipeline.extract_texts 同時提取全部檔案：
+- threads：PROCESS_POOL_KINDS 留空，全部在執行緒池執行（共用GIL）
+- processes_N：excel,json,text 交由 N 個子程序執行，文本經由工作目錄中的檔案傳回
+每種模式先以一輪提取預熱（建立程序池與載入處理器），再取 --repeat 輪的中位數。
+同時以每10毫秒醒來一次的協程量測事件迴圈的最大延遲（GIL競爭會讓它變長）。
+吞吐量隨子程序數增加的幅度受限於機器的CPU核心數（結果中的 cpu_count）。
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from app.config import settings
+from app.core import process_pool
+from app.core.pipeline import extract_texts, shutdown_executor
+from app.core.processors.registry import registry
+from benchmarks.bench_excel import make_sample_workbook
+from benchmarks.bench_json import make_export
+from benchmarks.bench_text import LINE
+
+KINDS = "excel,json,text"
+
+
+def make_files(directory: str, count: int, text_kb: int, json_records: int, excel_rows: int) -> List[str]:
+    paths = []
+    for i in range(count):
+        if i % 3 == 0:
+            path = os.path.join(directory, f"questionnaire{i}.xlsx")
+            make_sample_workbook(path, excel_rows)
+        elif i % 3 == 1:
+            path = os.path.join(directory, f"export{i}.json")
+            make_export(path, json_records)
+        else:
+            path = os.path.join(directory, f"notes{i}.txt")
+            with open(path, "w", encoding="gbk") as f:
+                f.write(LINE * max(1, text_kb * 1024 // len(LINE.encode("gbk"))))
+        paths.append(path)
+    return paths
+
+
+async def run_round(paths: List[str]) -> Tuple[float, float, int]:
+    """同時提取所有檔案，返回 (秒數, 事件迴圈最大延遲秒數, 文本總字元數)"""
+    tasks = [(registry.create(path), path) for path in paths]
+    done = asyncio.Event()
+    max_lag = 0.0
+
+    async def ticker() -> None:
+        nonlocal max_lag
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_lag = max(max_lag, time.perf_counter() - start - 0.01)
+
+    probe = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    texts = await extract_texts(tasks)
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe
+    return elapsed, max_lag, sum(len(text) for text in texts)
+
+
+def measure(paths: List[str], kinds: str, workers: int, repeat: int) -> Dict[str, Any]:
+    settings.PROCESS_POOL_KINDS = kinds
+    settings.PROCESS_POOL_WORKERS = workers
+    process_pool.shutdown_process_pool()
+
+    async def run() -> List[Tuple[float, float, int]]:
+        await run_round(paths)
+        return [await run_round(paths) for _ in range(repeat)]
+
+    rounds = asyncio.run(run())
+    process_pool.shutdown_process_pool()
+    shutdown_executor()
+    seconds = statistics.median(r[0] for r in rounds)
+    return {
+        "seconds": round(seconds, 3),
+        "files_per_second": round(len(paths) / seconds, 2),
+        "max_loop_lag_ms": round(statistics.median(r[1] for r in rounds) * 1000, 1),
+        "chars": rounds[-1][2],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=24)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--text-kb", type=int, default=2048)
+    parser.add_argument("--json-records", type=int, default=5000)
+    parser.add_argument("--excel-rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = make_files(temp_dir, args.files, args.text_kb, args.json_records, args.excel_rows)
+        results = {"threads": measure(paths, "", 0, args.repeat)}
+        for workers in args.workers:
+            results[f"processes_{workers}"] = measure(paths, KINDS, workers, args.repeat)
+
+    print(json.dumps({"cpu_count": os.cpu_count(), "files": args.files, "results": results},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+驗證 ReportFormatter 與舊版 _format_report 的輸出相同，並比較兩者的格式化耗時
+
+用法:
+    python -m benchmarks.bench_report_formatter [--lines 20000] [--repeat 5]
+
+golden/report_formatter/ 中每個 .txt 為模型回應、同名 .md 為舊版格式化結果；
+每個案例分別以 format() 一次格式化，以及切成隨機長度的片段經 feed()/flush() 串流格式化，
+兩者都必須與 .md 完全相同，否則以非零狀態結束。
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+from app.core.llm_processor import REPORT_HEADER
+from app.core.report_formatter import ReportFormatter
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "golden", "report_formatter")
+SECTION_KEYWORDS = ["基本信息", "健康状况", "飲食習慣", "挑戰與目標", "總結", "結論", "建議"]
+
+
+def legacy_format_report(text: str, section_keywords: list) -> str:
+    """舊版 LLMProcessor._format_report（僅供比較）"""
+    formatted_text = REPORT_HEADER
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            formatted_text += "\n"
+            continue
+        is_section = False
+        for keyword in section_keywords:
+            if keyword in line and len(line) < 30:
+                formatted_text += f"\n## {line}\n\n"
+                is_section = True
+                break
+        if not is_section:
+            if ":" in line or "：" in line:
+                parts = line.split(":", 1) if ":" in line else line.split("：", 1)
+                if len(parts) == 2 and len(parts[0]) < 20:
+                    formatted_text += f"**{parts[0].strip()}**：{parts[1].strip()}\n\n"
+                else:
+                    formatted_text += f"{line}\n\n"
+            else:
+                formatted_text += f"{line}\n\n"
+    return formatted_text
+
+
+def legacy_format_line(line: str, section_keywords: list) -> str:
+    """舊版串流時使用的單行格式化（僅供比較）"""
+    line = line.strip()
+    if not line:
+        return "\n"
+    for keyword in section_keywords:
+        if keyword in line and len(line) < 30:
+            return f"\n## {line}\n\n"
+    if ":" in line or "：" in line:
+        parts = line.split(":", 1) if ":" in line else line.split("：", 1)
+        if len(parts) == 2 and len(parts[0]) < 20:
+            return f"**{parts[0].strip()}**：{parts[1].strip()}\n\n"
+    return f"{line}\n\n"
+
+
+def legacy_stream_format(tokens: list, section_keywords: list) -> str:
+    """舊版 LLMProcessor.stream 的逐行格式化（緩衝區字串累加後每次重新分割）"""
+    parts = [REPORT_HEADER]
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            parts.append(legacy_format_line(line, section_keywords))
+    parts.append(legacy_format_line(buffer, section_keywords))
+    return "".join(parts)
+
+
+def feed_tokens(tokens: list) -> str:
+    formatter = ReportFormatter(SECTION_KEYWORDS)
+    parts = [REPORT_HEADER]
+    for token in tokens:
+        parts.append(formatter.feed(token))
+    parts.append(formatter.flush())
+    return "".join(parts)
+
+
+def stream_format(text: str, rng: random.Random) -> str:
+    """將文本切成隨機長度的片段逐段餵入"""
+    formatter = ReportFormatter(SECTION_KEYWORDS)
+    parts = [REPORT_HEADER]
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 12)
+        parts.append(formatter.feed(text[position:position + size]))
+        position += size
+    parts.append(formatter.flush())
+    return "".join(parts)
+
+
+def check_golden() -> list:
+    """返回不相符的案例名稱"""
+    failures = []
+    rng = random.Random(0)
+    for path in sorted(glob.glob(os.path.join(GOLDEN_DIR, "*.txt"))):
+        with open(path, encoding="utf-8", newline="") as f:
+            text = f.read()
+        with open(path[:-4] + ".md", encoding="utf-8", newline="") as f:
+            expected = f.read()
+        name = os.path.basename(path)[:-4]
+        if ReportFormatter(SECTION_KEYWORDS, header=REPORT_HEADER).format(text) != expected:
+            failures.append(f"{name} (format)")
+        for _ in range(20):
+            if stream_format(text, rng) != expected:
+                failures.append(f"{name} (feed)")
+                break
+    return failures
+
+
+PARAGRAPH = (
+    "客戶表示最近兩週睡眠品質不佳，常在半夜兩三點醒來後難以再入睡，白天精神不濟，午餐後特別想睡，"
+    "並且會以含糖飲料提神。The patient also reports frequent late-night snacking and irregular dinner times."
+)
+
+
+def make_long_report(lines: int, paragraphs: bool = False) -> str:
+    """以 golden 案例重複組成長報告；paragraphs 為 True 時改以長段落的中英文敘述為主"""
+    if paragraphs:
+        block = [PARAGRAPH] * 8 + ["總結", "建議: 固定晚餐時間", ""]
+    else:
+        texts = []
+        for path in sorted(glob.glob(os.path.join(GOLDEN_DIR, "*.txt"))):
+            with open(path, encoding="utf-8", newline="") as f:
+                texts.append(f.read())
+        block = "\n".join(texts).split("\n")
+    return "\n".join((block * (lines // len(block) + 1))[:lines])
+
+
+def time_call(func, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return round(statistics.median(durations), 4)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=20000, help="長報告的行數")
+    parser.add_argument("--token-chars", type=int, default=3, help="串流比較時每個模型輸出片段的字元數")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = check_golden()
+    formatter = ReportFormatter(SECTION_KEYWORDS, header=REPORT_HEADER)
+    results = {"golden_failures": failures, "lines": args.lines}
+    identical = True
+    for corpus in ("golden_mix", "long_paragraphs"):
+        text = make_long_report(args.lines, paragraphs=corpus == "long_paragraphs")
+        tokens = [text[i:i + args.token_chars] for i in range(0, len(text), args.token_chars)]
+        legacy = time_call(lambda: legacy_format_report(text, SECTION_KEYWORDS), args.repeat)
+        current = time_call(lambda: formatter.format(text), args.repeat)
+        # 串流：同一份文本切成固定長度的片段逐段格式化
+        stream_legacy = time_call(lambda: legacy_stream_format(tokens, SECTION_KEYWORDS), args.repeat)
+        stream_feed = time_call(lambda: feed_tokens(tokens), args.repeat)
+        same = (legacy_format_report(text, SECTION_KEYWORDS) == formatter.format(text)
+                == legacy_stream_format(tokens, SECTION_KEYWORDS) == feed_tokens(tokens))
+        identical = identical and same
+        results[corpus] = {
+            "chars": len(text),
+            "legacy_seconds": legacy,
+            "formatter_seconds": current,
+            "speedup": round(legacy / max(current, 1e-9), 1),
+            "stream_legacy_seconds": stream_legacy,
+            "stream_feed_seconds": stream_feed,
+            "stream_speedup": round(stream_legacy / max(stream_feed, 1e-9), 1),
+            "identical_output": same,
+        }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if failures or not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+量測報告庫在大量報告下的寫入與查詢耗時
+
+用法:
+    python -m benchmarks.bench_report_store [--reports 200000] [--compression gzip]
+
+以 save 排入大量報告（背景批次寫入）後，量測第一頁、以游標翻到第100頁、
+依病患與模型篩選、讀取單份報告與清除過期報告的耗時。游標分頁與索引讓各查詢的耗時
+不隨報告數量增加。
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from app.core.report_store import ReportStore
+
+REPORT = "# 營養評估報告\n\n## 基本信息\n\n**姓名**：測試病患\n\n" + "建議每日固定吃早餐，增加蔬菜攝取。\n\n" * 40
+
+
+def time_call(func, repeat: int = 20) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return round(statistics.median(durations) * 1000, 3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=200000)
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--compression", default="gzip", choices=["zstd", "gzip", "none"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, "reports.db")
+        store = ReportStore(db_path, args.compression, retention_days=0)
+        usage = {"prompt_tokens": 3000, "cached_tokens": 1024, "completion_tokens": 800}
+        start = time.perf_counter()
+        last_id = None
+        for i in range(args.reports):
+            last_id = store.save(REPORT, patient_id=f"P{i % args.patients:05d}", request_id=f"job{i}",
+                                 model="OpenAI-4o-mini" if i % 3 else "Gemini", input_hash=f"{i:064x}",
+                                 usage=usage)
+        enqueue_seconds = time.perf_counter() - start
+        store.flush()
+        write_seconds = time.perf_counter() - start
+
+        def page(n: int, **filters) -> None:
+            cursor = None
+            for _ in range(n):
+                _, cursor = store.list(limit=50, cursor=cursor, **filters)
+
+        results = {
+            "reports": args.reports,
+            "compression": args.compression,
+            "enqueue_seconds": round(enqueue_seconds, 2),
+            "write_seconds": round(write_seconds, 2),
+            "db_mb": round(os.path.getsize(db_path) / 1024 / 1024, 1),
+            "report_bytes": len(REPORT.encode("utf-8")),
+            "first_page_ms": time_call(lambda: page(1)),
+            "page_100_ms": time_call(lambda: page(100), repeat=3),
+            "patient_filter_ms": time_call(lambda: page(1, patient_id="P00042")),
+            "model_filter_ms": time_call(lambda: page(1, model="Gemini")),
+            "get_ms": time_call(lambda: store.get(last_id)),
+        }
+        store.retention_days = 1
+        start = time.perf_counter()
+        results["pruned"] = store.prune(now=time.time() + 2 * 86400)
+        results["prune_seconds"] = round(time.perf_counter() - start, 2)
+        store.close()
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+量測應用程式的匯入時間與記憶體，以及處理器延遲載入對第一個請求的影響
+
+用法:
+    python -m benchmarks.bench_startup [--runs 5]
+
+每次量測都在新的子程序中進行，避免模組快取影響結果。匯入 app.main 後以 TestClient 執行
+應用程式的 lifespan 啟動流程，就緒時間包含匯入與 lifespan：
+- lazy：預設設定（處理器與共用客戶端在第一次使用時才載入）
+- eager：lifespan 前立即載入所有處理器（相當於改版前在匯入時載入全部處理器）
+- warmup：以 PROCESSOR_WARMUP=all 啟動，由 lifespan 預熱處理器與共用客戶端
+另量測第一個Excel請求的處理時間。各項取中位數。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+from benchmarks.bench_excel import make_sample_workbook
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["pandas", "openpyxl", "ffmpeg", "ijson", "chardet", "opencc", "moviepy", "langchain_google_genai"]
+
+SCRIPT = """
+import json, sys, time
+from fastapi.testclient import TestClient
+start = time.perf_counter()
+import app.main
+from app.core.processors.registry import registry
+import_seconds = time.perf_counter() - start
+mode, workbook = sys.argv[1], sys.argv[2]
+if mode == "eager":
+    for name in ("json", "excel", "mp4", "text"):
+        registry.processor_class(name)
+lifespan_start = time.perf_counter()
+with TestClient(app.main.app):
+    ready = time.perf_counter()
+    startup_seconds, ready_seconds = ready - lifespan_start, ready - start
+    start = time.perf_counter()
+    registry.create(workbook).process(workbook)
+    first_excel_seconds = time.perf_counter() - start
+    with open("/proc/self/status") as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "startup_seconds": startup_seconds,
+    "ready_seconds": ready_seconds,
+    "first_excel_seconds": first_excel_seconds,
+    "rss_mb": rss / 1024,
+}))
+"""
+
+RSS_SCRIPT = """
+import json, sys
+from fastapi.testclient import TestClient
+import app.main
+from app.core.processors.registry import registry
+if sys.argv[1] == "eager":
+    for name in ("json", "excel", "mp4", "text"):
+        registry.processor_class(name)
+with TestClient(app.main.app):
+    with open("/proc/self/status") as f:
+        print(next(int(line.split()[1]) for line in f if line.startswith("VmRSS:")) / 1024)
+    print(json.dumps([m for m in %r if m in sys.modules]))
+"""
+
+
+def run(script: str, mode: str, *argv: str) -> str:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env["PROCESSOR_WARMUP"] = "all" if mode == "warmup" else ""
+    return subprocess.run(
+        [sys.executable, "-c", script, mode, *argv], cwd=REPO_ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+
+
+def measure(mode: str, workbook: str, runs: int) -> Dict[str, Any]:
+    samples: List[Dict[str, Any]] = [
+        json.loads(run(SCRIPT, mode, workbook).strip().splitlines()[-1]) for _ in range(runs)
+    ]
+    # 啟動完成（尚未處理任何請求）時的記憶體與已載入的模組
+    rss_lines = run(RSS_SCRIPT % (HEAVY_MODULES,), mode).strip().splitlines()
+
+    def median(key: str) -> float:
+        return round(statistics.median(sample[key] for sample in samples), 4)
+
+    return {
+        "import_seconds": median("import_seconds"),
+        "startup_seconds": median("startup_seconds"),
+        "ready_seconds": median("ready_seconds"),
+        "ready_rss_mb": round(float(rss_lines[-2]), 1),
+        "loaded_at_ready": json.loads(rss_lines[-1]),
+        "first_excel_seconds": median("first_excel_seconds"),
+        "rss_after_excel_mb": round(median("rss_mb"), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        workbook = os.path.join(temp_dir, "questionnaire.xlsx")
+        make_sample_workbook(workbook, rows=20)
+        results = {mode: measure(mode, workbook, args.runs) for mode in ("lazy", "eager", "warmup")}
+    print(json.dumps({"runs": args.runs, "results": results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
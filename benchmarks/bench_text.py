@@ -0,0 +1,108 @@
+"""
+比較舊版 TextProcessor（每個候選編碼各讀一次檔案，全部失敗再讀一次交給 chardet）
+與目前版本（只讀一次，以樣本判斷編碼，超過 TEXT_STREAM_MIN_BYTES 時逐塊解碼）的耗時、讀取量與記憶體峰值
+
+用法:
+    python -m benchmarks.bench_text [--mb 20] [--repeat 3]
+
+產生 UTF-8、GBK 與 UTF-16（含BOM）三種編碼的測試文本；讀取量取自
+/proc/self/io 的 rchar（以 read 系統呼叫讀取的位元組數），記憶體峰值為另外執行一次時
+tracemalloc 記錄的Python配置峰值。
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from app.core.processors.text_processor import TextProcessor
+
+LINE = "病患主訴：最近兩週睡眠品質差，常在半夜醒來。Patient reports poor sleep.\n"
+
+
+def legacy_process(file_path: str) -> str:
+    """舊版 TextProcessor.process（僅供比較）"""
+    for encoding in ['utf-8', 'cp950', 'big5', 'gbk']:
+        try:
+            with open(file_path, 'r', encoding=encoding) as f:
+                content = f.read()
+            return f"# 檔案: {os.path.basename(file_path)}\n\n{content}\n\n"
+        except UnicodeDecodeError:
+            continue
+    with open(file_path, 'rb') as f:
+        binary_content = f.read()
+        try:
+            import chardet
+            encoding = chardet.detect(binary_content)['encoding']
+            if encoding:
+                return f"# 檔案: {os.path.basename(file_path)}\n\n{binary_content.decode(encoding)}\n\n"
+        except Exception:
+            pass
+    return f"無法讀取檔案: {os.path.basename(file_path)}，請檢查檔案編碼"
+
+
+def read_bytes() -> int:
+    """目前程序以 read 系統呼叫讀取的總位元組數，無法取得時返回-1"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return -1
+
+
+def measure(func, path: str, repeat: int) -> tuple:
+    durations = []
+    reads = []
+    result = ""
+    for _ in range(repeat):
+        before = read_bytes()
+        start = time.perf_counter()
+        result = func(path)
+        durations.append(time.perf_counter() - start)
+        reads.append(read_bytes() - before)
+    tracemalloc.start()
+    func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {
+        "median_seconds": round(statistics.median(durations), 4),
+        "read_mb": round(min(reads) / 1024 / 1024, 1) if before >= 0 else None,
+        "peak_mb": round(peak / 1024 / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=20, help="每個測試文本的大約大小（MB）")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = LINE * int(args.mb * 1024 * 1024 / len(LINE.encode("utf-8")))
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for encoding in ["utf-8", "gbk", "utf-16"]:
+            path = os.path.join(temp_dir, f"transcript_{encoding}.txt")
+            with open(path, "wb") as f:
+                f.write(text.encode(encoding))
+            legacy_text, legacy = measure(legacy_process, path, args.repeat)
+            processor = TextProcessor()
+            current_text, current = measure(processor.process, path, args.repeat)
+            results.append({
+                "encoding": encoding,
+                "file_mb": round(os.path.getsize(path) / 1024 / 1024, 1),
+                "detected": processor.detected_encoding._asdict() if processor.detected_encoding else None,
+                "legacy": legacy,
+                "text_processor": current,
+                # 舊版以 utf-8 解碼時保留 BOM，比較內容時忽略
+                "identical_output": legacy_text.replace("﻿", "") == current_text,
+            })
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
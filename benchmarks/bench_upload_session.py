@@ -0,0 +1,124 @@
+"""
+比較分塊上傳時邊上傳邊轉錄與上傳完成後才轉錄，從收到最後一個位元組到轉錄完成的等待時間
+
+用法:
+    python -m benchmarks.bench_upload_session [--minutes 10] [--upload-seconds 60] [--chunk-seconds 60]
+
+以ffmpeg產生 faststart 的測試影片（每12秒有2秒靜音），依 --upload-seconds 的速度分塊寫入檔案，
+每寫入一塊就在背景呼叫 IncrementalTranscriber.advance（與上傳工作階段相同）。
+轉錄以模擬的API代替：每段固定延遲 --api-latency 秒，另依音訊長度以 --api-speed 倍速計時。
+需要 ffmpeg（FFMPEG_BINARY）；沒有 ffprobe 時以 ffmpeg 的輸出判斷長度。
+"""
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from app.config import settings
+from app.core.audio_extractor import ExtractedAudio
+from app.core.transcription import ChunkedTranscriber, IncrementalTranscriber
+
+
+def make_video(path: str, seconds: int) -> None:
+    subprocess.run(
+        [settings.FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y",
+         "-f", "lavfi", "-i", f"aevalsrc='if(lt(mod(t,12),10),0.5*sin(2*PI*440*t),0)':s=16000:d={seconds}",
+         "-f", "lavfi", "-i", f"testsrc=size=160x120:rate=5:d={seconds}",
+         "-c:a", "aac", "-c:v", "mpeg4", "-shortest", "-movflags", "+faststart", path],
+        check=True
+    )
+
+
+def fake_transcribe(latency: float, speed: float):
+    """模擬轉錄API：依送出的音訊秒數計時（舊版提取結果沒有秒數時，以128kbps的MP3由位元組數推算）"""
+    def transcribe(audio: ExtractedAudio) -> str:
+        seconds = audio.seconds if audio.seconds is not None else len(audio.data) * 8 / 128000
+        time.sleep(latency + seconds / speed)
+        return f"約{seconds:.0f}秒的逐字稿。"
+    return transcribe
+
+
+def simulate_upload(source: str, target: str, upload_seconds: float, chunk_size: int,
+                    transcriber: Optional[IncrementalTranscriber] = None) -> float:
+    """依固定速度分塊寫入，返回寫入最後一塊的時間點"""
+    size = os.path.getsize(source)
+    chunks = max(1, -(-size // chunk_size))
+    interval = upload_seconds / chunks
+    lock = threading.Lock()
+    state = {"available": 0, "running": False}
+
+    def drive() -> None:
+        while True:
+            with lock:
+                available = state["available"]
+            transcriber.advance(available)
+            with lock:
+                if state["available"] == available:
+                    state["running"] = False
+                    return
+
+    open(target, "wb").close()
+    with open(source, "rb") as src, open(target, "r+b") as dst:
+        for index in range(chunks):
+            dst.write(src.read(chunk_size))
+            dst.flush()
+            if transcriber is not None:
+                with lock:
+                    state["available"] = min((index + 1) * chunk_size, size)
+                    start = not state["running"]
+                    state["running"] = True
+                if start:
+                    threading.Thread(target=drive, daemon=True).start()
+            time.sleep(interval)
+    return time.perf_counter()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--upload-seconds", type=float, default=60, help="上傳整個檔案所需的秒數")
+    parser.add_argument("--chunk-size", type=int, default=256 * 1024)
+    parser.add_argument("--chunk-seconds", type=float, default=60, help="轉錄分段長度")
+    parser.add_argument("--api-latency", type=float, default=1.0)
+    parser.add_argument("--api-speed", type=float, default=30.0, help="轉錄速度（音訊秒數／實際秒數）")
+    args = parser.parse_args()
+
+    transcribe_fn = fake_transcribe(args.api_latency, args.api_speed)
+    options = dict(chunk_seconds=args.chunk_seconds, max_concurrency=4, margin_seconds=15)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, "source.mp4")
+        make_video(source, int(args.minutes * 60))
+        size = os.path.getsize(source)
+
+        target = os.path.join(temp_dir, "after.mp4")
+        last_byte = simulate_upload(source, target, args.upload_seconds, args.chunk_size)
+        after_text = ChunkedTranscriber(transcribe_fn, args.chunk_seconds, max_concurrency=4).transcribe(target)
+        after_wait = time.perf_counter() - last_byte
+
+        target = os.path.join(temp_dir, "incremental.mp4")
+        transcriber = IncrementalTranscriber(target, size, transcribe_fn, **options)
+        last_byte = simulate_upload(source, target, args.upload_seconds, args.chunk_size, transcriber)
+        early = transcriber.status()
+        incremental_text = transcriber.transcribe(target)
+        incremental_wait = time.perf_counter() - last_byte
+
+    print(json.dumps({
+        "video_minutes": args.minutes,
+        "file_mb": round(size / 1024 / 1024, 1),
+        "upload_seconds": args.upload_seconds,
+        "transcribe_after_upload": {"wait_seconds": round(after_wait, 2), "chars": len(after_text)},
+        "incremental": {
+            "wait_seconds": round(incremental_wait, 2),
+            "chars": len(incremental_text),
+            "segments_started_during_upload": early["segments_started"],
+            "transcribed_seconds_at_last_byte": early["transcribed_seconds"],
+        },
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
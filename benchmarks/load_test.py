@@ -0,0 +1,241 @@
+"""
+對 /api/process 進行逐步提高並行數的壓力測試
+
+用法:
+    python -m benchmarks.load_test [--concurrency 1 4 8 16] [--requests 40]
+    python -m benchmarks.load_test --save-baseline benchmarks/baselines/load.json
+    python -m benchmarks.load_test --compare benchmarks/baselines/load.json [--tolerance 0.2]
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 [--pid 1234]
+
+未指定 --url 時會在臨時目錄啟動替身服務（benchmarks.stub_server）與應用程式，
+應用程式的 OPENAI_BASE_URL 指向替身服務，因此不需要也不會使用真實的API金鑰；
+自動啟動的應用程式停用LLM回應快取與每分鐘請求／權杖限制，量測的是應用程式本身的處理能力。
+每個並行數送出 --requests 個請求（預設上傳一份JSON與一份TXT，use_cache=false），
+輸出延遲的 p50／p95／p99、每秒完成數、錯誤數與應用程式程序的記憶體峰值（RSS）。
+--compare 時 p95 延遲或每秒完成數較基準退步超過容許比例即以狀態碼1結束。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.baseline import compare_baseline, save_baseline
+from benchmarks.bench_json import make_export
+from benchmarks.bench_text import LINE
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """最近排名法的百分位數"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def rss_mb(pid: int, field: str = "VmRSS") -> Optional[float]:
+    """讀取 /proc 中程序的記憶體用量（VmRSS 目前值，VmHWM 峰值）"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def make_fixtures(directory: str, records: int, text_kb: int) -> List[str]:
+    """產生預設上傳的JSON與TXT檔案"""
+    json_path = os.path.join(directory, "export.json")
+    make_export(json_path, records)
+    text_path = os.path.join(directory, "transcript.txt")
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.write(LINE * max(1, text_kb * 1024 // len(LINE.encode("utf-8"))))
+    return [json_path, text_path]
+
+
+def wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"服務未在 {timeout} 秒內啟動: {url}")
+
+
+def start_services(args: argparse.Namespace, workdir: str) -> Tuple[List[subprocess.Popen], str, int]:
+    """啟動替身服務與應用程式，返回 (程序列表, 應用程式網址, 應用程式PID)"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_server", "--port", str(args.stub_port),
+         "--latency", str(args.stub_latency), "--tokens-per-second", str(args.stub_tokens_per_second),
+         "--error-rate", str(args.stub_error_rate), "--seed", "0"],
+        cwd=workdir, env=env,
+    )
+    env.update({
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.stub_port}/v1",
+        "GOOGLE_BASE_URL": f"http://127.0.0.1:{args.stub_port}",
+        "LLM_CACHE_BACKEND": "none",
+        "TRANSCRIPTION_CACHE_ENABLED": "false",
+        # 量測應用程式本身的處理能力，不受服務提供者的每分鐘配額限制
+        "OPENAI_REQUESTS_PER_MINUTE": "0",
+        "OPENAI_TOKENS_PER_MINUTE": "0",
+        "GEMINI_REQUESTS_PER_MINUTE": "0",
+        "GEMINI_TOKENS_PER_MINUTE": "0",
+    })
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.app_port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    processes = [stub, app]
+    try:
+        wait_ready(f"http://127.0.0.1:{args.stub_port}/stats")
+        wait_ready(f"http://127.0.0.1:{args.app_port}/api/health")
+    except BaseException:
+        stop_services(processes)
+        raise
+    return processes, f"http://127.0.0.1:{args.app_port}", app.pid
+
+
+def stop_services(processes: List[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def run_level(url: str, files: List[str], concurrency: int, requests: int,
+                    pid: Optional[int]) -> Dict[str, Any]:
+    """以固定並行數送出請求，返回延遲分布、每秒完成數與RSS峰值"""
+    payloads = []
+    for path in files:
+        with open(path, "rb") as f:
+            payloads.append((os.path.basename(path), f.read()))
+
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    peak_rss = rss_mb(pid) if pid else None
+    remaining = iter(range(requests))
+    done = asyncio.Event()
+
+    async def sample_rss() -> None:
+        nonlocal peak_rss
+        while not done.is_set():
+            current = rss_mb(pid)
+            if current is not None:
+                peak_rss = max(peak_rss or 0, current)
+            await asyncio.sleep(0.05)
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        for _ in remaining:
+            files_field = [("files", (name, data)) for name, data in payloads]
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/api/process", files=files_field, data={"use_cache": "false"})
+                status = response.json().get("result", {}).get("status") if response.status_code == 200 else None
+                key = "ok" if status == "success" else f"http_{response.status_code}" if status is None else status
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            elapsed = time.perf_counter() - start
+            if key == "ok":
+                latencies.append(elapsed)
+            else:
+                errors[key] = errors.get(key, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        sampler = asyncio.create_task(sample_rss()) if pid else None
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+        done.set()
+        if sampler is not None:
+            await sampler
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "successes": len(latencies),
+        "errors": errors,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="已啟動的應用程式網址，未指定時自動啟動替身服務與應用程式")
+    parser.add_argument("--pid", type=int, help="搭配 --url 時量測RSS的應用程式PID")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=40, help="每個並行數送出的請求數")
+    parser.add_argument("--files", nargs="+", help="上傳的檔案，預設產生JSON與TXT測試檔")
+    parser.add_argument("--json-records", type=int, default=200)
+    parser.add_argument("--text-kb", type=int, default=16)
+    parser.add_argument("--app-port", type=int, default=8010)
+    parser.add_argument("--stub-port", type=int, default=8100)
+    parser.add_argument("--stub-latency", type=float, default=0.5)
+    parser.add_argument("--stub-tokens-per-second", type=float, default=0, help="0表示非串流回應不等待")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--save-baseline", help="將結果寫入基準檔")
+    parser.add_argument("--compare", help="與基準檔比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="容許的退步比例")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        files = args.files or make_fixtures(workdir, args.json_records, args.text_kb)
+        processes: List[subprocess.Popen] = []
+        url, pid = args.url, args.pid
+        if url is None:
+            processes, url, pid = start_services(args, workdir)
+        try:
+            levels = [
+                asyncio.run(run_level(url, files, concurrency, max(args.requests, concurrency), pid))
+                for concurrency in args.concurrency
+            ]
+            peak_hwm = rss_mb(pid, "VmHWM") if pid else None
+        finally:
+            stop_services(processes)
+
+    results = {f"concurrency_{level['concurrency']}": level for level in levels}
+    config = {k: v for k, v in vars(args).items()
+              if k not in ("save_baseline", "compare", "tolerance", "pid", "url")}
+    config["external_url"] = args.url is not None
+    output: Dict[str, Any] = {"config": config, "results": results, "process_peak_rss_mb": peak_hwm}
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results, config)
+    if args.compare:
+        output["comparison"] = compare_baseline(
+            args.compare, results, {"p95_ms": "lower", "throughput_rps": "higher"}, args.tolerance
+        )
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+    if args.compare and output["comparison"]["regressions"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
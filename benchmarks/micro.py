@@ -0,0 +1,92 @@
+"""
+處理器與報告格式化的微基準測試，以產生的測試資料量測各項耗時
+
+用法:
+    python -m benchmarks.micro [--repeat 5] [--save-baseline benchmarks/baselines/micro.json]
+    python -m benchmarks.micro --compare benchmarks/baselines/micro.json [--tolerance 0.2]
+
+量測 JsonProcessor、TextProcessor、Excel 問卷與 _format_report，每項取中位數與最小值。
+--compare 時有任何項目的最小耗時（較不受其他程序干擾）較基準慢超過容許比例即以狀態碼1結束。
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict
+
+from app.core.llm_processor import LLMProcessor
+from app.core.processors.excel_processor import ExcelProcessor
+from app.core.processors.json_processor import JsonProcessor
+from app.core.processors.text_processor import TextProcessor
+from benchmarks.baseline import compare_baseline, save_baseline
+from benchmarks.bench_excel import make_sample_workbook
+from benchmarks.bench_json import make_export
+from benchmarks.bench_report_formatter import make_long_report
+from benchmarks.bench_text import LINE
+
+
+def time_call(func: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    durations = []
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func()
+        durations.append(time.perf_counter() - start)
+    return {
+        "median_seconds": round(statistics.median(durations), 4),
+        "min_seconds": round(min(durations), 4),
+        "output_chars": len(output) if isinstance(output, str) else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json-records", type=int, default=20000)
+    parser.add_argument("--text-mb", type=float, default=5)
+    parser.add_argument("--excel-rows", type=int, default=5000)
+    parser.add_argument("--report-lines", type=int, default=20000)
+    parser.add_argument("--save-baseline", help="將結果寫入基準檔")
+    parser.add_argument("--compare", help="與基準檔比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="容許的退步比例")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        json_path = os.path.join(temp_dir, "export.json")
+        make_export(json_path, args.json_records)
+        results["json_processor"] = time_call(lambda: JsonProcessor(fields=[]).process(json_path), args.repeat)
+
+        text = LINE * int(args.text_mb * 1024 * 1024 / len(LINE.encode("utf-8")))
+        for encoding in ("utf-8", "cp950"):
+            text_path = os.path.join(temp_dir, f"transcript_{encoding}.txt")
+            with open(text_path, "wb") as f:
+                f.write(text.encode(encoding, errors="replace"))
+            results[f"text_processor_{encoding}"] = time_call(
+                lambda: TextProcessor().process(text_path), args.repeat
+            )
+
+        excel_path = os.path.join(temp_dir, "questionnaire.xlsx")
+        make_sample_workbook(excel_path, args.excel_rows)
+        results["excel_processor"] = time_call(lambda: ExcelProcessor().process(excel_path), args.repeat)
+
+    report = make_long_report(args.report_lines)
+    llm_processor = LLMProcessor()
+    results["format_report"] = time_call(lambda: llm_processor._format_report(report), args.repeat)
+
+    config = {k: v for k, v in vars(args).items() if k not in ("save_baseline", "compare", "tolerance")}
+    output: Dict[str, Any] = {"config": config, "results": results}
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results, config)
+    if args.compare:
+        output["comparison"] = compare_baseline(args.compare, results, {"min_seconds": "lower"}, args.tolerance)
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+    if args.compare and output["comparison"]["regressions"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
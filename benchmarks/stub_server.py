@@ -0,0 +1,270 @@
+"""
+模擬 OpenAI 與 Gemini API 的本地替身服務，供壓力測試在不呼叫真實服務的情況下執行
+
+用法:
+    python -m benchmarks.stub_server [--port 8100] [--latency 0.5] [--error-rate 0.05]
+
+支援的端點（回應格式與官方API相同）:
+    POST /v1/chat/completions                         （含 stream 與 stream_options.include_usage）
+    POST /v1/audio/transcriptions                     （含 response_format=text 與 verbose_json 的段落時間）
+    POST /v1beta/models/{model}:generateContent
+    POST /v1beta/models/{model}:streamGenerateContent  （?alt=sse）
+    GET  /stats                                       各端點的請求數與注入的錯誤數
+
+將應用程式的 OPENAI_BASE_URL 設為 http://127.0.0.1:8100/v1、GOOGLE_BASE_URL 設為
+http://127.0.0.1:8100 即可改用此服務。--latency 為回應（串流時為第一個片段）前的等待秒數，
+串流片段之間依 --tokens-per-second 等待；--error-rate 的請求返回 --error-status
+（429 時附帶 Retry-After），可用於觀察排程器的重試與斷路器。
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.core.scheduler import estimate_tokens
+
+# 替身回應的報告內容，包含各小節關鍵詞與鍵值對，讓報告格式化走過所有分支
+REPORT_TEXT = """基本信息
+姓名: 測試病患
+年齡: 45
+
+健康状况
+血壓偏高，近三個月體重增加約三公斤，睡眠品質普通。
+
+飲食習慣
+早餐：常略過
+晚餐：外食為主，偏油偏鹹
+
+挑戰與目標
+工作時間長，缺乏運動時間；目標為三個月內減重五公斤。
+
+建議
+1. 每日固定吃早餐，增加蔬菜與蛋白質攝取
+2. 晚餐減少油炸與醃漬食物
+3. 每週至少三次30分鐘快走
+
+總結
+整體狀況穩定，需持續追蹤血壓與體重變化。
+"""
+
+TRANSCRIPT_TEXT = "醫師您好，我最近睡得不太好，晚上常常醒來，白天也覺得很累。"
+
+
+@dataclass
+class StubConfig:
+    """替身服務的延遲與錯誤注入設定"""
+    latency: float = 0.5  # 回應前（串流時為第一個片段前）的等待秒數
+    jitter: float = 0.1  # 延遲的隨機增減比例
+    tokens_per_second: float = 200  # 串流輸出速度，0表示不等待
+    chunk_chars: int = 4  # 每個串流片段的字元數
+    whisper_latency: float = 1.0
+    error_rate: float = 0.0
+    error_status: int = 429
+    seed: Optional[int] = None
+
+
+def _sleep_seconds(base: float, config: StubConfig, rng: random.Random) -> float:
+    if base <= 0:
+        return 0.0
+    return max(0.0, base * (1 + rng.uniform(-config.jitter, config.jitter)))
+
+
+def _chunks(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    """建立替身服務"""
+    app = FastAPI(title="LLM替身服務")
+    rng = random.Random(config.seed)
+    counts: Counter = Counter()
+    # 已出現過的系統提示詞（模擬服務提供者的前綴快取）
+    seen_prefixes: set = set()
+
+    def injected_error(endpoint: str) -> Optional[JSONResponse]:
+        counts[endpoint] += 1
+        if config.error_rate <= 0 or rng.random() >= config.error_rate:
+            return None
+        counts[f"{endpoint}:error"] += 1
+        headers = {"Retry-After": "1"} if config.error_status == 429 else {}
+        body = {"error": {"message": "injected error", "type": "stub_error", "code": config.error_status}}
+        return JSONResponse(body, status_code=config.error_status, headers=headers)
+
+    def prompt_usage(prefix: str, rest: str) -> Dict[str, int]:
+        """輸入權杖數；相同前綴第二次出現時，1024權杖以上的部分以128為單位計為快取命中"""
+        prefix_tokens = estimate_tokens(prefix)
+        cached = 0
+        if prefix in seen_prefixes and prefix_tokens >= 1024:
+            cached = prefix_tokens // 128 * 128
+        seen_prefixes.add(prefix)
+        return {"prompt_tokens": prefix_tokens + estimate_tokens(rest), "cached_tokens": cached}
+
+    async def delay(seconds: float) -> None:
+        wait = _sleep_seconds(seconds, config, rng)
+        if wait:
+            await asyncio.sleep(wait)
+
+    async def paced(pieces: List[str]) -> AsyncIterator[int]:
+        """依設定的輸出速度逐一產生片段索引"""
+        interval = config.chunk_chars / config.tokens_per_second if config.tokens_per_second > 0 else 0
+        for index in range(len(pieces)):
+            if index and interval:
+                await asyncio.sleep(interval)
+            yield index
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        error = injected_error("chat")
+        if error is not None:
+            await delay(config.latency / 4)
+            return error
+        body = await request.json()
+        messages = body.get("messages", [])
+        system = "".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        rest = "".join(m.get("content", "") for m in messages if m.get("role") != "system")
+        usage = prompt_usage(system, rest)
+        completion_tokens = estimate_tokens(REPORT_TEXT)
+        usage_body = {
+            "prompt_tokens": usage["prompt_tokens"],
+            "completion_tokens": completion_tokens,
+            "total_tokens": usage["prompt_tokens"] + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": usage["cached_tokens"]},
+        }
+        model = body.get("model", "gpt-4o-mini")
+        created = int(time.time())
+        await delay(config.latency)
+
+        if not body.get("stream"):
+            return {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": REPORT_TEXT},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage_body,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        async def events() -> AsyncIterator[str]:
+            def chunk(delta: Dict[str, Any], finish: Optional[str] = None, usage: Any = None) -> str:
+                choices = [{"index": 0, "delta": delta, "finish_reason": finish}] if delta is not None else []
+                data = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                        "model": model, "choices": choices, "usage": usage}
+                return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+            pieces = _chunks(REPORT_TEXT, config.chunk_chars)
+            yield chunk({"role": "assistant", "content": ""})
+            async for index in paced(pieces):
+                yield chunk({"content": pieces[index]})
+            yield chunk({}, finish="stop")
+            if include_usage:
+                yield chunk(None, usage=usage_body)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        error = injected_error("transcriptions")
+        if error is not None:
+            return error
+        form = await request.form()
+        upload = form.get("file")
+        size = len(await upload.read()) if upload is not None and hasattr(upload, "read") else 0
+        counts["transcriptions:bytes"] += size
+        await delay(config.whisper_latency)
+        if form.get("response_format") == "text":
+            return StreamingResponse(iter([TRANSCRIPT_TEXT]), media_type="text/plain")
+        if form.get("response_format") == "verbose_json":
+            # 每個子句一個段落，各佔3秒
+            clauses = [c for c in TRANSCRIPT_TEXT.replace("，", "，\n").split("\n") if c]
+            segments = [{"id": i, "start": i * 3.0, "end": i * 3.0 + 2.5, "text": c} for i, c in enumerate(clauses)]
+            return {"task": "transcribe", "language": "chinese", "duration": len(clauses) * 3.0,
+                    "text": TRANSCRIPT_TEXT, "segments": segments}
+        return {"text": TRANSCRIPT_TEXT}
+
+    def gemini_body(text: str, usage: Dict[str, int], finish: Optional[str]) -> Dict[str, Any]:
+        candidate: Dict[str, Any] = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        if finish:
+            candidate["finishReason"] = finish
+        return {"candidates": [candidate], "usageMetadata": usage}
+
+    @app.post("/v1beta/models/{model_action}")
+    async def gemini(model_action: str, request: Request):
+        _, _, action = model_action.partition(":")
+        error = injected_error(f"gemini:{action}")
+        if error is not None:
+            return error
+        body = await request.json()
+        instruction = body.get("systemInstruction") or body.get("system_instruction") or {}
+        system = "".join(p.get("text", "") for p in instruction.get("parts", []))
+        rest = "".join(
+            p.get("text", "") for content in body.get("contents", []) for p in content.get("parts", [])
+        )
+        usage = prompt_usage(system, rest)
+        completion_tokens = estimate_tokens(REPORT_TEXT)
+        usage_body = {
+            "promptTokenCount": usage["prompt_tokens"],
+            "cachedContentTokenCount": usage["cached_tokens"],
+            "candidatesTokenCount": completion_tokens,
+            "totalTokenCount": usage["prompt_tokens"] + completion_tokens,
+        }
+        await delay(config.latency)
+
+        if action != "streamGenerateContent":
+            return gemini_body(REPORT_TEXT, usage_body, "STOP")
+
+        async def events() -> AsyncIterator[str]:
+            pieces = _chunks(REPORT_TEXT, config.chunk_chars)
+            async for index in paced(pieces):
+                last = index == len(pieces) - 1
+                data = gemini_body(pieces[index], usage_body, "STOP" if last else None)
+                yield f"data: {json.dumps(data, ensure_ascii=False)}\r\n\r\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return dict(counts)
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=StubConfig.latency)
+    parser.add_argument("--jitter", type=float, default=StubConfig.jitter)
+    parser.add_argument("--tokens-per-second", type=float, default=StubConfig.tokens_per_second)
+    parser.add_argument("--chunk-chars", type=int, default=StubConfig.chunk_chars)
+    parser.add_argument("--whisper-latency", type=float, default=StubConfig.whisper_latency)
+    parser.add_argument("--error-rate", type=float, default=StubConfig.error_rate)
+    parser.add_argument("--error-status", type=int, default=StubConfig.error_status)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = StubConfig(
+        latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+        chunk_chars=args.chunk_chars, whisper_latency=args.whisper_latency,
+        error_rate=args.error_rate, error_status=args.error_status, seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()